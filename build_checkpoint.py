@@ -0,0 +1,183 @@
+"""可恢复的索引构建检查点
+
+构建目录中保存各阶段的输出，manifest.json记录已完成的部分：
+
+    chunk-<序号>.npz  每checkpoint_interval个文档一块：该块的词频统计和密文位置
+    keywords.txt      选出的关键词
+    pruning.json      选择关键词时的剪枝报告
+    runs/             外存构建时已排序的postings run文件
+    keys.bin          命令行构建时生成的密钥，恢复构建和rebuild_index.py时沿用
+
+构建中断后重新运行时跳过已完成的块，文档只读取不再分词和加密；
+文档阶段全部完成后，修改threshold等参数只会重新运行关键词及之后的阶段。
+"""
+
+import json
+import os
+
+import numpy as np
+
+MANIFEST_NAME = "manifest.json"
+KEYWORDS_NAME = "keywords.txt"
+PRUNING_REPORT_NAME = "pruning.json"
+RUNS_NAME = "runs"
+KEYS_NAME = "keys.bin"
+
+
+def key_fingerprint(file_key: bytes, index_key: bytes) -> str:
+    """密钥的带密钥摘要，用于确认恢复构建时使用的是同一对密钥"""
+    from hashlib import blake2b
+
+    return blake2b(b"build checkpoint", key=file_key + index_key).hexdigest()
+
+
+def load_keys(path) -> tuple[bytes, bytes]:
+    """读取密钥文件中保存的(file_key, index_key)"""
+    with open(path, "rb") as f:
+        data = f.read()
+    return data[: len(data) // 2], data[len(data) // 2 :]
+
+
+def load_or_create_keys(path, generate_key) -> tuple[bytes, bytes]:
+    """读取密钥文件中保存的(file_key, index_key)，没有时生成并以0600权限保存"""
+    if os.path.exists(path):
+        return load_keys(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    file_key, index_key = generate_key(), generate_key()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(file_key + index_key)
+    return file_key, index_key
+
+
+class BuildCheckpoint:
+    """构建目录中的检查点
+
+    Args:
+        build_dir (str): 构建目录，不存在时创建
+        params (dict): 决定文档阶段输出的参数（数据集、文档数、压缩方式、密钥摘要等），
+            与已有检查点记录的参数不同时抛出ValueError，避免混用不同构建的输出
+        interval (int): 每块包含的文档数
+    """
+
+    def __init__(self, build_dir, params: dict, interval: int):
+        self.build_dir = build_dir
+        self.interval = interval
+        os.makedirs(build_dir, exist_ok=True)
+        params = dict(params, interval=interval)
+        try:
+            with open(os.path.join(build_dir, MANIFEST_NAME)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {"params": params, "chunks": [], "stages": {}}
+            self._write_manifest()
+        if self.manifest["params"] != params:
+            raise ValueError(
+                f"Checkpoint in {build_dir} was created with different parameters"
+            )
+        self._pending = None
+
+    @property
+    def fresh(self) -> bool:
+        """还没有完成任何块"""
+        return not self.manifest["chunks"]
+
+    def _write_manifest(self):
+        path = os.path.join(self.build_dir, MANIFEST_NAME)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _chunk_path(self, number: int) -> str:
+        return os.path.join(self.build_dir, f"chunk-{number:06d}.npz")
+
+    # 文档阶段
+
+    @property
+    def completed_docs(self) -> int:
+        """已完成的块包含的文档数，这些文档的doc_id为 0..completed_docs-1"""
+        return sum(chunk["count"] for chunk in self.manifest["chunks"])
+
+    @property
+    def documents_done(self) -> bool:
+        return self.manifest["stages"].get("documents", False)
+
+    def add_document(self, doc_id: int, word_counts, location):
+        """记录一个已写入的文档，doc_id须按顺序到达，一块集齐时保存"""
+        number = doc_id // self.interval
+        if self._pending is not None and self._pending[0] != number:
+            self._save_pending()
+        if self._pending is None:
+            self._pending = (number, [])
+        self._pending[1].append((doc_id, word_counts, location))
+
+    def _save_pending(self):
+        from term_counts import TermCounts
+
+        number, docs = self._pending
+        term_counts = TermCounts()
+        for doc_id, word_counts, _ in docs:
+            term_counts.add_document(doc_id, word_counts)
+        locations = np.array([location for *_, location in docs], dtype=np.uint64)
+        # 先写块文件再更新清单，中断时最多重做一块
+        tmp_path = f"{self._chunk_path(number)}.tmp.npz"
+        np.savez(tmp_path, locations=locations, **term_counts.to_arrays())
+        os.replace(tmp_path, self._chunk_path(number))
+        self.manifest["chunks"].append({"first": docs[0][0], "count": len(docs)})
+        self._write_manifest()
+        self._pending = None
+
+    def finish_documents(self):
+        """保存最后一块并标记文档阶段完成"""
+        if self._pending is not None:
+            self._save_pending()
+        self.manifest["stages"]["documents"] = True
+        self._write_manifest()
+
+    def iter_chunks(self):
+        """按顺序产出已完成块的(TermCounts, doc_id数组, (段号, 偏移, 长度)数组)"""
+        from term_counts import TermCounts
+
+        for number in range(len(self.manifest["chunks"])):
+            with np.load(self._chunk_path(number)) as arrays:
+                term_counts = TermCounts.from_arrays(arrays)
+                yield term_counts, term_counts.doc_ids, arrays["locations"]
+
+    # 关键词和postings阶段
+
+    def stage_info(self, name: str):
+        """已完成阶段记录的参数，未完成时返回None"""
+        return self.manifest["stages"].get(name)
+
+    def mark_stage(self, name: str, **info):
+        self.manifest["stages"][name] = info
+        self._write_manifest()
+
+    def invalidate(self, *names: str):
+        for name in names:
+            self.manifest["stages"].pop(name, None)
+        self._write_manifest()
+
+    def save_keywords(self, keywords, pruning_report=None, **settings):
+        """保存关键词、剪枝报告以及选择关键词时的参数"""
+        with open(os.path.join(self.build_dir, KEYWORDS_NAME), "w") as f:
+            f.write(" ".join(sorted(keywords)))
+        with open(os.path.join(self.build_dir, PRUNING_REPORT_NAME), "w") as f:
+            json.dump(pruning_report, f)
+        self.mark_stage("keywords", **settings)
+
+    def load_keywords(self) -> set[str]:
+        with open(os.path.join(self.build_dir, KEYWORDS_NAME)) as f:
+            return set(f.read().split())
+
+    def load_pruning_report(self) -> dict | None:
+        """保存关键词时的剪枝报告，没有保存时返回None"""
+        try:
+            with open(os.path.join(self.build_dir, PRUNING_REPORT_NAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @property
+    def run_dir(self) -> str:
+        return os.path.join(self.build_dir, RUNS_NAME)
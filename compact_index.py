@@ -0,0 +1,63 @@
+"""由数据拥有者合并index.bin的追加段，合并后仍按词频排序
+
+服务器没有密钥，不知道明文词频：index_format.py compact合并多个按词频排序的段时
+会拒绝执行（或在--allow_unranked时丢弃FLAG_RANKED）。数据拥有者用构建时保存的
+密钥文件解密词频，按词频归并各段：
+
+    python compact_index.py --key_file keys.bin --index_path index.bin
+"""
+
+import argparse
+
+from my import EncryptedIndexBuilder
+
+
+def compact_index(file_key, index_key, index_path="index.bin", min_segments=2):
+    """按词频合并索引的全部段并移除已删除文档的postings
+
+    Returns:
+        bool: 是否进行了合并
+    """
+    index_builder = EncryptedIndexBuilder(
+        file_key=file_key,
+        index_key=index_key,
+        dataset_path=None,
+    )
+    return index_builder.compact_index(index_path, min_segments)
+
+
+if __name__ == "__main__":
+    import time
+    from build_checkpoint import load_keys
+
+    parser = argparse.ArgumentParser(
+        description="Merge appended index segments, keeping the index ranked by tf"
+    )
+    parser.add_argument(
+        "--key_file",
+        type=str,
+        required=True,
+        help="Key file written by the original build (--key_file/--checkpoint_dir)",
+    )
+    parser.add_argument("--index_path", type=str, default="index.bin")
+    parser.add_argument(
+        "--min_segments",
+        type=int,
+        default=4,
+        help="Only compact once at least this many segments have accumulated",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0,
+        help="Keep running and check every this many seconds",
+    )
+    args = parser.parse_args()
+
+    file_key, index_key = load_keys(args.key_file)
+    while True:
+        if compact_index(file_key, index_key, args.index_path, args.min_segments):
+            print(f"Compacted {args.index_path}")
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,94 @@
+"""用Count-Min Sketch近似统计单词总出现次数
+
+词表很大（拼写错误、URL、数字等）时，精确统计每个单词的出现次数需要为每个单词保存一项。
+Count-Min Sketch只使用固定大小的 depth × width 计数表：每个单词在每行中哈希到一个计数器，
+估计值取各行计数器的最小值。估计值只会偏大不会偏小，因此估计值不超过threshold的单词
+一定不是关键词；其余候选词再精确统计一次即可得到准确的关键词集合。
+
+误差：估计值超出真实值的部分以 1 - e^-depth 的概率不超过 e / width × 总词数。
+"""
+
+import numpy as np
+
+DEFAULT_WIDTH = 1 << 20
+DEFAULT_DEPTH = 4
+
+
+def _hash_pairs(words) -> tuple[np.ndarray, np.ndarray]:
+    """每个单词的两个64位哈希值，各行的位置由 h1 + i × h2 导出
+
+    Python内置的hash在每个进程中随机化，工作进程之间无法合并，因此使用BLAKE2b。
+    """
+    from hashlib import blake2b
+
+    digests = b"".join(blake2b(word.encode(), digest_size=16).digest() for word in words)
+    pairs = np.frombuffer(digests, dtype="<u8").reshape(-1, 2)
+    # h2为奇数，保证各行的位置不同
+    return pairs[:, 0], pairs[:, 1] | np.uint64(1)
+
+
+def _positions(words, width: int, depth: int) -> np.ndarray:
+    """单词在各行中的列号，形状为(depth, 单词数)"""
+    if not words:
+        return np.zeros((depth, 0), dtype=np.uint32)
+    h1, h2 = _hash_pairs(words)
+    rows = np.arange(depth, dtype=np.uint64)[:, None]
+    # 无符号整数溢出即按2^64取模
+    with np.errstate(over="ignore"):
+        return ((h1 + rows * h2) % np.uint64(width)).astype(np.uint32)
+
+
+def sketch_updates(word_counts, width: int, depth: int):
+    """一组 {word: count} 对计数表的增量
+
+    在工作进程中完成分词和哈希，只把增量交给父进程的CountMinSketch.apply合并，
+    不必在进程间传递整张计数表。
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: 形状为(depth, 单词数)的列号，以及每个单词的次数
+    """
+    positions = _positions(list(word_counts), width, depth)
+    counts = np.fromiter(word_counts.values(), dtype=np.uint64, count=len(word_counts))
+    return positions, counts
+
+
+class CountMinSketch:
+    """Count-Min Sketch，可以合并多个进程分别计算的增量
+
+    Args:
+        width (int): 每行的计数器数
+        depth (int): 行数，即哈希函数的个数
+    """
+
+    def __init__(self, width: int = DEFAULT_WIDTH, depth: int = DEFAULT_DEPTH):
+        if not 0 < width <= 1 << 32:
+            raise ValueError("Sketch width must be in (0, 2^32]")
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint64)
+
+    def apply(self, positions, counts):
+        """合并sketch_updates计算的增量"""
+        for row in range(self.depth):
+            np.add.at(self.table[row], positions[row], counts)
+
+    def add(self, word_counts):
+        """累加一组 {word: count}"""
+        self.apply(*sketch_updates(word_counts, self.width, self.depth))
+
+    def merge(self, other: "CountMinSketch"):
+        """合并另一个相同尺寸的Sketch"""
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge sketches of different sizes")
+        self.table += other.table
+
+    def estimate(self, words) -> np.ndarray:
+        """单词总出现次数的估计值（不小于真实值）"""
+        positions = _positions(list(words), self.width, self.depth)
+        return self.table[np.arange(self.depth)[:, None], positions].min(axis=0)
+
+    def candidates(self, words, threshold) -> list[str]:
+        """估计值大于threshold的单词，真实总次数大于threshold的单词一定在其中"""
+        words = list(words)
+        mask = self.estimate(words) > threshold
+        return [word for word, keep in zip(words, mask.tolist()) if keep]
@@ -0,0 +1,359 @@
+"""加密文档的分段存储
+
+密文不再每个文档一个文件，而是追加写入少量段文件（segment-<段号>.dat），
+并在docs.idx中按doc_id记录每个文档所在的段、偏移和长度：
+
+    文件头 MAGIC(8) || 版本(4) || 保留(4) || 文档数(8)
+    表项   段号(4) || 保留(4) || 偏移(8) || 长度(8)，第i项对应doc_id为i的文档
+
+每个写入进程只追加自己的段文件，多个工作进程并发写入时互不干扰；
+读取时通过docs.idx定位后用os.pread读取，不需要逐个打开文件。
+增量添加的文档从表的末尾继续编号；删除文档只把表项标记为不存在。
+旧的每文档一个文件的目录可以用本模块的migrate命令转换。
+"""
+
+import os
+import struct
+from array import array
+
+import numpy as np
+
+MAGIC = b"SSEDOCS\x00"
+VERSION = 1
+TABLE_NAME = "docs.idx"
+# 加密后的zlib预设字典，见doc_codec
+ZDICT_NAME = "zdict.bin"
+# 表项中的段号为该值时表示文档不存在
+ABSENT = 0xFFFFFFFF
+
+_HEADER = struct.Struct("<8sI4xQ")
+_ENTRY = struct.Struct("<I4xQQ")
+TABLE_DTYPE = np.dtype(
+    {
+        "names": ["segment", "offset", "length"],
+        "formats": ["<u4", "<u8", "<u8"],
+        "offsets": [0, 8, 16],
+        "itemsize": _ENTRY.size,
+    }
+)
+
+
+def segment_path(file_dir, segment: int) -> str:
+    return os.path.join(file_dir, f"segment-{segment}.dat")
+
+
+class SegmentWriter:
+    """只追加的段文件写入器"""
+
+    def __init__(self, file_dir, segment: int):
+        self.segment = segment
+        self._fd = os.open(
+            segment_path(file_dir, segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        )
+        self._size = os.fstat(self._fd).st_size
+
+    @property
+    def stale(self) -> bool:
+        """段文件已被删除（例如重新构建时清空了目录）"""
+        return os.fstat(self._fd).st_nlink == 0
+
+    def append_many(self, docs) -> list[tuple[int, int, int]]:
+        """把一批密文一次写入段文件末尾
+
+        Returns:
+            list[tuple[int, int, int]]: 每个文档的(段号, 偏移, 长度)
+        """
+        locations = []
+        offset = self._size
+        for doc in docs:
+            locations.append((self.segment, offset, len(doc)))
+            offset += len(doc)
+        data = memoryview(b"".join(docs))
+        while data:
+            written = os.write(self._fd, data)
+            data = data[written:]
+        self._size = offset
+        return locations
+
+    def close(self):
+        os.close(self._fd)
+
+
+# 当前进程在各目录下使用的段写入器
+_writers: dict[str, SegmentWriter] = {}
+
+
+def append_documents(file_dir, docs) -> list[tuple[int, int, int]]:
+    """把一批密文追加到当前进程自己的段文件中
+
+    段号取进程号，同时运行的工作进程各写各的段文件。
+
+    Args:
+        file_dir (str): 文档存储目录
+        docs (list[bytes]): 密文列表
+
+    Returns:
+        list[tuple[int, int, int]]: 每个文档的(段号, 偏移, 长度)
+    """
+    writer = _writers.get(file_dir)
+    if writer is None or writer.stale:
+        if writer is not None:
+            writer.close()
+        writer = _writers[file_dir] = SegmentWriter(file_dir, os.getpid())
+    return writer.append_many(docs)
+
+
+def read_table(file_dir) -> np.ndarray:
+    """把docs.idx的全部表项读入内存"""
+    path = os.path.join(file_dir, TABLE_NAME)
+    with open(path, "rb") as f:
+        magic, version, count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Unsupported document table: {path}")
+        return np.frombuffer(f.read(count * TABLE_DTYPE.itemsize), TABLE_DTYPE)
+
+
+def _write_table(file_dir, table):
+    path = os.path.join(file_dir, TABLE_NAME)
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(table)))
+        f.write(table.tobytes())
+    os.replace(f"{path}.tmp", path)
+
+
+def next_doc_id(file_dir) -> int:
+    """增量添加文档时使用的第一个doc_id
+
+    已删除文档的doc_id不再复用，否则新文档会被旧的删除记录屏蔽。
+    """
+    if not os.path.exists(os.path.join(file_dir, TABLE_NAME)):
+        raise ValueError(f"{file_dir} is not a segmented document store")
+    return len(read_table(file_dir))
+
+
+def delete_documents(file_dir, doc_ids):
+    """在docs.idx中把文档标记为不存在，段文件中的密文不会立即回收"""
+    table = read_table(file_dir).copy()
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    table["segment"][doc_ids[doc_ids < len(table)]] = ABSENT
+    _write_table(file_dir, table)
+
+
+class DocTableWriter:
+    """在父进程中收集文档位置，最后写出docs.idx
+
+    Args:
+        base (np.ndarray | None): 已有的表项，增量添加文档时传入read_table的结果
+    """
+
+    def __init__(self, base=None):
+        self._base = np.zeros(0, dtype=TABLE_DTYPE) if base is None else base
+        self._doc_ids = array("q")
+        self._segments = array("I")
+        self._offsets = array("Q")
+        self._lengths = array("Q")
+
+    def add(self, doc_id: int, location: tuple[int, int, int]):
+        segment, offset, length = location
+        self._doc_ids.append(doc_id)
+        self._segments.append(segment)
+        self._offsets.append(offset)
+        self._lengths.append(length)
+
+    def write(self, file_dir):
+        doc_ids = np.asarray(self._doc_ids, dtype=np.int64)
+        count = int(doc_ids.max()) + 1 if len(doc_ids) else 0
+        table = np.zeros(max(count, len(self._base)), dtype=TABLE_DTYPE)
+        table["segment"] = ABSENT
+        table[: len(self._base)] = self._base
+        table["segment"][doc_ids] = self._segments
+        table["offset"][doc_ids] = self._offsets
+        table["length"][doc_ids] = self._lengths
+        _write_table(file_dir, table)
+
+
+class DocStore:
+    """通过docs.idx读取分段存储的密文"""
+
+    def __init__(self, file_dir):
+        self.file_dir = file_dir
+        self._fds: dict[int, int] = {}
+        path = os.path.join(file_dir, TABLE_NAME)
+        with open(path, "rb") as f:
+            magic, version, count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Unsupported document table: {path}")
+        # 表格以只读方式映射，打开时不读取全部表项
+        self._table = (
+            np.memmap(path, TABLE_DTYPE, mode="r", offset=_HEADER.size, shape=(count,))
+            if count
+            else np.zeros(0, dtype=TABLE_DTYPE)
+        )
+
+    def locate(self, doc_id: int):
+        """返回文档的(段号, 偏移, 长度)，不存在时返回None"""
+        if not 0 <= doc_id < len(self._table):
+            return None
+        segment, offset, length = self._table[doc_id].tolist()
+        if segment == ABSENT:
+            return None
+        return segment, offset, length
+
+    def _segment_fd(self, segment: int) -> int:
+        fd = self._fds.get(segment)
+        if fd is None:
+            fd = self._fds[segment] = os.open(
+                segment_path(self.file_dir, segment), os.O_RDONLY
+            )
+        return fd
+
+    def _pread(self, fd, length, offset) -> bytes:
+        data = os.pread(fd, length, offset)
+        if len(data) != length:
+            raise ValueError("Segment file is truncated")
+        return data
+
+    def get(self, doc_id: int) -> bytes | None:
+        """读取文档密文，不存在时返回None"""
+        location = self.locate(doc_id)
+        if location is None:
+            return None
+        segment, offset, length = location
+        return self._pread(self._segment_fd(segment), length, offset)
+
+    def iter_document(self, doc_id: int, block_size: int = 1 << 16):
+        """分块读取文档密文，不存在时返回None"""
+        location = self.locate(doc_id)
+        if location is None:
+            return None
+        segment, offset, length = location
+        fd = self._segment_fd(segment)
+
+        def blocks():
+            end = offset + length
+            for start in range(offset, end, block_size):
+                yield self._pread(fd, min(block_size, end - start), start)
+
+        return blocks()
+
+    def __len__(self):
+        return int((self._table["segment"] != ABSENT).sum())
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def __del__(self):
+        # 重新加载后旧的DocStore可能仍被正在进行的流式读取引用，由垃圾回收关闭
+        self.close()
+
+
+class DocDirectory:
+    """旧的每个文档一个文件的目录，接口与DocStore相同"""
+
+    def __init__(self, file_dir):
+        self.file_dir = file_dir
+
+    def get(self, doc_id: int) -> bytes | None:
+        try:
+            with open(os.path.join(self.file_dir, str(doc_id)), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def iter_document(self, doc_id: int, block_size: int = 1 << 16):
+        try:
+            f = open(os.path.join(self.file_dir, str(doc_id)), "rb")
+        except FileNotFoundError:
+            return None
+
+        def blocks():
+            with f:
+                while block := f.read(block_size):
+                    yield block
+
+        return blocks()
+
+    def __len__(self):
+        try:
+            return sum(1 for name in os.listdir(self.file_dir) if name.isdigit())
+        except FileNotFoundError:
+            return 0
+
+    def close(self):
+        pass
+
+
+def save_zdict(file_dir, encrypted_zdict: bytes):
+    """保存加密后的zlib预设字典"""
+    with open(os.path.join(file_dir, ZDICT_NAME), "wb") as f:
+        f.write(encrypted_zdict)
+
+
+def load_zdict(file_dir) -> bytes | None:
+    """读取加密后的zlib预设字典，没有时返回None"""
+    try:
+        with open(os.path.join(file_dir, ZDICT_NAME), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def open_doc_store(file_dir):
+    """打开文档存储目录，存在docs.idx时按分段存储读取，否则按旧格式逐文件读取"""
+    if os.path.exists(os.path.join(file_dir, TABLE_NAME)):
+        return DocStore(file_dir)
+    return DocDirectory(file_dir)
+
+
+def migrate(src_dir, dst_dir, batch_size: int = 1024):
+    """把每个文档一个文件的旧目录转换为分段存储
+
+    Args:
+        src_dir (str): 旧目录，文件名为doc_id
+        dst_dir (str): 新目录，不存在时创建；可以与src_dir相同，转换完成后删除旧文件
+
+    Returns:
+        int: 转换的文档数
+    """
+    from itertools import islice
+
+    os.makedirs(dst_dir, exist_ok=True)
+    doc_ids = sorted(int(name) for name in os.listdir(src_dir) if name.isdigit())
+    writer = SegmentWriter(dst_dir, 0)
+    table = DocTableWriter()
+    ids = iter(doc_ids)
+    while batch := list(islice(ids, batch_size)):
+        docs = []
+        for doc_id in batch:
+            with open(os.path.join(src_dir, str(doc_id)), "rb") as f:
+                docs.append(f.read())
+        for doc_id, location in zip(batch, writer.append_many(docs)):
+            table.add(doc_id, location)
+    writer.close()
+    table.write(dst_dir)
+
+    if os.path.samefile(src_dir, dst_dir):
+        for doc_id in doc_ids:
+            os.remove(os.path.join(src_dir, str(doc_id)))
+    return len(doc_ids)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Encrypted document store tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="Convert a one-file-per-document directory to segments"
+    )
+    migrate_parser.add_argument("src_dir", help="e.g. encrypted_docs_finance")
+    migrate_parser.add_argument(
+        "dst_dir", nargs="?", help="Target directory (default: convert in place)"
+    )
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        count = migrate(args.src_dir, args.dst_dir or args.src_dir)
+        print(f"Migrated {count} document(s)")
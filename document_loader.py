@@ -0,0 +1,138 @@
+"""数据集流式加载
+
+支持JSON数组和JSONL（每行一个JSON对象）两种格式，输入文件可以是gzip/xz压缩的。
+格式只在打开文件时检测一次，之后逐个产出文档，内存占用与数据集大小无关。
+"""
+
+import json
+
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+# 每次从文件读取的字符数
+READ_CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = " \t\r\n"
+
+
+def open_dataset(path):
+    """以文本模式打开数据集，根据文件头自动识别gzip/xz压缩
+
+    Args:
+        path (str): 数据集文件路径
+
+    Returns:
+        TextIO: 已打开的文本流，由调用方负责关闭
+    """
+    import gzip
+    import lzma
+
+    with open(path, "rb") as f:
+        magic = f.read(len(XZ_MAGIC))
+
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if magic.startswith(XZ_MAGIC):
+        return lzma.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_documents(path, count: int | None = None):
+    """逐个产出数据集中的文档
+
+    Args:
+        path (str): 数据集文件路径
+        count (int | None): 最多产出的文档数，为空时产出全部文档。
+            达到数量后立即停止，不再解析文件剩余部分
+
+    Yields:
+        dict: 解析后的文档对象
+    """
+    from itertools import islice
+
+    with open_dataset(path) as f:
+        head = f.read(READ_CHUNK_SIZE)
+        stripped = head.lstrip(_WHITESPACE)
+        if stripped.startswith("["):
+            documents = _iter_json_array(f, stripped[1:])
+        else:
+            documents = _iter_json_lines(f, head)
+
+        if count:
+            documents = islice(documents, count)
+        yield from documents
+
+
+def _iter_json_lines(f, head: str):
+    """逐行解析JSONL，解析失败的行打印错误后跳过"""
+    import io
+    from itertools import chain
+
+    # 保证已读取的部分以完整的行结尾
+    if head and not head.endswith("\n"):
+        head += f.readline()
+
+    for line_num, line in enumerate(chain(io.StringIO(head), f), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing line {line_num}: {e}")
+
+
+def _iter_json_array(f, buf: str):
+    """增量解析顶层JSON数组，buf为'['之后已读取的内容
+
+    缓冲区中只保留尚未解析的部分，单个元素不完整时继续从文件读取。
+    """
+    decoder = json.JSONDecoder()
+    pos = 0
+    eof = False
+    expect_value = True  # 刚读过'['或','
+    first = True
+
+    def refill(buf, pos):
+        # 丢弃已解析的部分并读取更多内容，读取量随缓冲区增长以避免反复重解析
+        chunk = f.read(max(READ_CHUNK_SIZE, len(buf) - pos))
+        return buf[pos:] + chunk, 0, not chunk
+
+    while True:
+        # 跳过空白字符
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            buf, pos, eof = refill(buf, pos)
+        if pos >= len(buf):
+            raise json.JSONDecodeError("Unterminated JSON array", buf, pos)
+
+        if buf[pos] == "]" and (first or not expect_value):
+            return
+        if not expect_value:
+            if buf[pos] != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+            pos += 1
+            expect_value = True
+            continue
+
+        # 解析一个元素，内容不完整时补充缓冲区后重试
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                buf, pos, eof = refill(buf, pos)
+                continue
+            # 数字等标量可能恰好在缓冲区末尾被截断
+            if end >= len(buf) and not eof:
+                buf, pos, eof = refill(buf, pos)
+                continue
+            break
+
+        yield value
+        pos = end
+        expect_value = False
+        first = False
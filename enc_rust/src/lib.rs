@@ -1,8 +1,29 @@
+use pyo3::buffer::PyBuffer;
 use pyo3::prelude::*;
+use pyo3::pybacked::{PyBackedBytes, PyBackedStr};
+use pyo3::types::{PyBytes, PyDict};
 use mimalloc::MiMalloc;
 
 #[global_allocator]
 static GLOBAL: MiMalloc = MiMalloc;
+
+// 定义AES-128 ECB加密器、解密器类型别名
+type Aes128EcbEnc = ecb::Encryptor<aes::Aes128>;
+type Aes128EcbDec = ecb::Decryptor<aes::Aes128>;
+
+/// GCM密文相对明文增加的字节数：12字节nonce + 16字节tag
+const GCM_OVERHEAD: usize = 12 + 16;
+
+/// 分段AEAD（STREAM构造）密文的文件头：魔数(4) || 版本(1) || 明文分段长度(4, 大端) || nonce前缀(7)
+const STREAM_MAGIC: &[u8; 4] = b"SSEs";
+const STREAM_VERSION: u8 = 1;
+const STREAM_HEADER_LEN: usize = 16;
+const STREAM_TAG_LEN: usize = 16;
+/// 默认每段明文64KiB
+const STREAM_DEFAULT_CHUNK_SIZE: usize = 1 << 16;
+/// 解密时需要缓存一整段密文，限制分段长度以约束内存
+const STREAM_MAX_CHUNK_SIZE: usize = 1 << 24;
+
 /// 使用AES-128 ECB模式加密明文字符串
 ///
 /// 参数：
@@ -16,9 +37,6 @@ fn aes_ecb_encrypt(key: [u8; 16], plaintext: &str) -> PyResult<Vec<u8>> {
     // 使用AES加密库的ECB模式加密实现
     use aes::cipher::{block_padding::Pkcs7, BlockEncryptMut, KeyInit};
 
-    // 定义AES-128 ECB加密器类型别名
-    type Aes128EcbEnc = ecb::Encryptor<aes::Aes128>;
-
     // 创建加密器实例并执行加密操作：
     // 1. 使用PKCS#7填充方案
     // 2. 生成加密后的字节向量
@@ -39,8 +57,6 @@ fn aes_ecb_encrypt(key: [u8; 16], plaintext: &str) -> PyResult<Vec<u8>> {
 fn aes_ecb_decrypt(key: [u8; 16], ciphertext: &[u8]) -> PyResult<String> {
     // 使用AES加密库的ECB模式解密实现
     use aes::cipher::{block_padding::Pkcs7, BlockDecryptMut, KeyInit};
-    // 定义AES-128 ECB解密器类型别名
-    type Aes128EcbDec = ecb::Decryptor<aes::Aes128>;
 
     // 创建解密器实例并执行解密操作
     let decrypt_vec = Aes128EcbDec::new(&key.into())
@@ -49,54 +65,1114 @@ fn aes_ecb_decrypt(key: [u8; 16], ciphertext: &[u8]) -> PyResult<String> {
     Ok(String::from_utf8(decrypt_vec)?)
 }
 
+/// 按偏移数组把缓冲区切分为互不重叠的可变切片
+fn split_by_offsets<'a>(mut buf: &'a mut [u8], offsets: &[usize]) -> Vec<&'a mut [u8]> {
+    let mut parts = Vec::with_capacity(offsets.len().saturating_sub(1));
+    for w in offsets.windows(2) {
+        let (head, tail) = std::mem::take(&mut buf).split_at_mut(w[1] - w[0]);
+        parts.push(head);
+        buf = tail;
+    }
+    parts
+}
+
+/// 按偏移数组把一段连续缓冲区切分为多段输入
+///
+/// 偏移数组需从0开始单调不减，且最后一个偏移不超过缓冲区长度
+fn slices_by_offsets<'a>(data: &'a [u8], offsets: &[usize]) -> PyResult<Vec<&'a [u8]>> {
+    if offsets.first().is_some_and(|&first| first != 0)
+        || offsets.windows(2).any(|w| w[0] > w[1])
+        || offsets.last().is_some_and(|&last| last > data.len())
+    {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+            "Invalid offsets",
+        ));
+    }
+    Ok(offsets.windows(2).map(|w| &data[w[0]..w[1]]).collect())
+}
+
+/// 计算每段明文经PKCS#7填充后的密文起始偏移，长度为输入数+1
+fn ecb_padded_offsets<T: AsRef<[u8]>>(inputs: &[T]) -> Vec<usize> {
+    let mut offsets = Vec::with_capacity(inputs.len() + 1);
+    let mut total = 0;
+    offsets.push(total);
+    for input in inputs {
+        total += (input.as_ref().len() / 16 + 1) * 16;
+        offsets.push(total);
+    }
+    offsets
+}
+
+/// 使用AES-128 ECB模式逐段加密，密文依次写入out中由offsets划分的区间
+///
+/// 参数：
+/// - `encryptor`: 已完成密钥扩展的加密器
+/// - `inputs`: 待加密的多段明文
+/// - `offsets`: 由`ecb_padded_offsets`计算的密文偏移
+/// - `out`: 长度为offsets最后一项的输出缓冲区
+/// - `parallel`: 是否使用多个线程并行加密
+fn ecb_encrypt_into<T: AsRef<[u8]> + Sync>(
+    encryptor: &Aes128EcbEnc,
+    inputs: &[T],
+    offsets: &[usize],
+    out: &mut [u8],
+    parallel: bool,
+) {
+    use aes::cipher::{block_padding::Pkcs7, BlockEncryptMut};
+    use rayon::prelude::*;
+
+    let encrypt_one = |(input, part): (&T, &mut [u8])| {
+        let input = input.as_ref();
+        part[..input.len()].copy_from_slice(input);
+        encryptor
+            .clone()
+            .encrypt_padded_mut::<Pkcs7>(part, input.len())
+            .expect("output buffer is sized for PKCS#7 padding");
+    };
+    let parts = split_by_offsets(out, offsets);
+    if parallel {
+        inputs.par_iter().zip(parts).for_each(encrypt_one);
+    } else {
+        inputs.iter().zip(parts).for_each(encrypt_one);
+    }
+}
+
+/// 使用AES-128 ECB模式逐段解密，明文依次拼接为一段连续缓冲区
+///
+/// 返回值：
+/// - 成功时返回(拼接后的明文, 每段明文的起始偏移)，任一段密文无效时返回None
+fn ecb_decrypt_packed<T: AsRef<[u8]> + Sync>(
+    decryptor: &Aes128EcbDec,
+    inputs: &[T],
+    parallel: bool,
+) -> Option<(Vec<u8>, Vec<usize>)> {
+    use aes::cipher::{block_padding::Pkcs7, BlockDecryptMut};
+    use rayon::prelude::*;
+
+    let mut in_offsets = Vec::with_capacity(inputs.len() + 1);
+    let mut total = 0;
+    in_offsets.push(total);
+    for input in inputs {
+        total += input.as_ref().len();
+        in_offsets.push(total);
+    }
+
+    // 先在各自的区间内原地解密，再把明文向前压紧
+    let mut buf = vec![0u8; total];
+    let decrypt_one = |(input, part): (&T, &mut [u8])| -> Option<usize> {
+        part.copy_from_slice(input.as_ref());
+        decryptor
+            .clone()
+            .decrypt_padded_mut::<Pkcs7>(part)
+            .ok()
+            .map(|plaintext| plaintext.len())
+    };
+    let parts = split_by_offsets(&mut buf, &in_offsets);
+    let lengths: Option<Vec<usize>> = if parallel {
+        inputs.par_iter().zip(parts).map(decrypt_one).collect()
+    } else {
+        inputs.iter().zip(parts).map(decrypt_one).collect()
+    };
+
+    let mut offsets = Vec::with_capacity(inputs.len() + 1);
+    let mut written = 0;
+    offsets.push(written);
+    for (start, len) in in_offsets.iter().zip(lengths?) {
+        buf.copy_within(*start..*start + len, written);
+        written += len;
+        offsets.push(written);
+    }
+    buf.truncate(written);
+    Some((buf, offsets))
+}
+
+/// 加密多段明文并直接写入新建的Python bytes对象，加密期间释放GIL
+fn ecb_encrypt_to_pybytes<'py, T: AsRef<[u8]> + Sync>(
+    py: Python<'py>,
+    encryptor: &Aes128EcbEnc,
+    inputs: &[T],
+    parallel: bool,
+) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+    let offsets = ecb_padded_offsets(inputs);
+    let ciphertexts = PyBytes::new_with(py, offsets[inputs.len()], |out| {
+        py.allow_threads(|| ecb_encrypt_into(encryptor, inputs, &offsets, out, parallel));
+        Ok(())
+    })?;
+    Ok((ciphertexts, offsets))
+}
+
+/// 解密多段密文并返回拼接后的明文，解密期间释放GIL
+fn ecb_decrypt_to_pybytes<'py, T: AsRef<[u8]> + Sync>(
+    py: Python<'py>,
+    decryptor: &Aes128EcbDec,
+    inputs: &[T],
+    parallel: bool,
+) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+    let (plaintexts, offsets) = py
+        .allow_threads(|| ecb_decrypt_packed(decryptor, inputs, parallel))
+        .ok_or_else(|| PyErr::new::<pyo3::exceptions::PyValueError, _>("Invalid ciphertext"))?;
+    Ok((PyBytes::new(py, &plaintexts), offsets))
+}
+
+/// 使用AES-128 ECB模式批量加密多个明文字符串
+///
+/// 参数：
+/// - `key`: 16字节的AES加密密钥
+/// - `plaintexts`: 待加密的明文字符串序列
+/// - `parallel`: 是否使用多个线程并行加密
+///
+/// 返回值：
+/// - (拼接后的密文bytes, 偏移列表)，第i个密文为`buf[offsets[i]:offsets[i+1]]`
 #[pyfunction]
-fn aes_gcm_encrypt(key: [u8; 16], plaintext: &str) -> PyResult<Vec<u8>> {
+#[pyo3(signature = (key, plaintexts, parallel=false))]
+fn aes_ecb_encrypt_many<'py>(
+    py: Python<'py>,
+    key: [u8; 16],
+    plaintexts: Vec<PyBackedStr>,
+    parallel: bool,
+) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+    use aes::cipher::KeyInit;
+
+    ecb_encrypt_to_pybytes(py, &Aes128EcbEnc::new(&key.into()), &plaintexts, parallel)
+}
+
+/// 使用AES-128 ECB模式批量加密打包在一段缓冲区中的多个明文
+///
+/// 参数：
+/// - `key`: 16字节的AES加密密钥
+/// - `data`: 拼接后的明文
+/// - `offsets`: 第i个明文为`data[offsets[i]:offsets[i+1]]`
+/// - `parallel`: 是否使用多个线程并行加密
+///
+/// 返回值：
+/// - (拼接后的密文bytes, 密文偏移列表)
+#[pyfunction]
+#[pyo3(signature = (key, data, offsets, parallel=false))]
+fn aes_ecb_encrypt_packed<'py>(
+    py: Python<'py>,
+    key: [u8; 16],
+    data: &[u8],
+    offsets: Vec<usize>,
+    parallel: bool,
+) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+    use aes::cipher::KeyInit;
+
+    let inputs = slices_by_offsets(data, &offsets)?;
+    ecb_encrypt_to_pybytes(py, &Aes128EcbEnc::new(&key.into()), &inputs, parallel)
+}
+
+/// 使用AES-128 ECB模式批量解密多个密文
+///
+/// 参数：
+/// - `key`: 16字节的AES加密密钥
+/// - `ciphertexts`: 待解密的密文序列
+/// - `parallel`: 是否使用多个线程并行解密
+///
+/// 返回值：
+/// - (拼接后的明文bytes, 偏移列表)，任一密文无效时抛出ValueError
+#[pyfunction]
+#[pyo3(signature = (key, ciphertexts, parallel=false))]
+fn aes_ecb_decrypt_many<'py>(
+    py: Python<'py>,
+    key: [u8; 16],
+    ciphertexts: Vec<PyBackedBytes>,
+    parallel: bool,
+) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+    use aes::cipher::KeyInit;
+
+    ecb_decrypt_to_pybytes(py, &Aes128EcbDec::new(&key.into()), &ciphertexts, parallel)
+}
+
+/// 使用AES-128 ECB模式批量解密打包在一段缓冲区中的多个密文
+///
+/// 参数：
+/// - `key`: 16字节的AES加密密钥
+/// - `data`: 拼接后的密文，可以是bytes、memoryview、mmap等任意缓冲区对象，不复制数据
+/// - `offsets`: 第i个密文为`data[offsets[i]:offsets[i+1]]`
+/// - `parallel`: 是否使用多个线程并行解密
+///
+/// 返回值：
+/// - (拼接后的明文bytes, 明文偏移列表)
+#[pyfunction]
+#[pyo3(signature = (key, data, offsets, parallel=false))]
+fn aes_ecb_decrypt_packed<'py>(
+    py: Python<'py>,
+    key: [u8; 16],
+    data: PyBuffer<u8>,
+    offsets: Vec<usize>,
+    parallel: bool,
+) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+    use aes::cipher::KeyInit;
+
+    let inputs = slices_by_offsets(buffer_as_slice(&data)?, &offsets)?;
+    ecb_decrypt_to_pybytes(py, &Aes128EcbDec::new(&key.into()), &inputs, parallel)
+}
+
+/// 使用AES-128 GCM模式加密，返回 nonce(12字节) || 密文 || tag(16字节)
+fn gcm_encrypt(cipher: &aes_gcm::Aes128Gcm, plaintext: &[u8]) -> PyResult<Vec<u8>> {
     use aes_gcm::{
-        aead::{Aead, AeadCore, KeyInit, OsRng},
-        Aes128Gcm, Key,
+        aead::{Aead, AeadCore, OsRng},
+        Aes128Gcm,
     };
 
-    // Alternatively, the key can be transformed directly from a byte slice
-    // (panicks on length mismatch):
-    let key = Key::<Aes128Gcm>::from_slice(&key);
-
-    let cipher = Aes128Gcm::new(&key);
     let nonce = Aes128Gcm::generate_nonce(&mut OsRng); // 96-bits; unique per message
     let ciphertext = cipher
-        .encrypt(&nonce, plaintext.as_bytes())
+        .encrypt(&nonce, plaintext)
         .map_err(|e| PyErr::new::<pyo3::exceptions::PyValueError, _>(format!("{}", e)))?;
     let mut result = nonce.to_vec();
     result.extend_from_slice(&ciphertext);
     Ok(result)
 }
 
+/// 解密由`gcm_encrypt`生成的 nonce || 密文 || tag
+fn gcm_decrypt(cipher: &aes_gcm::Aes128Gcm, ciphertext: &[u8]) -> PyResult<Vec<u8>> {
+    use aes_gcm::aead::Aead;
+
+    if ciphertext.len() < 12 {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+            "Ciphertext too short",
+        ));
+    }
+    let (nonce, ciphertext) = ciphertext.split_at(12);
+    cipher
+        .decrypt(nonce.into(), ciphertext)
+        .map_err(|e| PyErr::new::<pyo3::exceptions::PyValueError, _>(format!("{}", e)))
+}
+
+/// 使用AES-128 GCM模式把明文加密到out中，返回写入的字节数
+///
+/// 输出格式与`gcm_encrypt`相同，out至少需要`plaintext.len() + GCM_OVERHEAD`字节
+fn gcm_encrypt_into(
+    cipher: &aes_gcm::Aes128Gcm,
+    nonce: &aes_gcm::Nonce<aes_gcm::aead::consts::U12>,
+    plaintext: &[u8],
+    out: &mut [u8],
+) -> PyResult<usize> {
+    use aes_gcm::aead::AeadInPlace;
+
+    let len = plaintext.len();
+    let total = len + GCM_OVERHEAD;
+    if out.len() < total {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+            "Output buffer too small",
+        ));
+    }
+    out[..12].copy_from_slice(nonce);
+    out[12..12 + len].copy_from_slice(plaintext);
+    let tag = cipher
+        .encrypt_in_place_detached(nonce, b"", &mut out[12..12 + len])
+        .map_err(|e| PyErr::new::<pyo3::exceptions::PyValueError, _>(format!("{}", e)))?;
+    out[12 + len..total].copy_from_slice(&tag);
+    Ok(total)
+}
+
+/// 解密由`gcm_encrypt`生成的密文到out中，返回明文字节数
+///
+/// 认证失败时out中已写入的部分会被清零
+fn gcm_decrypt_into(
+    cipher: &aes_gcm::Aes128Gcm,
+    ciphertext: &[u8],
+    out: &mut [u8],
+) -> PyResult<usize> {
+    use aes_gcm::aead::AeadInPlace;
+
+    if ciphertext.len() < GCM_OVERHEAD {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+            "Ciphertext too short",
+        ));
+    }
+    let len = ciphertext.len() - GCM_OVERHEAD;
+    if out.len() < len {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+            "Output buffer too small",
+        ));
+    }
+    let (nonce, rest) = ciphertext.split_at(12);
+    let (body, tag) = rest.split_at(len);
+    out[..len].copy_from_slice(body);
+    cipher
+        .decrypt_in_place_detached(nonce.into(), b"", &mut out[..len], tag.into())
+        .map_err(|e| {
+            out[..len].fill(0);
+            PyErr::new::<pyo3::exceptions::PyValueError, _>(format!("{}", e))
+        })?;
+    Ok(len)
+}
+
+/// 批量加密时第`counter`个明文使用的nonce：8字节随机前缀 || 4字节大端计数器
+///
+/// 每批只从`OsRng`取一次随机前缀，批内用计数器区分，同一批最多`u32::MAX + 1`个明文
+fn gcm_batch_nonce(prefix: &[u8; 8], counter: u32) -> aes_gcm::Nonce<aes_gcm::aead::consts::U12> {
+    let mut nonce = aes_gcm::Nonce::default();
+    nonce[..8].copy_from_slice(prefix);
+    nonce[8..].copy_from_slice(&counter.to_be_bytes());
+    nonce
+}
+
+/// 使用AES-128 GCM模式逐段加密，密文依次写入out中以offsets划分的区间
+///
+/// 参数：
+/// - `prefix`: 本批nonce的随机前缀
+/// - `inputs`: 待加密的多段明文，数量不超过`u32::MAX + 1`
+/// - `offsets`: 第i个密文位于`out[offsets[i]..offsets[i+1]]`，长度为明文长度加`GCM_OVERHEAD`
+/// - `parallel`: 是否使用多个线程并行加密
+fn gcm_encrypt_many_into<T: AsRef<[u8]> + Sync>(
+    cipher: &aes_gcm::Aes128Gcm,
+    prefix: &[u8; 8],
+    inputs: &[T],
+    offsets: &[usize],
+    out: &mut [u8],
+    parallel: bool,
+) -> PyResult<()> {
+    use rayon::prelude::*;
+
+    let encrypt_one = |(i, (input, part)): (usize, (&T, &mut [u8]))| {
+        let nonce = gcm_batch_nonce(prefix, i as u32);
+        gcm_encrypt_into(cipher, &nonce, input.as_ref(), part).map(|_| ())
+    };
+    let parts = split_by_offsets(out, offsets);
+    if parallel {
+        inputs.par_iter().zip(parts).enumerate().try_for_each(encrypt_one)
+    } else {
+        inputs.iter().zip(parts).enumerate().try_for_each(encrypt_one)
+    }
+}
+
+/// 批量加密多段明文并直接写入新建的Python bytes对象，加密期间释放GIL
+fn gcm_encrypt_to_pybytes<'py, T: AsRef<[u8]> + Sync>(
+    py: Python<'py>,
+    cipher: &aes_gcm::Aes128Gcm,
+    inputs: &[T],
+    parallel: bool,
+) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+    use aes_gcm::aead::{rand_core::RngCore, OsRng};
+
+    if inputs.len() as u64 > u32::MAX as u64 + 1 {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+            "Too many plaintexts in one batch",
+        ));
+    }
+    let mut offsets = Vec::with_capacity(inputs.len() + 1);
+    offsets.push(0);
+    for input in inputs {
+        offsets.push(offsets[offsets.len() - 1] + input.as_ref().len() + GCM_OVERHEAD);
+    }
+    let mut prefix = [0u8; 8];
+    OsRng.fill_bytes(&mut prefix);
+    let ciphertexts = PyBytes::new_with(py, offsets[inputs.len()], |out| {
+        py.allow_threads(|| gcm_encrypt_many_into(cipher, &prefix, inputs, &offsets, out, parallel))
+    })?;
+    Ok((ciphertexts, offsets))
+}
+
+/// 分段AEAD中第`counter`段的nonce：前缀(7) || 段序号(4, 大端) || 是否为最后一段(1)
+fn stream_nonce(
+    prefix: &[u8],
+    counter: u32,
+    last: bool,
+) -> aes_gcm::Nonce<aes_gcm::aead::consts::U12> {
+    let mut nonce = aes_gcm::Nonce::default();
+    nonce[..7].copy_from_slice(prefix);
+    nonce[7..11].copy_from_slice(&counter.to_be_bytes());
+    nonce[11] = last as u8;
+    nonce
+}
+
+/// 加密一段明文并把 密文 || tag 追加到out末尾，文件头作为附加认证数据
+fn stream_seal_chunk(
+    cipher: &aes_gcm::Aes128Gcm,
+    header: &[u8; STREAM_HEADER_LEN],
+    counter: u32,
+    last: bool,
+    plaintext: &[u8],
+    out: &mut Vec<u8>,
+) -> PyResult<()> {
+    use aes_gcm::aead::AeadInPlace;
+
+    let nonce = stream_nonce(&header[9..], counter, last);
+    let start = out.len();
+    out.extend_from_slice(plaintext);
+    let tag = cipher
+        .encrypt_in_place_detached(&nonce, header, &mut out[start..])
+        .map_err(|e| PyErr::new::<pyo3::exceptions::PyValueError, _>(format!("{}", e)))?;
+    out.extend_from_slice(&tag);
+    Ok(())
+}
+
+/// 校验并解密一段 密文 || tag，明文追加到out末尾；认证失败时out保持不变
+fn stream_open_chunk(
+    cipher: &aes_gcm::Aes128Gcm,
+    header: &[u8; STREAM_HEADER_LEN],
+    counter: u32,
+    last: bool,
+    chunk: &[u8],
+    out: &mut Vec<u8>,
+) -> PyResult<()> {
+    use aes_gcm::aead::AeadInPlace;
+
+    if chunk.len() < STREAM_TAG_LEN {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+            "Truncated stream ciphertext",
+        ));
+    }
+    let nonce = stream_nonce(&header[9..], counter, last);
+    let (body, tag) = chunk.split_at(chunk.len() - STREAM_TAG_LEN);
+    let start = out.len();
+    out.extend_from_slice(body);
+    cipher
+        .decrypt_in_place_detached(&nonce, header, &mut out[start..], tag.into())
+        .map_err(|_| {
+            out.truncate(start);
+            PyErr::new::<pyo3::exceptions::PyValueError, _>("Stream chunk authentication failed")
+        })
+}
+
+/// 段序号加一，超过`u32`范围时报错以避免nonce重复
+fn stream_next_counter(counter: u32) -> PyResult<u32> {
+    counter.checked_add(1).ok_or_else(|| {
+        PyErr::new::<pyo3::exceptions::PyValueError, _>("Stream has too many chunks")
+    })
+}
+
+/// 以只读切片访问支持缓冲区协议的对象（bytes、bytearray、memoryview、mmap等），不复制数据
+///
+/// 调用方在切片使用期间不得修改该缓冲区
+fn buffer_as_slice(buf: &PyBuffer<u8>) -> PyResult<&[u8]> {
+    if !buf.is_c_contiguous() {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+            "Buffer must be C-contiguous",
+        ));
+    }
+    if buf.len_bytes() == 0 {
+        return Ok(&[]);
+    }
+    Ok(unsafe { std::slice::from_raw_parts(buf.buf_ptr() as *const u8, buf.len_bytes()) })
+}
+
+/// 以可写切片访问调用方提供的输出缓冲区，要求其可写且与输入不重叠
+fn buffer_as_mut_slice<'a>(buf: &'a PyBuffer<u8>, input: &[u8]) -> PyResult<&'a mut [u8]> {
+    if buf.readonly() {
+        return Err(PyErr::new::<pyo3::exceptions::PyTypeError, _>(
+            "Output buffer is read-only",
+        ));
+    }
+    if !buf.is_c_contiguous() {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+            "Buffer must be C-contiguous",
+        ));
+    }
+    let start = buf.buf_ptr() as usize;
+    let end = start + buf.len_bytes();
+    let input_start = input.as_ptr() as usize;
+    if !input.is_empty() && start < input_start + input.len() && input_start < end {
+        return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+            "Output buffer overlaps the input",
+        ));
+    }
+    if buf.len_bytes() == 0 {
+        return Ok(&mut []);
+    }
+    Ok(unsafe { std::slice::from_raw_parts_mut(buf.buf_ptr() as *mut u8, buf.len_bytes()) })
+}
+
+#[pyfunction]
+fn aes_gcm_encrypt(key: [u8; 16], plaintext: &str) -> PyResult<Vec<u8>> {
+    use aes_gcm::{aead::KeyInit, Aes128Gcm, Key};
+
+    let key = Key::<Aes128Gcm>::from_slice(&key);
+    gcm_encrypt(&Aes128Gcm::new(key), plaintext.as_bytes())
+}
+
 #[pyfunction]
 fn aes_gcm_decrypt(key: [u8; 16], ciphertext: &[u8]) -> PyResult<String> {
-    use aes_gcm::{
-        aead::{Aead, KeyInit},
-        Aes128Gcm, Key,
-    };
+    use aes_gcm::{aead::KeyInit, Aes128Gcm, Key};
 
-    // Alternatively, the key can be transformed directly from a byte slice
-    // (panicks on length mismatch):
     let key = Key::<Aes128Gcm>::from_slice(&key);
-    let cipher = Aes128Gcm::new(&key);
-    let nonce = &ciphertext[..12];
-    let nonce = nonce.into();
-    let ciphertext = &ciphertext[12..];
-    let decrypted = cipher
-        .decrypt(nonce, ciphertext)
-        .map_err(|e| PyErr::new::<pyo3::exceptions::PyValueError, _>(format!("{}", e)))?;
+    let decrypted = gcm_decrypt(&Aes128Gcm::new(key), ciphertext)?;
     Ok(String::from_utf8(decrypted)?)
 }
 
+/// 批量GCM加密的输入，可以是str或bytes（例如压缩后的文档）
+#[derive(FromPyObject)]
+enum Plaintext {
+    Str(PyBackedStr),
+    Bytes(PyBackedBytes),
+}
+
+impl AsRef<[u8]> for Plaintext {
+    fn as_ref(&self) -> &[u8] {
+        match self {
+            Plaintext::Str(s) => s.as_bytes(),
+            Plaintext::Bytes(b) => b.as_ref(),
+        }
+    }
+}
+
+/// 使用AES-128 GCM模式批量加密多个明文
+///
+/// 每批只取一次随机数，nonce由随机前缀和批内序号组成，每个密文的格式与`aes_gcm_encrypt`相同
+///
+/// 参数：
+/// - `key`: 16字节的AES加密密钥
+/// - `plaintexts`: 待加密的明文序列，元素为str（按UTF-8编码）或bytes
+/// - `parallel`: 是否使用多个线程并行加密
+///
+/// 返回值：
+/// - (拼接后的密文bytes, 偏移列表)，第i个密文为`buf[offsets[i]:offsets[i+1]]`
+#[pyfunction]
+#[pyo3(signature = (key, plaintexts, parallel=false))]
+fn aes_gcm_encrypt_many<'py>(
+    py: Python<'py>,
+    key: [u8; 16],
+    plaintexts: Vec<Plaintext>,
+    parallel: bool,
+) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+    use aes_gcm::{aead::KeyInit, Aes128Gcm, Key};
+
+    let cipher = Aes128Gcm::new(Key::<Aes128Gcm>::from_slice(&key));
+    gcm_encrypt_to_pybytes(py, &cipher, &plaintexts, parallel)
+}
+
+/// 预先完成密钥扩展的AES-128 ECB加解密器
+///
+/// 同一个密钥反复加解密短字符串时，省去每次调用的密钥转换和密钥扩展
+#[pyclass(frozen, module = "enc_rust")]
+struct EcbCipher {
+    encryptor: Aes128EcbEnc,
+    decryptor: Aes128EcbDec,
+}
+
+#[pymethods]
+impl EcbCipher {
+    /// 参数：
+    /// - `key`: 16字节的AES加密密钥
+    #[new]
+    fn new(key: [u8; 16]) -> Self {
+        use aes::cipher::KeyInit;
+
+        EcbCipher {
+            encryptor: Aes128EcbEnc::new(&key.into()),
+            decryptor: Aes128EcbDec::new(&key.into()),
+        }
+    }
+
+    /// 加密明文字符串，结果与`aes_ecb_encrypt`相同
+    fn encrypt(&self, plaintext: &str) -> Vec<u8> {
+        use aes::cipher::{block_padding::Pkcs7, BlockEncryptMut};
+
+        self.encryptor
+            .clone()
+            .encrypt_padded_vec_mut::<Pkcs7>(plaintext.as_bytes())
+    }
+
+    /// 解密密文，结果与`aes_ecb_decrypt`相同
+    fn decrypt(&self, ciphertext: &[u8]) -> PyResult<String> {
+        use aes::cipher::{block_padding::Pkcs7, BlockDecryptMut};
+
+        let decrypt_vec = self
+            .decryptor
+            .clone()
+            .decrypt_padded_vec_mut::<Pkcs7>(ciphertext)
+            .map_err(|_| PyErr::new::<pyo3::exceptions::PyValueError, _>("Invalid ciphertext"))?;
+        Ok(String::from_utf8(decrypt_vec)?)
+    }
+
+    /// 批量加密，参数与返回值同`aes_ecb_encrypt_many`
+    #[pyo3(signature = (plaintexts, parallel=false))]
+    fn encrypt_many<'py>(
+        &self,
+        py: Python<'py>,
+        plaintexts: Vec<PyBackedStr>,
+        parallel: bool,
+    ) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+        ecb_encrypt_to_pybytes(py, &self.encryptor, &plaintexts, parallel)
+    }
+
+    /// 批量加密打包的明文，参数与返回值同`aes_ecb_encrypt_packed`
+    #[pyo3(signature = (data, offsets, parallel=false))]
+    fn encrypt_packed<'py>(
+        &self,
+        py: Python<'py>,
+        data: &[u8],
+        offsets: Vec<usize>,
+        parallel: bool,
+    ) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+        let inputs = slices_by_offsets(data, &offsets)?;
+        ecb_encrypt_to_pybytes(py, &self.encryptor, &inputs, parallel)
+    }
+
+    /// 批量解密，参数与返回值同`aes_ecb_decrypt_many`
+    #[pyo3(signature = (ciphertexts, parallel=false))]
+    fn decrypt_many<'py>(
+        &self,
+        py: Python<'py>,
+        ciphertexts: Vec<PyBackedBytes>,
+        parallel: bool,
+    ) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+        ecb_decrypt_to_pybytes(py, &self.decryptor, &ciphertexts, parallel)
+    }
+
+    /// 批量解密打包的密文，参数与返回值同`aes_ecb_decrypt_packed`
+    #[pyo3(signature = (data, offsets, parallel=false))]
+    fn decrypt_packed<'py>(
+        &self,
+        py: Python<'py>,
+        data: PyBuffer<u8>,
+        offsets: Vec<usize>,
+        parallel: bool,
+    ) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+        let inputs = slices_by_offsets(buffer_as_slice(&data)?, &offsets)?;
+        ecb_decrypt_to_pybytes(py, &self.decryptor, &inputs, parallel)
+    }
+}
+
+/// 预先完成密钥扩展的AES-128 GCM文档加解密器
+#[pyclass(frozen, module = "enc_rust")]
+struct GcmCipher {
+    cipher: aes_gcm::Aes128Gcm,
+}
+
+#[pymethods]
+impl GcmCipher {
+    /// 参数：
+    /// - `key`: 16字节的AES加密密钥
+    #[new]
+    fn new(key: [u8; 16]) -> Self {
+        use aes_gcm::{aead::KeyInit, Aes128Gcm, Key};
+
+        GcmCipher {
+            cipher: Aes128Gcm::new(Key::<Aes128Gcm>::from_slice(&key)),
+        }
+    }
+
+    /// 加密明文字符串，格式与`aes_gcm_encrypt`相同
+    fn encrypt(&self, plaintext: &str) -> PyResult<Vec<u8>> {
+        gcm_encrypt(&self.cipher, plaintext.as_bytes())
+    }
+
+    /// 解密密文并返回字符串，格式与`aes_gcm_decrypt`相同
+    fn decrypt(&self, ciphertext: &[u8]) -> PyResult<String> {
+        let decrypted = gcm_decrypt(&self.cipher, ciphertext)?;
+        Ok(String::from_utf8(decrypted)?)
+    }
+
+    /// 批量加密，参数与返回值同`aes_gcm_encrypt_many`
+    #[pyo3(signature = (plaintexts, parallel=false))]
+    fn encrypt_many<'py>(
+        &self,
+        py: Python<'py>,
+        plaintexts: Vec<Plaintext>,
+        parallel: bool,
+    ) -> PyResult<(Bound<'py, PyBytes>, Vec<usize>)> {
+        gcm_encrypt_to_pybytes(py, &self.cipher, &plaintexts, parallel)
+    }
+
+    /// 加密任意缓冲区对象中的明文，密文直接写入新建的bytes，加密期间释放GIL
+    fn encrypt_buffer<'py>(
+        &self,
+        py: Python<'py>,
+        data: PyBuffer<u8>,
+    ) -> PyResult<Bound<'py, PyBytes>> {
+        use aes_gcm::aead::{AeadCore, OsRng};
+
+        let plaintext = buffer_as_slice(&data)?;
+        let nonce = aes_gcm::Aes128Gcm::generate_nonce(&mut OsRng);
+        PyBytes::new_with(py, plaintext.len() + GCM_OVERHEAD, |out| {
+            py.allow_threads(|| gcm_encrypt_into(&self.cipher, &nonce, plaintext, out))?;
+            Ok(())
+        })
+    }
+
+    /// 解密任意缓冲区对象中的密文，返回原始明文bytes，不做UTF-8校验
+    fn decrypt_buffer<'py>(
+        &self,
+        py: Python<'py>,
+        data: PyBuffer<u8>,
+    ) -> PyResult<Bound<'py, PyBytes>> {
+        let ciphertext = buffer_as_slice(&data)?;
+        let len = ciphertext.len().checked_sub(GCM_OVERHEAD).ok_or_else(|| {
+            PyErr::new::<pyo3::exceptions::PyValueError, _>("Ciphertext too short")
+        })?;
+        PyBytes::new_with(py, len, |out| {
+            py.allow_threads(|| gcm_decrypt_into(&self.cipher, ciphertext, out))?;
+            Ok(())
+        })
+    }
+
+    /// 把data加密到调用方提供的可写缓冲区out中，返回写入的字节数
+    ///
+    /// out至少需要`len(data) + GCM_OVERHEAD`字节，且不能与data重叠
+    fn encrypt_into(&self, py: Python<'_>, data: PyBuffer<u8>, out: PyBuffer<u8>) -> PyResult<usize> {
+        use aes_gcm::aead::{AeadCore, OsRng};
+
+        let plaintext = buffer_as_slice(&data)?;
+        let out = buffer_as_mut_slice(&out, plaintext)?;
+        let nonce = aes_gcm::Aes128Gcm::generate_nonce(&mut OsRng);
+        py.allow_threads(|| gcm_encrypt_into(&self.cipher, &nonce, plaintext, out))
+    }
+
+    /// 把data解密到调用方提供的可写缓冲区out中，返回明文字节数
+    ///
+    /// out至少需要`len(data) - GCM_OVERHEAD`字节，且不能与data重叠
+    fn decrypt_into(&self, py: Python<'_>, data: PyBuffer<u8>, out: PyBuffer<u8>) -> PyResult<usize> {
+        let ciphertext = buffer_as_slice(&data)?;
+        let out = buffer_as_mut_slice(&out, ciphertext)?;
+        py.allow_threads(|| gcm_decrypt_into(&self.cipher, ciphertext, out))
+    }
+}
+
+/// 分段AEAD加密器，明文可以分多次输入，每满一段就输出对应的密文
+///
+/// 输出为 文件头 || 段0 || 段1 || ... || 最后一段，每段为 密文 || tag(16字节)。
+/// 最后一段的nonce带有结束标记，因此截断或重排分段都会在解密时被发现
+#[pyclass(module = "enc_rust")]
+struct StreamEncryptor {
+    cipher: aes_gcm::Aes128Gcm,
+    header: [u8; STREAM_HEADER_LEN],
+    chunk_size: usize,
+    counter: u32,
+    // 尚未加密的明文，长度不超过chunk_size时保留，等待确认是否为最后一段
+    pending: Vec<u8>,
+    header_written: bool,
+    finished: bool,
+}
+
+impl StreamEncryptor {
+    /// 加密pending中除最后一段以外的完整分段，返回输出的密文
+    fn seal_pending(&mut self, last: bool) -> PyResult<Vec<u8>> {
+        let mut out = Vec::new();
+        if !self.header_written {
+            out.extend_from_slice(&self.header);
+            self.header_written = true;
+        }
+        let mut start = 0;
+        while self.pending.len() - start > self.chunk_size {
+            let end = start + self.chunk_size;
+            stream_seal_chunk(
+                &self.cipher,
+                &self.header,
+                self.counter,
+                false,
+                &self.pending[start..end],
+                &mut out,
+            )?;
+            self.counter = stream_next_counter(self.counter)?;
+            start = end;
+        }
+        if last {
+            stream_seal_chunk(
+                &self.cipher,
+                &self.header,
+                self.counter,
+                true,
+                &self.pending[start..],
+                &mut out,
+            )?;
+            start = self.pending.len();
+        }
+        self.pending.drain(..start);
+        Ok(out)
+    }
+
+    fn check_not_finished(&self) -> PyResult<()> {
+        if self.finished {
+            return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+                "Stream already finalized",
+            ));
+        }
+        Ok(())
+    }
+}
+
+#[pymethods]
+impl StreamEncryptor {
+    /// 参数：
+    /// - `key`: 16字节的AES加密密钥
+    /// - `chunk_size`: 每段明文的字节数
+    #[new]
+    #[pyo3(signature = (key, chunk_size=STREAM_DEFAULT_CHUNK_SIZE))]
+    fn new(key: [u8; 16], chunk_size: usize) -> PyResult<Self> {
+        use aes_gcm::{
+            aead::{rand_core::RngCore, KeyInit, OsRng},
+            Aes128Gcm, Key,
+        };
+
+        if chunk_size == 0 || chunk_size > STREAM_MAX_CHUNK_SIZE {
+            return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(format!(
+                "chunk_size must be between 1 and {}",
+                STREAM_MAX_CHUNK_SIZE
+            )));
+        }
+        let mut header = [0u8; STREAM_HEADER_LEN];
+        header[..4].copy_from_slice(STREAM_MAGIC);
+        header[4] = STREAM_VERSION;
+        header[5..9].copy_from_slice(&(chunk_size as u32).to_be_bytes());
+        OsRng.fill_bytes(&mut header[9..]);
+        Ok(StreamEncryptor {
+            cipher: Aes128Gcm::new(Key::<Aes128Gcm>::from_slice(&key)),
+            header,
+            chunk_size,
+            counter: 0,
+            pending: Vec::new(),
+            header_written: false,
+            finished: false,
+        })
+    }
+
+    /// 输入一部分明文，返回已经可以输出的密文（可能为空），加密期间释放GIL
+    fn update<'py>(&mut self, py: Python<'py>, data: PyBuffer<u8>) -> PyResult<Bound<'py, PyBytes>> {
+        self.check_not_finished()?;
+        self.pending.extend_from_slice(buffer_as_slice(&data)?);
+        let out = py.allow_threads(|| self.seal_pending(false))?;
+        Ok(PyBytes::new(py, &out))
+    }
+
+    /// 结束输入，返回剩余的密文（包含带结束标记的最后一段）
+    fn finalize<'py>(&mut self, py: Python<'py>) -> PyResult<Bound<'py, PyBytes>> {
+        self.check_not_finished()?;
+        self.finished = true;
+        let out = py.allow_threads(|| self.seal_pending(true))?;
+        Ok(PyBytes::new(py, &out))
+    }
+}
+
+/// 分段AEAD解密器，密文可以分多次输入，每收到一段完整且已认证的分段就输出其明文
+///
+/// `update`只输出确认不是最后一段的分段，最后一段在`finalize`中校验；
+/// 调用方必须调用`finalize`，否则无法发现被截断的密文
+#[pyclass(module = "enc_rust")]
+struct StreamDecryptor {
+    cipher: aes_gcm::Aes128Gcm,
+    header: Option<[u8; STREAM_HEADER_LEN]>,
+    chunk_size: usize,
+    counter: u32,
+    pending: Vec<u8>,
+    finished: bool,
+}
+
+impl StreamDecryptor {
+    /// 解析并校验文件头，数据不足时返回Ok(false)
+    fn read_header(&mut self) -> PyResult<bool> {
+        if self.header.is_some() {
+            return Ok(true);
+        }
+        if self.pending.len() < STREAM_HEADER_LEN {
+            return Ok(false);
+        }
+        let mut header = [0u8; STREAM_HEADER_LEN];
+        header.copy_from_slice(&self.pending[..STREAM_HEADER_LEN]);
+        if &header[..4] != STREAM_MAGIC || header[4] != STREAM_VERSION {
+            return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+                "Not a stream ciphertext",
+            ));
+        }
+        let chunk_size = u32::from_be_bytes(header[5..9].try_into().unwrap()) as usize;
+        if chunk_size == 0 || chunk_size > STREAM_MAX_CHUNK_SIZE {
+            return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+                "Invalid stream chunk size",
+            ));
+        }
+        self.pending.drain(..STREAM_HEADER_LEN);
+        self.header = Some(header);
+        self.chunk_size = chunk_size;
+        Ok(true)
+    }
+
+    /// 解密pending中的完整分段，last为true时把剩余部分作为最后一段
+    fn open_pending(&mut self, last: bool) -> PyResult<Vec<u8>> {
+        let mut out = Vec::new();
+        if !self.read_header()? {
+            if last {
+                return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+                    "Truncated stream ciphertext",
+                ));
+            }
+            return Ok(out);
+        }
+        let header = self.header.unwrap();
+        let sealed_size = self.chunk_size + STREAM_TAG_LEN;
+        let mut start = 0;
+        // 只有后面还有数据时才能确定当前分段不是最后一段
+        while self.pending.len() - start > sealed_size {
+            let end = start + sealed_size;
+            stream_open_chunk(
+                &self.cipher,
+                &header,
+                self.counter,
+                false,
+                &self.pending[start..end],
+                &mut out,
+            )?;
+            self.counter = stream_next_counter(self.counter)?;
+            start = end;
+        }
+        if last {
+            stream_open_chunk(
+                &self.cipher,
+                &header,
+                self.counter,
+                true,
+                &self.pending[start..],
+                &mut out,
+            )?;
+            start = self.pending.len();
+        }
+        self.pending.drain(..start);
+        Ok(out)
+    }
+}
+
+#[pymethods]
+impl StreamDecryptor {
+    /// 参数：
+    /// - `key`: 16字节的AES加密密钥
+    #[new]
+    fn new(key: [u8; 16]) -> Self {
+        use aes_gcm::{aead::KeyInit, Aes128Gcm, Key};
+
+        StreamDecryptor {
+            cipher: Aes128Gcm::new(Key::<Aes128Gcm>::from_slice(&key)),
+            header: None,
+            chunk_size: 0,
+            counter: 0,
+            pending: Vec::new(),
+            finished: false,
+        }
+    }
+
+    /// 输入一部分密文，返回已认证分段的明文（可能为空），解密期间释放GIL
+    fn update<'py>(&mut self, py: Python<'py>, data: PyBuffer<u8>) -> PyResult<Bound<'py, PyBytes>> {
+        if self.finished {
+            return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+                "Stream already finalized",
+            ));
+        }
+        self.pending.extend_from_slice(buffer_as_slice(&data)?);
+        let out = py.allow_threads(|| self.open_pending(false))?;
+        Ok(PyBytes::new(py, &out))
+    }
+
+    /// 结束输入并校验最后一段，返回其明文；密文被截断或篡改时抛出ValueError
+    fn finalize<'py>(&mut self, py: Python<'py>) -> PyResult<Bound<'py, PyBytes>> {
+        if self.finished {
+            return Err(PyErr::new::<pyo3::exceptions::PyValueError, _>(
+                "Stream already finalized",
+            ));
+        }
+        self.finished = true;
+        let out = py.allow_threads(|| self.open_pending(true))?;
+        Ok(PyBytes::new(py, &out))
+    }
+}
+
+/// 统计一段ASCII文本中各单词的出现次数，结果与Python的
+/// `Counter(re.findall(r"\b[\w-]+\b", text.lower()))` 相同
+///
+/// 正则在每段连续的`[A-Za-z0-9_-]`中匹配去掉两端'-'后的部分（只含'-'的段没有匹配），
+/// 因此只需按其他字符切分后去掉两端的'-'。
+///
+/// 返回值：
+/// - 成功时返回(小写单词, 次数)列表，文本含非ASCII字符时返回None
+fn count_ascii_terms(text: &str) -> Option<Vec<(String, u32)>> {
+    use std::collections::HashMap;
+
+    if !text.is_ascii() {
+        return None;
+    }
+    let lower = text.to_ascii_lowercase();
+    let mut counts: HashMap<&str, u32> = HashMap::new();
+    for run in lower.split(|c: char| !(c.is_ascii_alphanumeric() || c == '_' || c == '-')) {
+        let term = run.trim_matches('-');
+        if !term.is_empty() {
+            *counts.entry(term).or_insert(0) += 1;
+        }
+    }
+    Some(counts.into_iter().map(|(term, count)| (term.to_owned(), count)).collect())
+}
+
+fn terms_to_pydict<'py>(
+    py: Python<'py>,
+    terms: Vec<(String, u32)>,
+) -> PyResult<Bound<'py, PyDict>> {
+    let dict = PyDict::new(py);
+    for (term, count) in terms {
+        dict.set_item(term, count)?;
+    }
+    Ok(dict)
+}
+
+fn non_ascii_error() -> PyErr {
+    PyErr::new::<pyo3::exceptions::PyValueError, _>("Text must be ASCII")
+}
+
+/// 在一次遍历中完成小写化、分词和计数，期间释放GIL
+///
+/// 参数：
+/// - `text`: 只含ASCII字符的文本
+///
+/// 返回值：
+/// - {单词: 次数}，与`Counter(re.findall(r"\b[\w-]+\b", text.lower()))`相同；
+///   非ASCII文本抛出ValueError（Rust与Python对Unicode字母数字的判断不完全一致）
+#[pyfunction]
+fn count_terms<'py>(py: Python<'py>, text: PyBackedStr) -> PyResult<Bound<'py, PyDict>> {
+    let terms = py.allow_threads(|| count_ascii_terms(&text)).ok_or_else(non_ascii_error)?;
+    terms_to_pydict(py, terms)
+}
+
+/// 批量统计多段ASCII文本的单词出现次数，期间释放GIL
+///
+/// 参数：
+/// - `texts`: 只含ASCII字符的文本序列
+/// - `parallel`: 是否使用多个线程并行统计
+///
+/// 返回值：
+/// - 每段文本的{单词: 次数}
+#[pyfunction]
+#[pyo3(signature = (texts, parallel=false))]
+fn count_terms_many<'py>(
+    py: Python<'py>,
+    texts: Vec<PyBackedStr>,
+    parallel: bool,
+) -> PyResult<Vec<Bound<'py, PyDict>>> {
+    use rayon::prelude::*;
+
+    let terms: Option<Vec<_>> = py.allow_threads(|| {
+        if parallel {
+            texts.par_iter().map(|text| count_ascii_terms(text)).collect()
+        } else {
+            texts.iter().map(|text| count_ascii_terms(text)).collect()
+        }
+    });
+    terms
+        .ok_or_else(non_ascii_error)?
+        .into_iter()
+        .map(|terms| terms_to_pydict(py, terms))
+        .collect()
+}
+
 /// A Python module implemented in Rust.
 #[pymodule]
 fn enc_rust(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(aes_ecb_encrypt, m)?)?;
     m.add_function(wrap_pyfunction!(aes_ecb_decrypt, m)?)?;
+    m.add_function(wrap_pyfunction!(aes_ecb_encrypt_many, m)?)?;
+    m.add_function(wrap_pyfunction!(aes_ecb_encrypt_packed, m)?)?;
+    m.add_function(wrap_pyfunction!(aes_ecb_decrypt_many, m)?)?;
+    m.add_function(wrap_pyfunction!(aes_ecb_decrypt_packed, m)?)?;
     m.add_function(wrap_pyfunction!(aes_gcm_encrypt, m)?)?;
     m.add_function(wrap_pyfunction!(aes_gcm_decrypt, m)?)?;
+    m.add_function(wrap_pyfunction!(aes_gcm_encrypt_many, m)?)?;
+    m.add_function(wrap_pyfunction!(count_terms, m)?)?;
+    m.add_function(wrap_pyfunction!(count_terms_many, m)?)?;
+    m.add_class::<EcbCipher>()?;
+    m.add_class::<GcmCipher>()?;
+    m.add_class::<StreamEncryptor>()?;
+    m.add_class::<StreamDecryptor>()?;
+    m.add("GCM_OVERHEAD", GCM_OVERHEAD)?;
+    m.add("STREAM_MAGIC", PyBytes::new(m.py(), STREAM_MAGIC))?;
+    m.add("STREAM_HEADER_LEN", STREAM_HEADER_LEN)?;
+    m.add("STREAM_VERSION", STREAM_VERSION)?;
+    m.add("STREAM_MAX_CHUNK_SIZE", STREAM_MAX_CHUNK_SIZE)?;
     Ok(())
 }
 
@@ -120,4 +1196,131 @@ mod tests {
         let decrypted_text = aes_gcm_decrypt(key, &ciphertext).unwrap();
         assert_eq!(plaintext, decrypted_text);
     }
+
+    #[test]
+    fn test_ecb_packed_matches_single() {
+        let key = [0x03; 16];
+        let cipher = EcbCipher::new(key);
+        let plaintexts = ["", "a", "exactly16bytes!!", "a somewhat longer keyword"];
+        for parallel in [false, true] {
+            let offsets = ecb_padded_offsets(&plaintexts);
+            let mut packed = vec![0u8; offsets[plaintexts.len()]];
+            ecb_encrypt_into(&cipher.encryptor, &plaintexts, &offsets, &mut packed, parallel);
+            for (i, plaintext) in plaintexts.iter().enumerate() {
+                let single = aes_ecb_encrypt(key, plaintext).unwrap();
+                assert_eq!(&packed[offsets[i]..offsets[i + 1]], single.as_slice());
+            }
+
+            let ciphertexts: Vec<&[u8]> =
+                offsets.windows(2).map(|w| &packed[w[0]..w[1]]).collect();
+            let (decrypted, plain_offsets) =
+                ecb_decrypt_packed(&cipher.decryptor, &ciphertexts, parallel).unwrap();
+            for (i, plaintext) in plaintexts.iter().enumerate() {
+                let part = &decrypted[plain_offsets[i]..plain_offsets[i + 1]];
+                assert_eq!(part, plaintext.as_bytes());
+            }
+        }
+    }
+
+    #[test]
+    fn test_ecb_packed_rejects_invalid_ciphertext() {
+        let key = [0x03; 16];
+        let valid = aes_ecb_encrypt(key, "keyword").unwrap();
+        let inputs: [&[u8]; 2] = [&valid, &[0u8; 15]];
+        let cipher = EcbCipher::new(key);
+        assert!(ecb_decrypt_packed(&cipher.decryptor, &inputs, false).is_none());
+    }
+
+    #[test]
+    fn test_cipher_objects_match_functions() {
+        let key = [0x03; 16];
+        let ecb = EcbCipher::new(key);
+        let ciphertext = ecb.encrypt("keyword");
+        assert_eq!(ciphertext, aes_ecb_encrypt(key, "keyword").unwrap());
+        assert_eq!(ecb.decrypt(&ciphertext).unwrap(), "keyword");
+
+        let gcm = GcmCipher::new(key);
+        let ciphertext = gcm.encrypt("Hello, World!").unwrap();
+        assert_eq!(aes_gcm_decrypt(key, &ciphertext).unwrap(), "Hello, World!");
+        assert_eq!(gcm.decrypt(&ciphertext).unwrap(), "Hello, World!");
+        assert!(gcm.decrypt(&ciphertext[..8]).is_err());
+    }
+
+    #[test]
+    fn test_gcm_into_buffers() {
+        use aes_gcm::aead::{AeadCore, OsRng};
+
+        let gcm = GcmCipher::new([0x03; 16]);
+        let plaintext = b"Hello, World!";
+        let nonce = aes_gcm::Aes128Gcm::generate_nonce(&mut OsRng);
+        let mut ciphertext = vec![0u8; plaintext.len() + GCM_OVERHEAD];
+        let written = gcm_encrypt_into(&gcm.cipher, &nonce, plaintext, &mut ciphertext).unwrap();
+        assert_eq!(written, ciphertext.len());
+        assert_eq!(gcm.decrypt(&ciphertext).unwrap(), "Hello, World!");
+
+        let mut out = vec![0u8; plaintext.len()];
+        let len = gcm_decrypt_into(&gcm.cipher, &ciphertext, &mut out).unwrap();
+        assert_eq!(&out[..len], plaintext);
+
+        // 输出缓冲区不足
+        assert!(gcm_decrypt_into(&gcm.cipher, &ciphertext, &mut out[..4]).is_err());
+        // 认证失败时不留下未经认证的明文
+        ciphertext[14] ^= 1;
+        assert!(gcm_decrypt_into(&gcm.cipher, &ciphertext, &mut out).is_err());
+        assert!(out.iter().all(|&b| b == 0));
+    }
+
+    #[test]
+    fn test_gcm_batch_nonces() {
+        let gcm = GcmCipher::new([0x05; 16]);
+        let inputs = ["first", "", "third document"];
+        let offsets = [0, 5 + GCM_OVERHEAD, 5 + 2 * GCM_OVERHEAD, 19 + 3 * GCM_OVERHEAD];
+        let mut out = vec![0u8; offsets[3]];
+        let prefix = [0x42; 8];
+        for parallel in [false, true] {
+            gcm_encrypt_many_into(&gcm.cipher, &prefix, &inputs, &offsets, &mut out, parallel)
+                .unwrap();
+            for (i, input) in inputs.iter().enumerate() {
+                let part = &out[offsets[i]..offsets[i + 1]];
+                // nonce = 随机前缀 || 大端序号
+                assert_eq!(&part[..8], &prefix);
+                assert_eq!(&part[8..12], &(i as u32).to_be_bytes());
+                assert_eq!(gcm.decrypt(part).unwrap(), *input);
+            }
+        }
+    }
+
+    #[test]
+    fn test_stream_chunks() {
+        use aes_gcm::{aead::KeyInit, Aes128Gcm, Key};
+
+        let cipher = Aes128Gcm::new(Key::<Aes128Gcm>::from_slice(&[0x07; 16]));
+        let mut header = [0u8; STREAM_HEADER_LEN];
+        header[..4].copy_from_slice(STREAM_MAGIC);
+        let mut sealed = Vec::new();
+        stream_seal_chunk(&cipher, &header, 0, false, b"chunk", &mut sealed).unwrap();
+        assert_eq!(sealed.len(), 5 + STREAM_TAG_LEN);
+
+        let mut out = Vec::new();
+        stream_open_chunk(&cipher, &header, 0, false, &sealed, &mut out).unwrap();
+        assert_eq!(out, b"chunk");
+        // 段序号、结束标记或文件头不一致都无法通过认证
+        assert!(stream_open_chunk(&cipher, &header, 1, false, &sealed, &mut out).is_err());
+        assert!(stream_open_chunk(&cipher, &header, 0, true, &sealed, &mut out).is_err());
+        header[5] = 1;
+        assert!(stream_open_chunk(&cipher, &header, 0, false, &sealed, &mut out).is_err());
+        assert_eq!(out, b"chunk");
+    }
+
+    #[test]
+    fn test_count_ascii_terms() {
+        let mut terms = count_ascii_terms("--A-b-- a-B x_1 -- test!test?test... -").unwrap();
+        terms.sort();
+        let expected = [("a-b", 2), ("test", 3), ("x_1", 1)];
+        let expected: Vec<(String, u32)> =
+            expected.iter().map(|(t, c)| (t.to_string(), *c)).collect();
+        assert_eq!(terms, expected);
+        assert_eq!(count_ascii_terms(""), Some(vec![]));
+        assert_eq!(count_ascii_terms("重复"), None);
+    }
 }
@@ -1,11 +1,46 @@
+from functools import lru_cache
+
 import enc_rust
+
+
+@lru_cache(maxsize=16)
+def ecb_cipher(key):
+    # 每个密钥只创建一个加解密器，密钥扩展只做一次
+    return enc_rust.EcbCipher(key)
+
+
 def symmetric_encryption_for_keyword(key, word):
     # 使用AES加密算法进行加密
-    ciphertext = enc_rust.aes_ecb_encrypt(key, word)
+    ciphertext = ecb_cipher(key).encrypt(word)
     return ciphertext
 
 
 def symmetric_decryption_for_keyword(key, word_enc):
     # 使用AES解密算法进行解密
-    plaintext = enc_rust.aes_ecb_decrypt(key, word_enc)
+    plaintext = ecb_cipher(key).decrypt(word_enc)
     return plaintext
+
+
+def split_packed(buffer, offsets):
+    # 按偏移把批量接口返回的连续缓冲区切分为列表
+    return [buffer[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def symmetric_encryption_for_keywords(key, words, parallel=False):
+    # 批量加密，一次跨越Python/Rust边界
+    ciphertexts, offsets = ecb_cipher(key).encrypt_many(list(words), parallel)
+    return split_packed(ciphertexts, offsets)
+
+
+def symmetric_decryption_for_keywords(key, words_enc, parallel=False):
+    # 批量解密，返回与输入顺序一致的明文字符串列表
+    plaintexts, offsets = ecb_cipher(key).decrypt_many(list(words_enc), parallel)
+    return [plaintext.decode() for plaintext in split_packed(plaintexts, offsets)]
+
+
+def symmetric_decryption_for_blocks(key, data, block_size=16, parallel=False):
+    # 批量解密首尾相接的定长密文，data可以是bytes、memoryview、mmap等缓冲区对象，
+    # 直接传给Rust，既不复制也不切分为bytes列表
+    offsets = list(range(0, memoryview(data).nbytes + 1, block_size))
+    plaintexts, offsets = ecb_cipher(key).decrypt_packed(data, offsets, parallel)
+    return [plaintext.decode() for plaintext in split_packed(plaintexts, offsets)]
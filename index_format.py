@@ -0,0 +1,1116 @@
+"""可内存映射的二进制倒排索引格式
+
+文件布局（整数均为小端序），版本2：
+
+    文件头   MAGIC(8) || 版本(4) || 键长(4) || 密文长度(4) || 标志(4)
+             || 关键词数(8) || 词频密文数(8) || doc_id密文数(8)
+    目录     按键升序排列的定长条目：键(16) || 起始posting序号(8) || posting数(8)
+    词频表   每个不同的词频密文(16)只保存一次
+    文档表   每个不同的doc_id密文(16)只保存一次
+    postings 连续的定长记录：词频表序号(4) || 文档表序号(4)
+    文档序   与postings一一对应的posting下标(4)，每个posting列表内按doc_id密文的
+             字节序排列（文件头带FLAG_DOC_ORDER时存在）
+
+ECB加密是确定性的，同一个doc_id或词频在所有posting中的密文都相同，
+因此用序号引用side table与重复保存密文向服务器泄露的信息相同，posting却从32字节缩小到8字节。
+
+关键词token是变长的ECB密文，目录中保存其16字节的BLAKE2b摘要。
+打开索引只需mmap文件，查询时在目录上二分查找并切片读取postings，
+多个进程打开同一索引时共享操作系统的页缓存。
+版本1（posting直接保存两个密文）的索引仍可读取。
+
+数据拥有者构建索引时知道明文词频，每个posting列表按词频降序排列，
+文件头带FLAG_RANKED标志，查询时可以只读取前k个posting。服务器因此得知同一列表中
+posting之间的词频大小顺序，但仍不知道词频的值。
+文档序让多关键词查询直接在doc_id密文的顺序上求交集，不必在查询时排序；
+服务器本来就可以比较doc_id密文的字节序，不泄露新的信息。
+增量添加的文档写为追加段，由清单文件组织，见SegmentedIndex。
+"""
+
+import struct
+from collections.abc import Sequence
+from contextlib import contextmanager
+
+MAGIC = b"SSEINDEX"
+VERSION = 2
+KEY_SIZE = 16
+# 词频和doc_id的ECB密文各占一个AES分组
+FIELD_SIZE = 16
+REF_SIZE = 4
+POSTING_SIZE = 2 * REF_SIZE
+MAX_REFS = 1 << 32
+
+_PREFIX = struct.Struct("<8sI")
+_HEADER = struct.Struct("<8sIIIIQQQ")
+# 文件头标志：每个posting列表按词频降序排列
+FLAG_RANKED = 1
+# 文件头标志：postings之后保存每个posting列表按doc_id密文排序的下标
+FLAG_DOC_ORDER = 2
+_ENTRY = struct.Struct(f"<{KEY_SIZE}sQQ")
+_POSTING = struct.Struct("<II")
+_REF = struct.Struct("<I")
+
+# 版本1：文件头 MAGIC(8) || 版本(4) || 键长(4) || posting长度(4) || 关键词数(8) || 保留(4)，
+# posting为 词频密文(16) || doc_id密文(16)
+_HEADER_V1 = struct.Struct("<8sIIIQ4x")
+POSTING_SIZE_V1 = 2 * FIELD_SIZE
+
+
+def token_key(token: bytes) -> bytes:
+    """关键词token在目录中的键"""
+    from hashlib import blake2b
+
+    return blake2b(token, digest_size=KEY_SIZE).digest()
+
+
+def write_index(path, inverted_index, ranked: bool = False):
+    """把 {token: [(tf_enc, doc_id_enc), ...]} 写为二进制索引文件
+
+    不同的词频密文和doc_id密文按首次出现的顺序编号，各只写入一次。
+    先写入同目录下的临时文件再替换，正在读取旧索引的进程不受影响。
+
+    Args:
+        path (str): 索引文件路径
+        inverted_index (Mapping[bytes, list[tuple[bytes, bytes]]]): 倒排索引
+        ranked (bool): postings已按词频降序排列，写入FLAG_RANKED标志
+
+    Raises:
+        ValueError: 密文长度不是16字节，或两个token的摘要冲突
+    """
+    entries = sorted(
+        ((token_key(token), postings) for token, postings in inverted_index.items()),
+        key=lambda entry: entry[0],
+    )
+    for (key, _), (next_key, _) in zip(entries, entries[1:]):
+        if key == next_key:
+            raise ValueError("Index key collision")
+    _write_entries(path, entries, ranked)
+
+
+def _write_entries(path, entries, ranked: bool = False):
+    """把按目录键升序产出的(键, postings)写为二进制索引文件
+
+    entries可以是只能遍历一次的迭代器：postings的序号和文档序先写入临时文件，
+    目录和两张side table收集完后再与之拼接，内存占用只与关键词数和不同密文数有关。
+    """
+    import os
+    import shutil
+    import sys
+    import tempfile
+    from array import array
+    from posting_lists import doc_order
+
+    # 为每个不同的密文分配序号
+    tf_refs: dict[bytes, int] = {}
+    doc_refs: dict[bytes, int] = {}
+    directory = bytearray()
+    start = 0
+    # 匿名临时文件，关闭后自动删除
+    tmp_dir = os.path.dirname(os.path.abspath(path))
+    with (
+        tempfile.TemporaryFile(dir=tmp_dir) as refs_file,
+        tempfile.TemporaryFile(dir=tmp_dir) as order_file,
+    ):
+        for key, postings in entries:
+            refs = array("I")
+            doc_id_encs = bytearray()
+            for tf_enc, doc_id_enc in postings:
+                if len(tf_enc) != FIELD_SIZE or len(doc_id_enc) != FIELD_SIZE:
+                    raise ValueError(f"Posting fields must be {FIELD_SIZE} bytes")
+                refs.append(tf_refs.setdefault(tf_enc, len(tf_refs)))
+                refs.append(doc_refs.setdefault(doc_id_enc, len(doc_refs)))
+                doc_id_encs += doc_id_enc
+            if sys.byteorder == "big":
+                refs.byteswap()
+            refs.tofile(refs_file)
+            doc_order(doc_id_encs).astype("<u4").tofile(order_file)
+            directory += _ENTRY.pack(key, start, len(refs) // 2)
+            start += len(refs) // 2
+        if len(doc_refs) > MAX_REFS:
+            raise ValueError("Too many distinct doc_id ciphertexts")
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    KEY_SIZE,
+                    FIELD_SIZE,
+                    FLAG_DOC_ORDER | (FLAG_RANKED if ranked else 0),
+                    len(directory) // _ENTRY.size,
+                    len(tf_refs),
+                    len(doc_refs),
+                )
+            )
+            f.write(directory)
+            # dict按插入顺序迭代，与序号一致
+            f.write(b"".join(tf_refs))
+            f.write(b"".join(doc_refs))
+            refs_file.seek(0)
+            shutil.copyfileobj(refs_file, f)
+            order_file.seek(0)
+            shutil.copyfileobj(order_file, f)
+    os.replace(tmp_path, path)
+
+
+def is_mapped_index(path) -> bool:
+    """文件是否为二进制索引格式"""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_index(path):
+    """打开倒排索引，二进制格式使用mmap，旧的pickle格式完整加载
+
+    索引有追加段或删除记录时（存在清单文件），返回合并各段的SegmentedIndex。
+
+    Returns:
+        MappedIndex | SegmentedIndex | dict: 都支持 get(token, default) 和 in 运算
+    """
+    import os
+
+    if os.path.exists(manifest_path(path)):
+        return SegmentedIndex(path)
+    return _open_segment(path)
+
+
+def _open_segment(path):
+    import pickle
+
+    if is_mapped_index(path):
+        return MappedIndex(path)
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class _DirectoryKeys(Sequence):
+    """目录中第i个键的只读序列视图，供bisect在mmap上直接二分查找"""
+
+    def __init__(self, buf, start, count):
+        self._buf = buf
+        self._start = start
+        self._count = count
+
+    def __getitem__(self, i):
+        start = self._start + i * _ENTRY.size
+        return self._buf[start : start + KEY_SIZE]
+
+    def __len__(self):
+        return self._count
+
+
+class _DocOrderedPostings(Sequence):
+    """一个posting列表按doc_id密文排序的只读视图，第i项为第i小的doc_id密文
+
+    通过文档序下标和文档表序号在mmap上定位，供bisect直接二分查找。
+    """
+
+    def __init__(self, index: "MappedIndex", offset_in_file, order_offset, count):
+        self._index = index
+        self._offset_in_file = offset_in_file
+        self._order_offset = order_offset
+        self._count = count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        mmap = self._index._mmap
+        (position,) = _REF.unpack_from(mmap, self._order_offset + i * REF_SIZE)
+        (doc_ref,) = _REF.unpack_from(
+            mmap, self._offset_in_file + position * POSTING_SIZE + REF_SIZE
+        )
+        return self._index.doc_ciphertext(doc_ref)
+
+    def __len__(self):
+        return self._count
+
+    def records(self, indices) -> bytes:
+        """按doc_id密文顺序中的第indices个posting拼接成的定长记录"""
+        import numpy as np
+
+        if not indices:
+            return b""
+        mmap = self._index._mmap
+        order = np.frombuffer(
+            mmap, dtype="<u4", count=self._count, offset=self._order_offset
+        )
+        refs = np.frombuffer(
+            mmap, dtype="<u4", count=2 * self._count, offset=self._offset_in_file
+        ).reshape(-1, 2)
+        positions = order[np.asarray(indices, dtype=np.intp)]
+        return self._index._records_of(refs[positions])
+
+
+class MappedIndex:
+    """以mmap方式打开的二进制倒排索引
+
+    查询结果与pickle格式的 dict.get 一致，为 [(tf_enc, doc_id_enc), ...]。
+    """
+
+    def __init__(self, path):
+        import mmap
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse_header(path)
+        except ValueError:
+            self._mmap.close()
+            raise
+
+    def _parse_header(self, path):
+        magic, self.version = _PREFIX.unpack_from(self._mmap)
+        if magic != MAGIC or self.version not in (1, VERSION):
+            raise ValueError(f"Unsupported index format: {path}")
+
+        if self.version == 1:
+            _, _, key_size, posting_size, count = _HEADER_V1.unpack_from(self._mmap)
+            if key_size != KEY_SIZE or posting_size != POSTING_SIZE_V1:
+                raise ValueError(f"Unsupported index layout: {path}")
+            directory_start = _HEADER_V1.size
+            self._tf_count = self._doc_count = 0
+            flags = 0
+        else:
+            _, _, key_size, field_size, flags, count, tf_count, doc_count = (
+                _HEADER.unpack_from(self._mmap)
+            )
+            if key_size != KEY_SIZE or field_size != FIELD_SIZE:
+                raise ValueError(f"Unsupported index layout: {path}")
+            directory_start = _HEADER.size
+            self._tf_count, self._doc_count = tf_count, doc_count
+        # postings是否按词频降序排列
+        self.ranked = bool(flags & FLAG_RANKED)
+
+        self._count = count
+        self._directory_start = directory_start
+        self._keys = _DirectoryKeys(self._mmap, directory_start, count)
+        self._tf_start = directory_start + count * _ENTRY.size
+        self._doc_start = self._tf_start + self._tf_count * FIELD_SIZE
+        self._postings_start = self._doc_start + self._doc_count * FIELD_SIZE
+        # 文档序紧跟在postings之后，postings总数为最后一个目录条目的结束位置
+        self._order_start = None
+        if flags & FLAG_DOC_ORDER and count:
+            _, start, last_count = _ENTRY.unpack_from(
+                self._mmap, directory_start + (count - 1) * _ENTRY.size
+            )
+            total = start + last_count
+            self._order_start = self._postings_start + total * POSTING_SIZE
+        # 不同的词频只有几百个，常驻内存
+        tf_table = self._mmap[self._tf_start : self._doc_start]
+        self._tf_table = [
+            tf_table[i : i + FIELD_SIZE] for i in range(0, len(tf_table), FIELD_SIZE)
+        ]
+
+    def _lookup(self, token):
+        """返回token对应postings在文件中的(起始偏移, 数量)，不存在时返回None"""
+        from bisect import bisect_left
+
+        key = token_key(token)
+        i = bisect_left(self._keys, key)
+        if i == self._count or self._keys[i] != key:
+            return None
+        _, start, count = _ENTRY.unpack_from(
+            self._mmap, self._directory_start + i * _ENTRY.size
+        )
+        if self.version == 1:
+            return self._postings_start + start * POSTING_SIZE_V1, count
+        return self._postings_start + start * POSTING_SIZE, count
+
+    def _postings_at(self, offset, count):
+        if self.version == 1:
+            data = self._mmap[offset : offset + count * POSTING_SIZE_V1]
+            return [
+                (data[i : i + FIELD_SIZE], data[i + FIELD_SIZE : i + POSTING_SIZE_V1])
+                for i in range(0, len(data), POSTING_SIZE_V1)
+            ]
+        data = self._mmap[offset : offset + count * POSTING_SIZE]
+        tf_table = self._tf_table
+        doc_ciphertext = self.doc_ciphertext
+        return [
+            (tf_table[tf_ref], doc_ciphertext(doc_ref))
+            for tf_ref, doc_ref in _POSTING.iter_unpack(data)
+        ]
+
+    def items_by_key(self):
+        """按目录顺序产出(目录键, postings)，用于合并索引段"""
+        posting_size = POSTING_SIZE_V1 if self.version == 1 else POSTING_SIZE
+        for i in range(self._count):
+            key, start, count = _ENTRY.unpack_from(
+                self._mmap, self._directory_start + i * _ENTRY.size
+            )
+            yield key, self._postings_at(
+                self._postings_start + start * posting_size, count
+            )
+
+    def doc_ciphertext(self, ref: int) -> bytes:
+        """文档表中第ref个doc_id密文"""
+        start = self._doc_start + ref * FIELD_SIZE
+        return self._mmap[start : start + FIELD_SIZE]
+
+    def tf_ciphertext(self, ref: int) -> bytes:
+        """词频表中第ref个词频密文"""
+        return self._tf_table[ref]
+
+    def get_refs(self, token):
+        """返回token对应postings的(词频表序号, 文档表序号)数组，不复制数据
+
+        返回的数组引用mmap，释放之前不能调用close
+
+        Returns:
+            tuple[np.ndarray, np.ndarray] | None: 两个uint32数组，token不存在时返回None
+        """
+        import numpy as np
+
+        if self.version == 1:
+            raise ValueError("Posting references require index format version 2")
+        found = self._lookup(token)
+        if found is None:
+            return None
+        offset, count = found
+        refs = np.frombuffer(self._mmap, dtype="<u4", count=2 * count, offset=offset)
+        return refs[0::2], refs[1::2]
+
+    def get_records(self, token, offset: int = 0, limit: int | None = None):
+        """返回token的postings拼接成的 词频密文(16) || doc_id密文(16) 定长记录
+
+        与get的结果相同，但用NumPy按序号从side table中取出密文，不创建Python元组；
+        版本1的postings本身就是这种记录，直接切片返回。
+        ranked为True时只读取按词频排序的第[offset, offset+limit)个posting；
+        否则存储顺序与词频无关，总是返回全部记录，由可信端解密排序后再截取。
+
+        Returns:
+            bytes | None: token不存在时返回None
+        """
+        found = self._lookup(token)
+        if found is None:
+            return None
+        offset_in_file, count = found
+        if not self.ranked:
+            return self._records_at(offset_in_file, 0, count)
+        stop = count if limit is None else min(count, offset + limit)
+        return self._records_at(offset_in_file, min(offset, stop), stop)
+
+    def read_page(self, token, cursor=(0, 0), page_size: int = 1024):
+        """按存储顺序读取一页定长记录，用于分页和流式返回
+
+        Args:
+            cursor (tuple[int, int]): (段号, 段内posting序号)，单个索引文件的段号总是0
+
+        Returns:
+            tuple[bytes, tuple[int, int] | None]: 本页记录和下一页的游标，读完时游标为None
+        """
+        found = self._lookup(token)
+        if found is None:
+            return b"", None
+        offset_in_file, count = found
+        start = min(cursor[1], count)
+        stop = min(start + page_size, count)
+        next_cursor = (0, stop) if stop < count else None
+        return self._records_at(offset_in_file, start, stop), next_cursor
+
+    def _records_at(self, offset_in_file, start, stop) -> bytes:
+        """postings从offset_in_file开始的列表中第[start, stop)个posting的定长记录"""
+        import numpy as np
+
+        if self.version == 1:
+            begin = offset_in_file + start * POSTING_SIZE_V1
+            return self._mmap[begin : begin + (stop - start) * POSTING_SIZE_V1]
+        count = stop - start
+        if count == 0:
+            return b""
+        refs = np.frombuffer(
+            self._mmap,
+            dtype="<u4",
+            count=2 * count,
+            offset=offset_in_file + start * POSTING_SIZE,
+        )
+        return self._records_of(refs.reshape(-1, 2))
+
+    def _records_of(self, refs) -> bytes:
+        """按(词频表序号, 文档表序号)数组从side table中取出密文，拼接为定长记录"""
+        import numpy as np
+
+        field = f"V{FIELD_SIZE}"
+        tf_table = np.frombuffer(
+            self._mmap, dtype=field, count=self._tf_count, offset=self._tf_start
+        )
+        doc_table = np.frombuffer(
+            self._mmap, dtype=field, count=self._doc_count, offset=self._doc_start
+        )
+        records = np.empty((len(refs), 2), dtype=field)
+        records[:, 0] = tf_table[refs[:, 0]]
+        records[:, 1] = doc_table[refs[:, 1]]
+        del refs, tf_table, doc_table
+        return records.tobytes()
+
+    def doc_ordered(self, token):
+        """token的postings按doc_id密文排序的视图，用于posting_lists.intersect
+
+        有文档序时直接在mmap上二分查找，不读取整个posting列表；
+        没有文档序的旧索引返回定长记录，由intersect在查询时排序。
+
+        Returns:
+            _DocOrderedPostings | bytes: token不存在时为空
+        """
+        found = self._lookup(token)
+        if found is None:
+            return b""
+        if self._order_start is None:
+            return self.get_records(token)
+        offset_in_file, count = found
+        first = (offset_in_file - self._postings_start) // POSTING_SIZE
+        return _DocOrderedPostings(
+            self, offset_in_file, self._order_start + first * REF_SIZE, count
+        )
+
+    def posting_count(self, token) -> int:
+        """token的posting数，即其文档频率，token不存在时为0"""
+        found = self._lookup(token)
+        return 0 if found is None else found[1]
+
+    def intersect(self, tokens) -> list[bytes]:
+        """只保留doc_id出现在每个token结果中的postings，见posting_lists.intersect"""
+        from posting_lists import intersect
+
+        return intersect([self.doc_ordered(token) for token in tokens])
+
+    def lookup(self, token, doc_id_encs) -> bytes:
+        """token的postings中属于doc_id_encs的定长记录，见posting_lists.lookup"""
+        from posting_lists import lookup
+
+        return lookup(self.doc_ordered(token), doc_id_encs)
+
+    def get(self, token, default=None):
+        found = self._lookup(token)
+        if found is None:
+            return default
+        return self._postings_at(*found)
+
+    def __getitem__(self, token):
+        postings = self.get(token)
+        if postings is None:
+            raise KeyError(token)
+        return postings
+
+    def __contains__(self, token):
+        return self._lookup(token) is not None
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# 外存构建
+#
+# 倒排索引放不进内存时，按内存预算把 键(16) || 词频密文(16) || doc_id密文(16) 的记录
+# 按键稳定排序后写为临时的有序run文件，最后用heapq.merge对全部run做k路归并，
+# 边归并边写出索引文件。heapq.merge对相等的键保持run的先后顺序，
+# 因此每个关键词的postings仍按添加的顺序排列。
+
+_RUN_RECORD = struct.Struct(f"{KEY_SIZE}s{FIELD_SIZE}s{FIELD_SIZE}s")
+
+
+def _iter_run(path, block_size: int):
+    """按块读取run文件，逐条产出(键, 词频密文, doc_id密文)"""
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            yield from _RUN_RECORD.iter_unpack(block)
+
+
+class RunSpiller:
+    """按内存预算把postings排序后溢写到临时文件，最后归并为索引文件
+
+    接口与倒排索引字典的写入方式对应：add(token, postings)后调用write_index(path)。
+
+    Args:
+        memory_budget (int): 缓存记录和归并读取使用的内存字节数上限
+        tmp_dir (str | None): 存放临时run文件的目录，默认为系统临时目录
+        run_dir (str | None): 指定时run文件写入该目录且close后保留，
+            目录中已有的run文件会被沿用，用于从构建检查点恢复
+    """
+
+    def __init__(self, memory_budget: int, tmp_dir=None, run_dir=None):
+        import os
+        import tempfile
+
+        self.memory_budget = memory_budget
+        # 排序时需要一份同样大小的副本，缓存只用一半预算
+        self._run_size = max(memory_budget // 2, _RUN_RECORD.size)
+        self._dir = None
+        if run_dir is None:
+            self._dir = tempfile.TemporaryDirectory(prefix="index-runs-", dir=tmp_dir)
+            run_dir = self._dir.name
+        else:
+            os.makedirs(run_dir, exist_ok=True)
+        self.run_dir = run_dir
+        self._buffer = bytearray()
+        self._runs: list[str] = [
+            os.path.join(run_dir, f"run-{i}")
+            for i in range(
+                sum(1 for name in os.listdir(run_dir) if name.startswith("run-"))
+            )
+        ]
+
+    def add(self, token: bytes, postings):
+        """添加一个关键词的postings，同一关键词多次添加时按添加顺序拼接"""
+        key = token_key(token)
+        buffer = self._buffer
+        for tf_enc, doc_id_enc in postings:
+            if len(tf_enc) != FIELD_SIZE or len(doc_id_enc) != FIELD_SIZE:
+                raise ValueError(f"Posting fields must be {FIELD_SIZE} bytes")
+            buffer += key
+            buffer += tf_enc
+            buffer += doc_id_enc
+            if len(buffer) >= self._run_size:
+                self._spill()
+                buffer = self._buffer
+
+    def _spill(self):
+        """把缓存的记录按键稳定排序后写为一个run文件"""
+        import os
+        import numpy as np
+
+        if not self._buffer:
+            return
+        dtype = np.dtype([("key", f"S{KEY_SIZE}"), ("fields", f"V{2 * FIELD_SIZE}")])
+        records = np.frombuffer(self._buffer, dtype=dtype)
+        order = np.argsort(records["key"], kind="stable")
+        path = os.path.join(self.run_dir, f"run-{len(self._runs)}")
+        records[order].tofile(path)
+        self._runs.append(path)
+        del records, order
+        self._buffer = bytearray()
+
+    def flush(self):
+        """把缓存中的记录写为run文件"""
+        self._spill()
+
+    @property
+    def run_count(self) -> int:
+        return len(self._runs)
+
+    def write_index(self, path, ranked: bool = False):
+        """归并全部run并写出索引文件，结果与对等价字典调用write_index相同"""
+        import heapq
+        from itertools import groupby
+        from operator import itemgetter
+
+        self._spill()
+        # 归并时每个run各读取一块，合计不超过预算
+        run_count = max(len(self._runs), 1)
+        records_per_block = self.memory_budget // _RUN_RECORD.size // run_count
+        block_size = max(records_per_block, 1) * _RUN_RECORD.size
+        merged = heapq.merge(
+            *(_iter_run(run, block_size) for run in self._runs), key=itemgetter(0)
+        )
+        _write_entries(
+            path,
+            (
+                (key, ((tf_enc, doc_id_enc) for _, tf_enc, doc_id_enc in records))
+                for key, records in groupby(merged, key=itemgetter(0))
+            ),
+            ranked,
+        )
+
+    def close(self):
+        """删除临时run文件，指定了run_dir时保留"""
+        if self._dir is not None:
+            self._dir.cleanup()
+        self._runs.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# 追加段与删除记录
+#
+# 增量添加文档时不重写已有索引，而是把新文档的postings写为新的索引段；
+# 删除文档时只记录其doc_id密文（墓碑）。清单文件 <索引路径>.manifest 记录当前的
+# 段文件列表和墓碑，查询时按段的先后顺序拼接postings并过滤墓碑。
+# 清单整体替换写入，读取方总是看到一致的段列表。
+# 墓碑让服务器知道哪些doc_id密文已被删除，此外不泄露更多信息。
+# 修改清单的操作（追加段、删除、合并）通过 <索引路径>.lock 上的文件锁互斥。
+
+
+def manifest_path(path) -> str:
+    return f"{path}.manifest"
+
+
+def read_manifest(path) -> dict:
+    """读取索引清单，没有清单时索引只有path一个段
+
+    Returns:
+        dict: segments为段文件名列表（相对索引所在目录），tombstones为墓碑的十六进制列表，
+            next_segment为下一个段的编号
+    """
+    import json
+    import os
+
+    try:
+        with open(manifest_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {
+            "segments": [os.path.basename(path)],
+            "tombstones": [],
+            "next_segment": 1,
+        }
+
+
+@contextmanager
+def _manifest_lock(path):
+    import fcntl
+
+    with open(f"{path}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _write_manifest(path, manifest):
+    import json
+    import os
+
+    tmp_path = f"{manifest_path(path)}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path(path))
+
+
+def _segment_file(path, name) -> str:
+    import os
+
+    return os.path.join(os.path.dirname(path), name)
+
+
+def append_segment(path, inverted_index, ranked: bool = False) -> str:
+    """把新文档的倒排索引写为一个追加段
+
+    Args:
+        path (str): 索引路径，即首次构建时写入的索引文件
+        inverted_index (Mapping[bytes, list[tuple[bytes, bytes]]] | RunSpiller):
+            新文档的倒排索引
+        ranked (bool): postings已按词频降序排列
+
+    Returns:
+        str: 新段的文件路径
+    """
+    import os
+
+    with _manifest_lock(path):
+        manifest = read_manifest(path)
+        number = manifest["next_segment"]
+        segment_path = f"{path}.{number}"
+        if isinstance(inverted_index, RunSpiller):
+            inverted_index.write_index(segment_path, ranked)
+        else:
+            write_index(segment_path, inverted_index, ranked)
+        manifest["segments"].append(os.path.basename(segment_path))
+        manifest["next_segment"] = number + 1
+        _write_manifest(path, manifest)
+    return segment_path
+
+
+def add_tombstones(path, doc_id_encs):
+    """记录被删除文档的doc_id密文，查询结果中不再包含这些文档"""
+    with _manifest_lock(path):
+        manifest = read_manifest(path)
+        tombstones = dict.fromkeys(manifest["tombstones"])
+        tombstones.update(dict.fromkeys(d.hex() for d in doc_id_encs))
+        manifest["tombstones"] = list(tombstones)
+        _write_manifest(path, manifest)
+
+
+def remove_segments(path):
+    """删除清单和除path以外的全部段文件，重新完整构建索引后调用"""
+    import os
+
+    if not os.path.exists(manifest_path(path)):
+        return
+    with _manifest_lock(path):
+        segments = read_manifest(path)["segments"]
+        os.remove(manifest_path(path))
+        for name in segments:
+            segment_path = _segment_file(path, name)
+            if os.path.abspath(segment_path) != os.path.abspath(path):
+                os.remove(segment_path)
+
+
+def compact(
+    path, min_segments: int = 2, tf_value=None, keep_ranked: bool = False
+) -> bool:
+    """把全部段合并为path一个文件，同时丢弃墓碑对应的postings
+
+    各段按目录键升序产出postings，用heapq.merge做k路归并后边归并边写出，
+    内存占用与RunSpiller.write_index相同，不需要把整个索引读入内存。
+    合并结果先写为新的段并替换清单，再替换path并删除清单，最终与完整重建后
+    调用remove_segments的状态相同；旧段在替换path之前删除，仍按旧清单打开的读取方
+    只会找不到文件，不会把合并结果与旧段重复拼接。
+    服务器不知道明文词频，无法按词频合并多个段：不传入tf_value时，合并结果只有在
+    原来仅有一个按词频排序的段时才保留FLAG_RANKED，否则带偏移量的查询退化为
+    返回候选记录。数据拥有者传入tf_value（见EncryptedIndexBuilder.compact_index）时，
+    各段按词频降序的posting列表做k路归并，合并结果与完整重建一样按词频排序。
+    keep_ranked为True时，合并会使按词频排序的索引失去FLAG_RANKED则不合并并抛出
+    ValueError，供服务器端的后台合并使用。
+
+    Args:
+        path (str): 索引路径
+        min_segments (int): 段数少于该值且没有墓碑时不合并
+        tf_value (Callable[[bytes], int] | None): 返回词频密文对应的明文词频
+        keep_ranked (bool): 不允许合并结果失去FLAG_RANKED
+
+    Returns:
+        bool: 是否进行了合并
+
+    Raises:
+        ValueError: keep_ranked为True且合并会失去FLAG_RANKED
+    """
+    import heapq
+    import os
+    from itertools import groupby
+    from operator import itemgetter
+
+    with _manifest_lock(path):
+        manifest = read_manifest(path)
+        if len(manifest["segments"]) < min_segments and not manifest["tombstones"]:
+            return False
+
+        tombstones = {bytes.fromhex(t) for t in manifest["tombstones"]}
+        segments = [
+            _open_segment(_segment_file(path, name)) for name in manifest["segments"]
+        ]
+        all_ranked = all(
+            isinstance(segment, MappedIndex) and segment.ranked for segment in segments
+        )
+        ranked = all_ranked and (len(segments) == 1 or tf_value is not None)
+
+        def merge_postings(items):
+            lists = [postings for _, postings in items]
+            if ranked and len(lists) > 1:
+                # 词频相同时保持段的先后顺序，与完整重建时按文档顺序排列一致
+                postings = heapq.merge(*lists, key=lambda p: -tf_value(p[0]))
+            else:
+                postings = (posting for postings in lists for posting in postings)
+            return (posting for posting in postings if posting[1] not in tombstones)
+
+        number = manifest["next_segment"]
+        segment_path = f"{path}.{number}"
+        try:
+            if keep_ranked and all_ranked and not ranked:
+                raise ValueError(
+                    f"Compacting {len(segments)} ranked segments without tf values "
+                    "would drop FLAG_RANKED; compact as the data owner instead"
+                )
+            # heapq.merge对相等的键保持段的先后顺序
+            merged = heapq.merge(
+                *(_items_by_key(segment) for segment in segments), key=itemgetter(0)
+            )
+            _write_entries(
+                segment_path,
+                (
+                    (key, merge_postings(items))
+                    for key, items in groupby(merged, key=itemgetter(0))
+                ),
+                ranked,
+            )
+        finally:
+            for segment in segments:
+                if isinstance(segment, MappedIndex):
+                    segment.close()
+
+        _write_manifest(
+            path,
+            {
+                "segments": [os.path.basename(segment_path)],
+                "tombstones": [],
+                "next_segment": number + 1,
+            },
+        )
+        for name in manifest["segments"]:
+            if os.path.abspath(_segment_file(path, name)) != os.path.abspath(path):
+                os.remove(_segment_file(path, name))
+        # 通过硬链接替换path，替换过程中清单引用的段文件始终存在
+        os.link(segment_path, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        os.remove(manifest_path(path))
+        os.remove(segment_path)
+    return True
+
+
+def _items_by_key(segment):
+    """按目录键升序产出一个段的(目录键, postings)"""
+    from operator import itemgetter
+
+    if isinstance(segment, MappedIndex):
+        return segment.items_by_key()
+    # 旧的pickle格式段本来就完整加载在内存中
+    return iter(
+        sorted(
+            ((token_key(token), postings) for token, postings in segment.items()),
+            key=itemgetter(0),
+        )
+    )
+
+
+def _join_records(postings) -> bytes:
+    """把 [(tf_enc, doc_id_enc), ...] 拼接为定长记录"""
+    return b"".join(tf_enc + doc_id_enc for tf_enc, doc_id_enc in postings)
+
+
+class SegmentedIndex:
+    """按清单打开的多段倒排索引，查询时合并各段的postings并过滤墓碑"""
+
+    def __init__(self, path):
+        manifest = read_manifest(path)
+        self._segments = [
+            _open_segment(_segment_file(path, name)) for name in manifest["segments"]
+        ]
+        self._tombstones = frozenset(bytes.fromhex(t) for t in manifest["tombstones"])
+
+    def get(self, token, default=None):
+        """按段的先后顺序拼接各段的postings并过滤墓碑
+
+        每个段内按该段存储的顺序排列（按词频排序的段为词频降序），
+        拼接结果整体既不按doc_id也不按词频有序，排序由可信端解密后完成。
+        """
+        postings = None
+        for segment in self._segments:
+            found = segment.get(token)
+            if found is not None:
+                postings = found if postings is None else postings + found
+        if postings is None:
+            return default
+        if self._tombstones:
+            postings = [p for p in postings if p[1] not in self._tombstones]
+        return postings
+
+    @property
+    def ranked(self) -> bool:
+        """只有一个按词频排序的段时，合并结果才按词频排序"""
+        return (
+            len(self._segments) == 1
+            and isinstance(self._segments[0], MappedIndex)
+            and self._segments[0].ranked
+        )
+
+    def get_records(self, token, offset: int = 0, limit: int | None = None):
+        """合并各段postings的定长记录并过滤墓碑，见MappedIndex.get_records
+
+        ranked为False时服务器无法在段之间按词频合并，返回包含结果的候选记录：
+        按词频排序的段取过滤后的前offset+limit条，其余段取全部，
+        由可信端解密排序后再跳过offset条。
+        """
+        end = None if limit is None else offset + limit
+        parts = []
+        for segment in self._segments:
+            found = self._segment_records(segment, token, end)
+            if found is not None:
+                parts.append(found)
+        if not parts:
+            return None
+        records = b"".join(parts)
+        if self.ranked:
+            records = records[offset * 2 * FIELD_SIZE :]
+        return records
+
+    def read_page(self, token, cursor=(0, 0), page_size: int = 1024):
+        """按段的先后顺序分页读取过滤墓碑后的记录，游标与返回值见MappedIndex.read_page
+
+        墓碑过滤后一页可能少于page_size条，但只在读完时才返回None游标。
+        """
+        number, position = cursor
+        records = b""
+        while number < len(self._segments) and not records:
+            segment = self._segments[number]
+            if isinstance(segment, MappedIndex):
+                records, next_cursor = segment.read_page(
+                    token, (0, position), page_size
+                )
+            else:
+                postings = segment.get(token) or []
+                stop = min(position + page_size, len(postings))
+                records = _join_records(postings[position:stop])
+                next_cursor = (0, stop) if stop < len(postings) else None
+            records = self._drop_tombstones(records)
+            if next_cursor is None:
+                number, position = number + 1, 0
+            else:
+                position = next_cursor[1]
+        if number >= len(self._segments):
+            return records, None
+        return records, (number, position)
+
+    def intersect(self, tokens) -> list[bytes]:
+        """只保留doc_id出现在每个token结果中的postings，并过滤墓碑
+
+        每个文档只在添加它的段中被索引，因此各段分别求交集后按段拼接即为整体的交集；
+        结果在每个段内按doc_id密文排序。
+        """
+        from posting_lists import intersect
+
+        parts = [[] for _ in tokens]
+        for segment in self._segments:
+            if isinstance(segment, MappedIndex):
+                lists = [segment.doc_ordered(token) for token in tokens]
+            else:
+                lists = [_join_records(segment.get(token) or []) for token in tokens]
+            for part, records in zip(parts, intersect(lists)):
+                part.append(self._drop_tombstones(records))
+        return [b"".join(part) for part in parts]
+
+    def lookup(self, token, doc_id_encs) -> bytes:
+        """各段token的postings中属于doc_id_encs的定长记录，过滤墓碑后按段拼接"""
+        from posting_lists import lookup
+
+        doc_id_encs = list(doc_id_encs)
+        parts = []
+        for segment in self._segments:
+            if isinstance(segment, MappedIndex):
+                records = segment.doc_ordered(token)
+            else:
+                records = _join_records(segment.get(token) or [])
+            parts.append(self._drop_tombstones(lookup(records, doc_id_encs)))
+        return b"".join(parts)
+
+    def posting_count(self, token) -> int:
+        """token过滤墓碑后的posting数，即其文档频率
+
+        每个文档在一个posting列表中只出现一次，在各段的文档序上逐个查找墓碑即可，
+        不读取整个posting列表。
+        """
+        from bisect import bisect_left
+        from posting_lists import doc_keys
+
+        total = 0
+        for segment in self._segments:
+            if not isinstance(segment, MappedIndex):
+                postings = segment.get(token) or []
+                total += sum(1 for p in postings if p[1] not in self._tombstones)
+                continue
+            count = segment.posting_count(token)
+            if count and self._tombstones:
+                keys = doc_keys(segment.doc_ordered(token))
+                for doc_id_enc in self._tombstones:
+                    i = bisect_left(keys, doc_id_enc)
+                    if i < len(keys) and keys[i] == doc_id_enc:
+                        count -= 1
+            total += count
+        return total
+
+    def _drop_tombstones(self, records):
+        import numpy as np
+
+        if not self._tombstones or not records:
+            return records
+        # 定长的S类型比较时忽略末尾的0字节，两边长度相同，结果与逐字节比较一致
+        pairs = np.frombuffer(records, dtype=f"S{FIELD_SIZE}").reshape(-1, 2)
+        tombstones = np.array(list(self._tombstones), dtype=f"S{FIELD_SIZE}")
+        return pairs[~np.isin(pairs[:, 1], tombstones)].tobytes()
+
+    def _segment_records(self, segment, token, end):
+        """一个段中过滤墓碑后的定长记录，段按词频排序时只取前end条"""
+        ranked = isinstance(segment, MappedIndex) and segment.ranked
+        if isinstance(segment, MappedIndex):
+            # 墓碑最多过滤掉len(tombstones)条，多读取这些条即可
+            limit = None if end is None else end + len(self._tombstones)
+            records = segment.get_records(token, 0, limit)
+        else:
+            postings = segment.get(token)
+            records = None if postings is None else _join_records(postings)
+        if records is None:
+            return None
+        records = self._drop_tombstones(records)
+        if ranked and end is not None:
+            records = records[: end * 2 * FIELD_SIZE]
+        return records
+
+    def __getitem__(self, token):
+        postings = self.get(token)
+        if postings is None:
+            raise KeyError(token)
+        return postings
+
+    def __contains__(self, token):
+        return any(token in segment for segment in self._segments)
+
+    @property
+    def segment_count(self) -> int:
+        return len(self._segments)
+
+    def close(self):
+        for segment in self._segments:
+            if isinstance(segment, MappedIndex):
+                segment.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Binary inverted index tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compact_parser = subparsers.add_parser(
+        "compact", help="Merge appended index segments and drop deleted documents"
+    )
+    compact_parser.add_argument("index_path", help="e.g. index.bin")
+    compact_parser.add_argument(
+        "--min_segments",
+        type=int,
+        default=4,
+        help="Only compact once at least this many segments have accumulated",
+    )
+    compact_parser.add_argument(
+        "--interval",
+        type=float,
+        default=0,
+        help="Keep running and check every this many seconds",
+    )
+    compact_parser.add_argument(
+        "--allow_unranked",
+        action="store_true",
+        help="Merge ranked segments even though the result loses its tf order "
+        "(top-k queries then read whole posting lists); without this flag the "
+        "data owner must compact with compact_index.py --key_file",
+    )
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        import sys
+        import time
+
+        while True:
+            # 服务器没有密钥，合并多个按词频排序的段会使带偏移量的查询退化为返回候选记录
+            try:
+                compacted = compact(
+                    args.index_path,
+                    args.min_segments,
+                    keep_ranked=not args.allow_unranked,
+                )
+            except ValueError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                print(
+                    "Run python compact_index.py --key_file <keys> as the data owner, "
+                    "or pass --allow_unranked",
+                    file=sys.stderr,
+                )
+                sys.exit(1)
+            if compacted:
+                print(f"Compacted {args.index_path}")
+            if args.interval <= 0:
+                break
+            time.sleep(args.interval)
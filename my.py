@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 
 
 def serialize_shares(shares):
@@ -23,113 +24,841 @@ def generate_key(key_length=128):
     return get_random_bytes(key_length // 8)  # AES-128
 
 
-# 加密文档内容
-def encrypt_doc(data, key):
+# 每个密钥只创建一个GCM加解密器，避免每次调用重复密钥扩展
+@lru_cache(maxsize=16)
+def gcm_cipher(key):
     import enc_rust
 
-    return enc_rust.aes_gcm_encrypt(key, data)
+    return enc_rust.GcmCipher(key)
 
 
-# 解密文档内容
-def decrypt_doc(encrypted_data, key):
+# 加密文档内容；指定compression（"zlib"或"lzma"）时先压缩再加密，zdict为zlib预设字典
+def encrypt_doc(data, key, compression=None, zdict=None):
+    if compression is None:
+        return gcm_cipher(key).encrypt_buffer(_as_bytes(data))
+    import doc_codec
+
+    codec = doc_codec.codec_id(compression, zdict)
+    payload = doc_codec.compress(_as_bytes(data), codec, zdict)
+    return doc_codec.header(codec) + gcm_cipher(key).encrypt_buffer(payload)
+
+
+# 批量加密文档内容，每批只生成一次随机nonce前缀，返回与输入顺序一致的密文列表
+def encrypt_docs(datas, key, parallel=False, compression=None, zdict=None):
+    from encrypt_keyword import split_packed
+
+    datas = list(datas)
+    prefix = b""
+    if compression is not None:
+        import doc_codec
+
+        codec = doc_codec.codec_id(compression, zdict)
+        datas = [doc_codec.compress(_as_bytes(d), codec, zdict) for d in datas]
+        prefix = doc_codec.header(codec)
+    ciphertexts, offsets = gcm_cipher(key).encrypt_many(datas, parallel)
+    return [prefix + c for c in split_packed(ciphertexts, offsets)]
+
+
+def _as_bytes(data):
+    return data.encode() if isinstance(data, str) else data
+
+
+# 解密文档内容，支持单次加密、分段加密以及压缩后加密的格式
+def decrypt_doc(encrypted_data, key, zdict=None):
+    return decrypt_doc_bytes(encrypted_data, key, zdict).decode()
+
+
+# 解密文档内容，返回原始字节；encrypted_data可以是bytes、memoryview、mmap等任意缓冲区对象
+def decrypt_doc_bytes(encrypted_data, key, zdict=None):
+    import doc_codec
+
+    codec = doc_codec.read_codec(encrypted_data)
+    if codec is not None:
+        payload = memoryview(encrypted_data)[doc_codec.HEADER_LEN :]
+        if is_stream_doc(payload):
+            return doc_codec.decompress(decrypt_doc_stream(payload, key), codec, zdict)
+        try:
+            payload = gcm_cipher(key).decrypt_buffer(payload)
+        except ValueError:
+            pass  # 未压缩密文的随机nonce恰好以压缩格式的魔数开头
+        else:
+            return doc_codec.decompress(payload, codec, zdict)
+    return _decrypt_uncompressed(encrypted_data, key)
+
+
+def _decrypt_uncompressed(encrypted_data, key):
+    # 文件头有效时按分段格式解密，截断或篡改的密文直接抛出分段认证的错误
+    if is_stream_doc(encrypted_data):
+        return decrypt_doc_stream(encrypted_data, key)
+    return gcm_cipher(key).decrypt_buffer(encrypted_data)
+
+
+# UTF-8编码后超过该字节数的文档使用分段加密格式，解密时可以逐段输出
+STREAM_CHUNK_SIZE = 1 << 16
+
+
+def is_stream_doc(encrypted_data):
+    """密文是否以分段加密格式的文件头开头
+
+    文件头为 魔数(4) || 版本(1) || 明文分段长度(4, 大端) || nonce前缀(7)，
+    除魔数外还校验版本和分段长度。单次加密格式的随机nonce通过全部校验的概率
+    可以忽略，因此文件头有效的密文只按分段格式解密，不再回退。
+    不足一个文件头但以魔数开头的密文不可能是单次加密格式，视为被截断的分段密文。
+    """
+    import enc_rust
+
+    header = bytes(encrypted_data[: enc_rust.STREAM_HEADER_LEN])
+    if header[: len(enc_rust.STREAM_MAGIC)] != enc_rust.STREAM_MAGIC:
+        return False
+    if len(header) < enc_rust.STREAM_HEADER_LEN:
+        return True
+    chunk_size = int.from_bytes(header[5:9], "big")
+    return (
+        header[4] == enc_rust.STREAM_VERSION
+        and 0 < chunk_size <= enc_rust.STREAM_MAX_CHUNK_SIZE
+    )
+
+
+def encrypt_doc_stream(
+    data, key, chunk_size=STREAM_CHUNK_SIZE, compression=None, zdict=None
+):
+    """使用分段加密格式加密文档内容
+
+    Args:
+        data (str | bytes): 文档内容
+        key (bytes): 16字节的文件密钥
+        chunk_size (int): 每段明文的字节数
+        compression (str | None): 加密前使用的压缩算法，"zlib"或"lzma"
+        zdict (bytes | None): zlib预设字典
+
+    Returns:
+        bytes: [压缩格式头 ||] 文件头 || 各段(密文 || tag)
+    """
+    return b"".join(iter_encrypt_doc([data], key, chunk_size, compression, zdict))
+
+
+def decrypt_doc_stream(encrypted_data, key):
+    """解密分段加密格式的完整密文，返回原始字节"""
+    import enc_rust
+
+    decryptor = enc_rust.StreamDecryptor(key)
+    return decryptor.update(encrypted_data) + decryptor.finalize()
+
+
+def iter_encrypt_doc(
+    chunks, key, chunk_size=STREAM_CHUNK_SIZE, compression=None, zdict=None
+):
+    """逐块加密明文，产出分段加密格式的密文块
+
+    Args:
+        chunks (Iterable[str | bytes]): 依次输入的明文块，长度不必与chunk_size对齐
+        key (bytes): 16字节的文件密钥
+        chunk_size (int): 每段明文的字节数
+        compression (str | None): 加密前使用的压缩算法，"zlib"或"lzma"
+        zdict (bytes | None): zlib预设字典
+
+    Yields:
+        bytes: 密文块，依次拼接即为完整密文
+    """
+    import enc_rust
+
+    chunks = map(_as_bytes, chunks)
+    if compression is not None:
+        import doc_codec
+
+        codec = doc_codec.codec_id(compression, zdict)
+        yield doc_codec.header(codec)
+        chunks = _iter_compressed(chunks, doc_codec.compressor(codec, zdict))
+
+    encryptor = enc_rust.StreamEncryptor(key, chunk_size)
+    for chunk in chunks:
+        if out := encryptor.update(chunk):
+            yield out
+    yield encryptor.finalize()
+
+
+def _iter_compressed(chunks, compressor):
+    for chunk in chunks:
+        if out := compressor.compress(chunk):
+            yield out
+    yield compressor.flush()
+
+
+def iter_decrypt_doc(chunks, key, zdict=None):
+    """逐块解密文档密文，每段认证通过后立即产出明文，内存占用不随文档大小增长
+
+    单次加密格式的密文无法分段认证，会在读完全部密文后一次性产出。
+    最后一段认证失败时已产出的明文仍然可信，但调用方需要把异常视为文档不完整。
+    压缩后加密的文档边解密边解压。
+
+    Args:
+        chunks (Iterable[bytes]): 依次到达的密文块，例如HTTP响应体
+        key (bytes): 16字节的文件密钥
+        zdict (bytes | None): 压缩时使用的zlib预设字典
+
+    Yields:
+        bytes: 明文块
+    """
+    from itertools import chain
+    import doc_codec
     import enc_rust
 
-    return enc_rust.aes_gcm_decrypt(key, encrypted_data)
+    chunks = iter(chunks)
+    head = bytearray()
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= doc_codec.HEADER_LEN + enc_rust.STREAM_HEADER_LEN:
+            break
+
+    codec = doc_codec.read_codec(head)
+    if codec is None:
+        yield from _iter_decrypt_uncompressed(chain([bytes(head)], chunks), key)
+    elif is_stream_doc(head[doc_codec.HEADER_LEN :]):
+        decompressor = doc_codec.Decompressor(codec, zdict)
+        payload = chain([bytes(head[doc_codec.HEADER_LEN :])], chunks)
+        for out in _iter_decrypt_uncompressed(payload, key):
+            if out := decompressor.decompress(out):
+                yield out
+        yield decompressor.flush()
+    else:
+        # 单次加密的压缩文档需要完整密文
+        for chunk in chunks:
+            head += chunk
+        yield decrypt_doc_bytes(bytes(head), key, zdict)
+
+
+def _iter_decrypt_uncompressed(chunks, key):
+    import enc_rust
+
+    chunks = iter(chunks)
+    # 读取到完整的文件头后再判断格式
+    head = bytearray()
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= enc_rust.STREAM_HEADER_LEN:
+            break
+
+    if is_stream_doc(head):
+        # 认证失败时直接抛出，不按单次加密格式重试
+        decryptor = enc_rust.StreamDecryptor(key)
+        if out := decryptor.update(head):
+            yield out
+        del head
+        for chunk in chunks:
+            if out := decryptor.update(chunk):
+                yield out
+        yield decryptor.finalize()
+        return
+
+    for chunk in chunks:
+        head += chunk
+    yield _decrypt_uncompressed(bytes(head), key)
 
 
 word_pattern = re.compile(r"\b[\w-]+\b")
 
 
-# 将文档处理提取为独立函数以支持多进程
-def process_document(idx, doc, file_key):
+def count_words(text: str) -> dict[str, int]:
+    """统计文本中每个单词（word_pattern匹配的小写单词）的出现次数
+
+    ASCII文本由enc_rust.count_terms在一次遍历中完成小写化、分词和计数（释放GIL）；
+    Rust与Python对Unicode字母数字的判断不完全一致，其他文本仍使用正则表达式。
+    """
+    if text.isascii():
+        import enc_rust
+
+        return enc_rust.count_terms(text)
     from collections import Counter
 
+    return Counter(word_pattern.findall(text.lower()))
+
+
+def count_words_many(texts) -> list[dict[str, int]]:
+    """批量统计多段文本的单词出现次数，ASCII文本整批交给Rust统计"""
+    import enc_rust
+
+    texts = list(texts)
+    ascii_texts = [text for text in texts if text.isascii()]
+    ascii_counts = iter(enc_rust.count_terms_many(ascii_texts))
+    return [
+        next(ascii_counts) if text.isascii() else count_words(text) for text in texts
+    ]
+
+
+# 将文档处理提取为独立函数以支持多进程
+def process_document(idx, doc, file_key):
     doc_content = doc["title"] + " " + doc["text"]
-    word_counts = Counter(word_pattern.findall(doc_content.lower()))
+    word_counts = count_words(doc_content)
     encrypted = encrypt_doc(doc_content, file_key)
     return idx, word_counts, encrypted
 
 
+# 近似选择关键词时工作进程使用的(CountMinSketch, threshold)，由进程池的initializer设置
+_candidate_filter = None
+
+
+def _set_candidate_filter(candidate_filter):
+    global _candidate_filter
+    _candidate_filter = candidate_filter
+
+
+def sketch_document_batch(batch, width, depth):
+    """在工作进程中统计一批文档的单词，返回Count-Min Sketch的增量"""
+    from collections import Counter
+    from count_min_sketch import sketch_updates
+
+    word_counts = Counter()
+    for counts in count_words_many(doc["title"] + " " + doc["text"] for doc in batch):
+        word_counts.update(counts)
+    return sketch_updates(word_counts, width, depth)
+
+
+def process_document_batch(batch, file_key, file_dir, compression=None, zdict=None):
+    """在工作进程中处理一批(idx, doc)，并直接将密文追加到file_dir中本进程的段文件
+
+    只把词频统计和密文位置返回给父进程，避免密文经进程间通信再复制一遍。
+    设置了候选词过滤时，词频统计只保留Sketch估计值超过threshold的单词。
+
+    compression/zdict为加密前使用的压缩算法和zlib预设字典，为空时不压缩。
+
+    Returns:
+        list[tuple]: 每个文档的(idx, 词频统计, (段号, 偏移, 长度))
+    """
+    from doc_store import append_documents
+
+    contents = [doc["title"] + " " + doc["text"] for _, doc in batch]
+    # 只编码一次，按UTF-8字节数判断是否超过一段
+    payloads = [content.encode() for content in contents]
+    # 超过一段的大文档使用分段加密格式，读取时可以边解密边输出
+    is_large = [len(payload) > STREAM_CHUNK_SIZE for payload in payloads]
+    # 其余文档整批一次加密；工作进程本身已并行，这里不再开启Rust侧的线程池
+    small = iter(
+        encrypt_docs(
+            [p for p, large in zip(payloads, is_large) if not large],
+            file_key,
+            compression=compression,
+            zdict=zdict,
+        )
+    )
+    encrypted = [
+        (
+            encrypt_doc_stream(p, file_key, compression=compression, zdict=zdict)
+            if large
+            else next(small)
+        )
+        for p, large in zip(payloads, is_large)
+    ]
+    del payloads
+    # 整批密文一次写入
+    locations = append_documents(file_dir, encrypted)
+    word_counts = count_words_many(contents)
+    if _candidate_filter is not None:
+        sketch, threshold = _candidate_filter
+        keep = set(sketch.candidates(set().union(*word_counts), threshold))
+        word_counts = [
+            {word: n for word, n in counts.items() if word in keep}
+            for counts in word_counts
+        ]
+    return [
+        (idx, counts, location)
+        for (idx, _), counts, location in zip(batch, word_counts, locations)
+    ]
+
+
+# 文档目录中加密保存的词频统计
+TERM_COUNTS_NAME = "term_counts.bin"
+
+
+def save_term_counts(file_dir, term_counts, key, min_threshold=None):
+    """把词频统计保存在文档目录中，修改threshold时不必重新分词即可重建索引
+
+    词频统计包含明文单词，而文档目录会交给云服务器，因此用文件密钥压缩后分段加密。
+
+    Args:
+        min_threshold (int | None): 近似选择关键词时统计只保留了Sketch估计值超过
+            该threshold的候选词，只能按不低于它的threshold重建；为空时统计完整
+    """
+    import io
+    import os
+    import numpy as np
+
+    arrays = term_counts.to_arrays()
+    if min_threshold is not None:
+        arrays["min_threshold"] = np.array(min_threshold, dtype=np.int64)
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    path = os.path.join(file_dir, TERM_COUNTS_NAME)
+    with open(f"{path}.tmp", "wb") as f:
+        for chunk in iter_encrypt_doc([buffer.getbuffer()], key, compression="zlib"):
+            f.write(chunk)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_term_counts(file_dir, key):
+    """读取save_term_counts保存的词频统计
+
+    Returns:
+        tuple[TermCounts, int | None] | None: 词频统计和保存时的min_threshold，
+            没有保存词频统计时返回None
+    """
+    import io
+    import os
+    import numpy as np
+    from term_counts import TermCounts
+
+    try:
+        with open(os.path.join(file_dir, TERM_COUNTS_NAME), "rb") as f:
+            encrypted = f.read()
+    except FileNotFoundError:
+        return None
+    with np.load(io.BytesIO(decrypt_doc_bytes(encrypted, key))) as arrays:
+        min_threshold = (
+            int(arrays["min_threshold"]) if "min_threshold" in arrays else None
+        )
+        return TermCounts.from_arrays(arrays), min_threshold
+
+
+def parse_max_df(value: str) -> float | int:
+    """命令行中的文档频率上限：带小数点时为比例，否则为文档数"""
+    return float(value) if "." in value else int(value)
+
+
+def read_stopwords(path) -> list[str]:
+    """读取以空白分隔的停用词文件"""
+    with open(path) as f:
+        return f.read().split()
+
+
+def batched(iterable, n: int):
+    """将可迭代对象按n个一组切分为列表"""
+    from itertools import islice
+
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, n)):
+        yield batch
+
+
+def imap_bounded(pool, func, iterable, max_pending: int):
+    """按顺序返回pool中func的结果，同时最多只有max_pending个任务在途
+
+    Pool.imap会在后台线程中一次性消费完整个输入，因此无法限制内存占用；
+    这里只在取回一个结果后才提交下一个任务。
+    """
+    from collections import deque
+
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
 # 构建加密索引
 class EncryptedIndexBuilder:
-    def __init__(self, file_key, index_key, dataset_path, threshold=10):
+    def __init__(
+        self,
+        file_key,
+        index_key,
+        dataset_path,
+        threshold=10,
+        batch_size=256,
+        max_pending_batches: int | None = None,
+        compression: str | None = None,
+        zdict_samples: int = 0,
+        memory_budget: int | None = None,
+        spill_dir: str | None = None,
+        checkpoint_dir: str | None = None,
+        checkpoint_interval: int = 1 << 14,
+        sketch_width: int | None = None,
+        sketch_depth: int = 4,
+        max_df: float | int | None = None,
+        stopwords=None,
+        min_token_length: int = 1,
+        max_token_length: int | None = None,
+    ):
         from collections import defaultdict
+        import os
+        from term_counts import TermCounts, TermTotals
 
         self.file_key = file_key
         self.index_key = index_key
         self.inverted_index = defaultdict(list)
-        self.words_appearance_time = defaultdict(int)  # 记录每个关键词出现的次数
-        self.word_appearance_time_per_doc = defaultdict(
-            lambda: defaultdict(int)
-        )  # 记录每个关键词出现在每个文档中的次数
+        self.words_appearance_time = TermTotals()  # 记录每个关键词出现的次数
+        # 记录每个关键词出现在每个文档中的次数，单词映射为整数id后按CSR格式存储
+        self.term_counts = TermCounts()
         self.dataset_path = dataset_path
         self.threshold = threshold
         self.keywords_list = set()
+        # 每个进程池任务包含的文档数，以及同时在途的任务数上限
+        self.batch_size = batch_size
+        self.max_pending_batches = max_pending_batches or 2 * (os.cpu_count() or 1)
+        # 加密前的压缩算法（"zlib"/"lzma"），以及训练zlib预设字典使用的样本文档数
+        self.compression = compression
+        self.zdict_samples = zdict_samples
+        # 设置内存预算（字节）时，postings按预算溢写到spill_dir下的有序临时文件，
+        # dump_index时再归并写出，不在内存中保存完整的inverted_index
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.index_runs = None
+        # 构建检查点目录，以及每个检查点块包含的文档数
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_interval = checkpoint_interval
+        # 设置sketch_width时近似选择关键词：先用Count-Min Sketch统计一遍，
+        # 加密时只记录估计值超过threshold的候选词，再精确统计候选词得到关键词
+        self.sketch_width = sketch_width
+        self.sketch_depth = sketch_depth
+        # 词表剪枝：文档频率上限（浮点数为比例，整数为文档数）、停用词和单词长度范围
+        self.max_df = max_df
+        self.stopwords = frozenset(w.lower() for w in stopwords or ())
+        self.min_token_length = min_token_length
+        self.max_token_length = max_token_length
+        self.pruning_report = None
+
+    @property
+    def word_appearance_time_per_doc(self):
+        """文档级词频记录，结构为 {docid: {word: count}} 的只读视图"""
+        return self.term_counts
+
+    @word_appearance_time_per_doc.setter
+    def word_appearance_time_per_doc(self, value):
+        from term_counts import TermCounts
+
+        if not isinstance(value, TermCounts):
+            value = TermCounts.from_mapping(value)
+        self.term_counts = value
+
+    def iter_documents(self, count: int | None = None):
+        """流式产出数据集中的文档，支持JSON数组/JSONL及gzip/xz压缩格式"""
+        import document_loader
+
+        return document_loader.iter_documents(self.dataset_path, count)
 
     def load_documents(self, count: int | None = None):
-        import json
-
-        documents = []
-        with open(self.dataset_path, "r") as f:
-            try:
-                # 尝试解析为JSON数组
-                return json.load(f)
-            except json.JSONDecodeError:
-                # 回退到逐行解析模式
-                f.seek(0)
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        documents.append(json.loads(line))
-                    except json.JSONDecodeError as e:
-                        print(f"Error parsing line {line_num}: {e}")
-
-        if count:
-            documents = documents[:count]
-        return documents
+        return list(self.iter_documents(count))
 
     def process_whole_document_set(self, file_dir: str, load_count: int | None = None):
+        """加密整个数据集并构建倒排索引
+
+        设置了checkpoint_dir时，各阶段的输出保存为检查点（见build_checkpoint），
+        中断后用相同的参数和密钥重新调用会跳过已完成的文档块和阶段。
+        """
         import shutil
         import os
         import gc
-        import asyncio
-        import uvloop
-        from functools import partial
-        from multiprocessing import Pool
+        from itertools import islice
+        from doc_store import DocTableWriter, load_zdict, save_zdict
+        from index_format import RunSpiller
+        from term_counts import TermTotals
+
+        checkpoint = self.__open_checkpoint(file_dir, load_count)
+        zdict = None
+        if checkpoint is None or checkpoint.fresh:
+            # 分段存储的目录只有少量文件，清空很快
+            if os.path.exists(file_dir):
+                shutil.rmtree(file_dir)
+            os.makedirs(file_dir)
+            # 用数据集开头的文档训练预设字典，加密后与文档一起保存
+            if self.compression == "zlib" and self.zdict_samples > 0:
+                # 样本太少、没有重复片段时字典为空，不使用字典
+                zdict = self.train_zdict(self.zdict_samples) or None
+                if zdict is not None:
+                    save_zdict(file_dir, encrypt_doc(zdict, self.file_key))
+        elif (encrypted_zdict := load_zdict(file_dir)) is not None:
+            # 已完成的块使用了之前训练的字典
+            zdict = decrypt_doc_bytes(encrypted_zdict, self.file_key)
+
+        doc_table = DocTableWriter()
+        if checkpoint is not None:
+            for term_counts, doc_ids, locations in checkpoint.iter_chunks():
+                self.term_counts.extend(term_counts)
+                for doc_id, location in zip(doc_ids.tolist(), locations.tolist()):
+                    doc_table.add(doc_id, location)
+        if checkpoint is None or not checkpoint.documents_done:
+            # 流式读取数据集，按批提交给进程池，内存占用不随数据集大小增长；
+            # 已完成的块只读取不处理
+            skip = 0 if checkpoint is None else checkpoint.completed_docs
+            candidate_filter = None
+            if self.sketch_width is not None:
+                sketch = self.__sketch_documents(load_count)
+                candidate_filter = (sketch, self.threshold)
+            documents = islice(enumerate(self.iter_documents(load_count)), skip, None)
+            self.__encrypt_documents(
+                file_dir, documents, doc_table, zdict, checkpoint, candidate_filter
+            )
+            if checkpoint is not None:
+                checkpoint.finish_documents()
+        doc_table.write(file_dir)
+        # 近似模式下词频统计只包含按当前threshold选出的候选词
+        save_term_counts(
+            file_dir,
+            self.term_counts,
+            self.file_key,
+            None if self.sketch_width is None else self.threshold,
+        )
 
-        if os.path.exists(file_dir):
-            shutil.rmtree(file_dir)
-        os.makedirs(file_dir)
+        keywords_info = None if checkpoint is None else checkpoint.stage_info("keywords")
+        if keywords_info == self.keyword_settings():
+            self.keywords_list = checkpoint.load_keywords()
+            self.pruning_report = checkpoint.load_pruning_report()
+        else:
+            self.__count_keyword_appearance()
+            self.keywords_list = self.__choose_out_keyword()
+            if checkpoint is not None:
+                # 关键词变化后已有的postings失效
+                checkpoint.invalidate("postings")
+                checkpoint.save_keywords(
+                    self.keywords_list, self.pruning_report, **self.keyword_settings()
+                )
+        self.words_appearance_time = TermTotals()
+        gc.collect()
 
-        # 加载示例数据（假设为维基百科JSON格式）
-        documents = self.load_documents(load_count)  # 使用上述加载方法
+        # 外存构建的run文件保存在构建目录中，dump_index可以直接归并
+        run_dir = None
+        if checkpoint is not None and self.memory_budget is not None:
+            run_dir = checkpoint.run_dir
+            if checkpoint.stage_info("postings") is not None:
+                self.index_runs = RunSpiller(self.memory_budget, run_dir=run_dir)
+                return
+            shutil.rmtree(run_dir, ignore_errors=True)
+        self.__build_inverted_index(run_dir)
+        if run_dir is not None:
+            self.index_runs.flush()
+            checkpoint.mark_stage("postings")
+
+    def __open_checkpoint(self, file_dir, load_count):
+        if self.checkpoint_dir is None:
+            return None
+        import os
+        from build_checkpoint import BuildCheckpoint, key_fingerprint
+
+        params = {
+            "dataset_path": str(self.dataset_path),
+            "load_count": load_count,
+            "file_dir": os.path.abspath(file_dir),
+            "compression": self.compression,
+            "zdict_samples": self.zdict_samples,
+            "keys": key_fingerprint(self.file_key, self.index_key),
+            # 近似模式下保存的词频统计只包含按当时threshold选出的候选词
+            "sketch": (
+                None
+                if self.sketch_width is None
+                else [self.sketch_width, self.sketch_depth, self.threshold]
+            ),
+        }
+        return BuildCheckpoint(self.checkpoint_dir, params, self.checkpoint_interval)
+
+    def append_documents(self, file_dir: str, index_path: str, documents=None):
+        """增量添加文档，不重新加密已有的文档和索引
+
+        新文档的密文追加到file_dir的段文件中，doc_id从已有文档之后继续编号；
+        新文档的倒排索引写为index_path的一个追加段，搜索时与已有的段合并。
+        关键词为已选出的关键词（见load_keywords），加上在新文档中出现次数超过threshold的词；
+        文档频率上限（max_df）按包括已有文档在内的全部文档判断。
+        只因新文档才变得频繁的词，其已有文档要到下次完整构建时才会被索引。
+
+        调用后inverted_index只包含新文档的postings，不应再用dump_index写出。
 
-        # 使用进程池并行处理文档
-        process_document_with_key = partial(process_document, file_key=self.file_key)
-        with Pool() as pool:
-            results = pool.starmap(process_document_with_key, enumerate(documents))
+        Args:
+            file_dir (str): process_whole_document_set使用的文档目录
+            index_path (str): dump_index写入的索引路径
+            documents (Iterable[dict] | None): 新文档，为空时读取dataset_path中的全部文档
 
-        tasks = []
-        loop = uvloop.new_event_loop()
-        asyncio.set_event_loop(loop)
-        for idx, word_counts, encrypted in results:
-            self.word_appearance_time_per_doc[idx].update(word_counts)
-            # 异步保存文档
-            task = loop.create_task(self.dump_doc(idx, encrypted, file_dir))
-            tasks.append(task)
+        Returns:
+            range: 新文档的doc_id
+        """
+        from collections import defaultdict
+        from doc_store import DocTableWriter, load_zdict, next_doc_id, read_table
+        from index_format import append_segment
+        from term_counts import TermCounts, TermTotals
+
+        first_id = next_doc_id(file_dir)
+        if documents is None:
+            documents = self.iter_documents()
+        # 沿用完整构建时训练的预设字典，不重新训练
+        zdict = None
+        encrypted_zdict = load_zdict(file_dir)
+        if self.compression == "zlib" and encrypted_zdict is not None:
+            zdict = decrypt_doc_bytes(encrypted_zdict, self.file_key)
+
+        self.term_counts = TermCounts()
+        self.inverted_index = defaultdict(list)
+        doc_table = DocTableWriter(read_table(file_dir))
+        count = self.__encrypt_documents(
+            file_dir, enumerate(documents, first_id), doc_table, zdict
+        )
+        # 先写文档表再发布索引段，搜索到的新文档总能读取
+        doc_table.write(file_dir)
+        all_term_counts = None
+        saved = load_term_counts(file_dir, self.file_key)
+        if saved is not None:
+            all_term_counts, min_threshold = saved
+            all_term_counts.extend(self.term_counts)
+            save_term_counts(file_dir, all_term_counts, self.file_key, min_threshold)
+            del saved
 
-        loop.run_until_complete(asyncio.wait(tasks))
+        self.__count_keyword_appearance()
+        # 文档频率上限按全部文档判断，完整构建时剪掉的高频词不会因新文档重新成为关键词
+        self.keywords_list = set(self.keywords_list) | self.__choose_out_keyword(
+            all_term_counts
+        )
+        self.words_appearance_time = TermTotals()
+        del all_term_counts
+        self.__build_inverted_index()
+        if self.index_runs is not None:
+            append_segment(index_path, self.index_runs, ranked=True)
+            self.index_runs.close()
+            self.index_runs = None
+        else:
+            append_segment(index_path, self.inverted_index, ranked=True)
+        return range(first_id, first_id + count)
+
+    def rebuild_index(self, file_dir: str):
+        """按当前threshold重新选择关键词并构建倒排索引
+
+        使用构建时保存在file_dir中的词频统计，不重新读取、分词或加密文档；
+        已删除的文档不再出现在新索引中。之后用dump_keywords/dump_index写出。
+
+        Raises:
+            FileNotFoundError: file_dir中没有保存词频统计
+            ValueError: 词频统计来自近似选择关键词的构建，只包含总次数可能超过
+                当时threshold的单词，无法按更低的threshold重建
+        """
+        from collections import defaultdict
+        from doc_store import ABSENT, read_table
+        from term_counts import TermTotals
+
+        saved = load_term_counts(file_dir, self.file_key)
+        if saved is None:
+            raise FileNotFoundError(f"No saved term counts in {file_dir}")
+        term_counts, min_threshold = saved
+        if min_threshold is not None and self.threshold < min_threshold:
+            raise ValueError(
+                f"Saved term counts only cover sketch candidates above threshold "
+                f"{min_threshold}; rebuild with threshold >= {min_threshold} "
+                "or run a full build"
+            )
+        table = read_table(file_dir)
+        doc_ids = term_counts.doc_ids
+        present = doc_ids < len(table)
+        present[present] = table["segment"][doc_ids[present]] != ABSENT
+        self.term_counts = term_counts if present.all() else term_counts.subset(present)
 
+        self.inverted_index = defaultdict(list)
         self.__count_keyword_appearance()
         self.keywords_list = self.__choose_out_keyword()
-        self.words_appearance_time.clear()
-        del results
-        del documents
-        gc.collect()
+        self.words_appearance_time = TermTotals()
         self.__build_inverted_index()
 
+    def delete_documents(self, file_dir: str, index_path: str, doc_ids):
+        """删除文档：记录doc_id密文的墓碑，并在文档表中标记为不存在
+
+        postings在下次合并索引段（compact_index）时才真正移除。
+        """
+        from doc_store import delete_documents
+        from index_format import add_tombstones
+
+        doc_ids = list(doc_ids)
+        add_tombstones(index_path, self.__encrypt_table(str(d) for d in doc_ids))
+        delete_documents(file_dir, doc_ids)
+
+    def compact_index(self, index_path: str, min_segments: int = 2) -> bool:
+        """合并索引的全部段并移除已删除文档的postings，合并后仍按词频排序
+
+        数据拥有者可以解密词频密文，各段的posting列表按词频归并，合并结果保留
+        按词频排序的标志；服务器直接调用index_format.compact时做不到这一点。
+        """
+        from functools import lru_cache
+        import encrypt_keyword
+        from index_format import compact
+
+        # 不同的词频密文很少，每个只解密一次
+        @lru_cache(maxsize=None)
+        def tf_value(tf_enc):
+            return int(
+                encrypt_keyword.symmetric_decryption_for_keyword(self.index_key, tf_enc)
+            )
+
+        return compact(index_path, min_segments, tf_value)
+
+    def __sketch_documents(self, load_count):
+        """第一遍读取数据集：工作进程分词并计算Sketch增量，在父进程中合并"""
+        from functools import partial
+        from multiprocessing import Pool
+        from count_min_sketch import CountMinSketch
+
+        sketch = CountMinSketch(self.sketch_width, self.sketch_depth)
+        sketch_batch = partial(
+            sketch_document_batch, width=self.sketch_width, depth=self.sketch_depth
+        )
+        with Pool() as pool:
+            for positions, counts in imap_bounded(
+                pool,
+                sketch_batch,
+                batched(self.iter_documents(load_count), self.batch_size),
+                self.max_pending_batches,
+            ):
+                sketch.apply(positions, counts)
+        return sketch
+
+    def __encrypt_documents(
+        self,
+        file_dir,
+        documents,
+        doc_table,
+        zdict,
+        checkpoint=None,
+        candidate_filter=None,
+    ):
+        """用进程池加密(idx, doc)并写入file_dir，记录词频统计和密文位置
+
+        checkpoint不为空时，每集齐一块文档就保存一次检查点；
+        candidate_filter为(CountMinSketch, threshold)时只记录候选词的词频。
+
+        Returns:
+            int: 处理的文档数
+        """
+        from functools import partial
+        from multiprocessing import Pool
+
+        # 工作进程自行写入密文，只返回词频统计和密文位置
+        process_batch = partial(
+            process_document_batch,
+            file_key=self.file_key,
+            file_dir=file_dir,
+            compression=self.compression,
+            zdict=zdict,
+        )
+        count = 0
+
+        # Sketch在每个工作进程启动时传入一次，而不是随每个任务传递
+        with Pool(
+            initializer=_set_candidate_filter, initargs=(candidate_filter,)
+        ) as pool:
+            for results in imap_bounded(
+                pool,
+                process_batch,
+                batched(documents, self.batch_size),
+                self.max_pending_batches,
+            ):
+                for idx, word_counts, location in results:
+                    self.term_counts.add_document(idx, word_counts)
+                    doc_table.add(idx, location)
+                    if checkpoint is not None:
+                        checkpoint.add_document(idx, word_counts, location)
+                count += len(results)
+        return count
+
+    def train_zdict(self, sample_count: int) -> bytes:
+        """用数据集中前sample_count个文档训练zlib预设字典"""
+        from doc_codec import train_zdict
+
+        return train_zdict(
+            doc["title"] + " " + doc["text"]
+            for doc in self.iter_documents(sample_count)
+        )
+
     def __count_word_appearance_per_doc(self, docid, text):
         """统计指定文档中单词出现次数并更新索引
 
@@ -140,15 +869,9 @@ class EncryptedIndexBuilder:
         Returns:
             None: 结果直接更新类成员变量words_appearance_time_per_doc
         """
-        from collections import Counter
-
-        # 使用正则表达式提取全部单词并转换为小写
-        words = word_pattern.findall(text.lower())
-
-        # 统计每个单词在当前文档中的出现次数
-        # words_appearance_time_per_doc结构为: Dict[docid][word] = count
-        word_counts = Counter(words)
-        self.word_appearance_time_per_doc[docid].update(word_counts)
+        # 提取全部单词（转换为小写）并统计每个单词在当前文档中的出现次数
+        word_counts = count_words(text)
+        self.term_counts.add_document(docid, word_counts)
 
     def __count_keyword_appearance(self):
         """
@@ -161,26 +884,104 @@ class EncryptedIndexBuilder:
 
         Args:
             无显式参数，通过类实例属性进行操作：
-            self.word_appearance_time_per_doc (dict): 文档级词频记录，结构为 {docid: {word: count}}
-            self.words_appearance_time (dict): 用于存储统计结果的字典，结构为 {word: total_count}
+            self.term_counts (TermCounts): 文档级词频记录，结构为 {docid: {word: count}}
+            self.words_appearance_time (TermTotals): 统计结果，结构为 {word: total_count}
 
         Returns:
             None: 直接修改类实例的words_appearance_time属性
         """
-        # 遍历每个文档的词频统计记录
-        for docid, word_counts in self.word_appearance_time_per_doc.items():
-            # 累加当前文档的词频到全局统计字典
-            for word, count in word_counts.items():
-                self.words_appearance_time[word] += count
+        from term_counts import TermTotals
+
+        # 按单词id对全部词频记录求和
+        self.words_appearance_time = TermTotals(
+            self.term_counts.words,
+            self.term_counts.term_totals(),
+            self.term_counts.vocab,
+        )
+
+    def __choose_out_keyword(self, df_counts=None):
+        """选出出现次数大于threshold的词，再按停用词、单词长度和文档频率上限剪枝
+
+        剪枝前后posting列表长度的分布记录在pruning_report中。
+
+        Args:
+            df_counts (TermCounts | None): 计算文档频率使用的词频统计，默认为self.term_counts
+        """
+        from term_counts import TermTotals, posting_list_stats
 
-    def __choose_out_keyword(self):
         # 返回出现次数大于threshold的词
-        return set(
-            (
-                word
-                for word, count in self.words_appearance_time.items()
-                if count > self.threshold
+        totals = self.words_appearance_time
+        if not isinstance(totals, TermTotals):
+            totals = TermTotals.from_mapping(totals)
+        keywords = totals.above(self.threshold)
+
+        # 每个关键词的posting列表长度即其文档频率
+        if df_counts is None:
+            df_counts = self.term_counts
+        vocab = df_counts.vocab
+        doc_freq = df_counts.doc_frequencies().tolist()
+
+        def posting_lengths(words):
+            return [doc_freq[vocab[w]] if w in vocab else 0 for w in words]
+
+        kept = keywords
+        removed = {}
+        if self.stopwords:
+            kept = {w for w in kept if w not in self.stopwords}
+            removed["stopwords"] = len(keywords) - len(kept)
+        if self.min_token_length > 1 or self.max_token_length is not None:
+            max_length = self.max_token_length or float("inf")
+            before = len(kept)
+            kept = {w for w in kept if self.min_token_length <= len(w) <= max_length}
+            removed["token_length"] = before - len(kept)
+        if self.max_df is not None:
+            # 浮点数为文档总数的比例，整数为文档数
+            max_df = (
+                self.max_df * len(df_counts)
+                if isinstance(self.max_df, float)
+                else self.max_df
             )
+            before = len(kept)
+            kept = {w for w, n in zip(kept, posting_lengths(kept)) if n <= max_df}
+            removed["max_df"] = before - len(kept)
+
+        self.pruning_report = {
+            "before": posting_list_stats(posting_lengths(keywords)),
+            "after": posting_list_stats(posting_lengths(kept)),
+            "removed": removed,
+        }
+        return kept
+
+    def keyword_settings(self) -> dict:
+        """影响关键词选择的参数，用于判断检查点中的关键词是否仍然有效"""
+        from hashlib import blake2b
+
+        stopwords = " ".join(sorted(self.stopwords)).encode()
+        return {
+            "threshold": self.threshold,
+            "max_df": self.max_df,
+            "stopwords": blake2b(stopwords).hexdigest(),
+            "min_token_length": self.min_token_length,
+            "max_token_length": self.max_token_length,
+        }
+
+    def format_pruning_report(self) -> str:
+        """剪枝前后posting列表长度分布的文本报告"""
+        from term_counts import format_posting_list_stats
+
+        report = self.pruning_report
+        if report is None:
+            # 从旧检查点恢复的关键词没有保存剪枝报告
+            return "Keywords restored from checkpoint, no pruning report"
+        removed = ", ".join(f"{k}: {n}" for k, n in report["removed"].items())
+        return "\n".join(
+            [
+                "Posting lists before pruning:",
+                format_posting_list_stats(report["before"]),
+                "Posting lists after pruning:",
+                format_posting_list_stats(report["after"]),
+                f"Removed keywords: {removed or 'none'}",
+            ]
         )
 
     def __init_inverted_index(self):
@@ -194,33 +995,76 @@ class EncryptedIndexBuilder:
             )
             self.inverted_index[word_enc] = []
 
-    def __build_inverted_index(self):
+    def __build_inverted_index(self, run_dir=None):
         """构建倒排索引
 
-        遍历word_appearance_time_per_doc，统计每个关键字在哪些文档中出现以及出现的次数，
+        用关键词掩码从term_counts中筛选出属于关键词的(单词, 词频)记录，按单词id排序后分组，
+        组内按词频降序（词频相同时按文档顺序）排列，查询时可以只读取前k个posting，
         并将结果存储在inverted_index中。inverted_index的结构为{加密的关键字: [(加密的词频, 加密的doc_id), ...]}。
+
+        ECB加密是确定性的，因此关键词、词频和文档ID的密文各只计算一次，
+        先批量生成三张密文表，组装posting时只做查表。
+
+        设置了memory_budget时postings写入RunSpiller，而不是inverted_index；
+        run_dir不为空时run文件保存在该目录中。
         """
-        import encrypt_keyword
+        import numpy as np
         from tqdm import tqdm
+        from index_format import RunSpiller
+
+        term_counts = self.term_counts
+        keyword_mask = term_counts.term_mask(self.keywords_list)
+        posting_mask = keyword_mask[term_counts.term_ids]
+        term_ids = term_counts.term_ids[posting_mask]
+        counts = term_counts.counts[posting_mask]
+        doc_rows = term_counts.doc_rows()[posting_mask]
+
+        # 按单词id分组，组内按词频降序，词频相同时保持文档顺序
+        order = np.lexsort((doc_rows, -counts.astype(np.int64), term_ids))
+        term_ids, counts, doc_rows = term_ids[order], counts[order], doc_rows[order]
+        group_starts = np.flatnonzero(np.diff(term_ids, prepend=-1))
+        group_ends = np.append(group_starts[1:], len(term_ids))
+
+        # 关键词->token、词频->密文、文档ID->密文
+        keyword_tokens = self.__encrypt_table(
+            term_counts.words[t] for t in term_ids[group_starts].tolist()
+        )
+        tf_values, tf_refs = np.unique(counts, return_inverse=True)
+        tf_table = self.__encrypt_table(str(tf) for tf in tf_values.tolist())
+        doc_values, doc_refs = np.unique(doc_rows, return_inverse=True)
+        doc_table = self.__encrypt_table(
+            str(doc_id) for doc_id in term_counts.doc_ids[doc_values].tolist()
+        )
 
-        for doc_id, word_counts in tqdm(self.word_appearance_time_per_doc.items()):
-            for word, count in word_counts.items():
-                if word not in self.keywords_list:
-                    continue
-                # 对关键词进行确定性加密处理
-                word_enc = encrypt_keyword.symmetric_encryption_for_keyword(
-                    self.index_key, word
-                )
-                # 对词频进行加密
-                count_enc = encrypt_keyword.symmetric_encryption_for_keyword(
-                    self.index_key, str(count)
-                )
-                # 对文档ID进行加密
-                doc_id_enc = encrypt_keyword.symmetric_encryption_for_keyword(
-                    self.index_key, str(doc_id)
-                )
-                # 将加密后的词频和文档ID对添加到倒排索引中
-                self.inverted_index[word_enc].append((count_enc, doc_id_enc))
+        if self.memory_budget is not None:
+            if self.index_runs is not None:
+                self.index_runs.close()
+            self.index_runs = RunSpiller(self.memory_budget, self.spill_dir, run_dir)
+            add_postings = self.index_runs.add
+        else:
+
+            def add_postings(word_enc, postings):
+                self.inverted_index[word_enc].extend(postings)
+
+        for word_enc, start, end in tqdm(
+            zip(keyword_tokens, group_starts.tolist(), group_ends.tolist()),
+            total=len(keyword_tokens),
+        ):
+            add_postings(
+                word_enc,
+                zip(
+                    (tf_table[i] for i in tf_refs[start:end].tolist()),
+                    (doc_table[i] for i in doc_refs[start:end].tolist()),
+                ),
+            )
+
+    def __encrypt_table(self, values):
+        """对一组明文做确定性加密，返回与输入顺序一致的密文列表"""
+        import encrypt_keyword
+
+        return encrypt_keyword.symmetric_encryption_for_keywords(
+            self.index_key, values, parallel=True
+        )
 
     def __encrypt_document(self, text: str):
         # 加密文档内容
@@ -231,41 +1075,68 @@ class EncryptedIndexBuilder:
             content = " ".join(self.keywords_list)
             f.write(content.encode())
 
-    def dump_index(self, file_path):
-        import pickle
-
-        with open(file_path, "wb") as f:
-            pickle.dump(self.inverted_index, f)
+    def load_keywords(self, file_path):
+        """读取dump_keywords保存的关键词，供增量添加文档时使用"""
+        with open(file_path, "rb") as f:
+            self.keywords_list = set(f.read().decode().split())
 
-    @staticmethod
-    async def dump_doc(doc_id, doc, file_dir):
-        import aiofiles
-        import os
+    def dump_index(self, file_path):
+        from index_format import remove_segments, write_index
 
-        async with aiofiles.open(os.path.join(file_dir, str(doc_id)), "wb") as f:
-            await f.write(doc)
+        # 写为可mmap的二进制格式，搜索端无需反序列化整个索引
+        if self.index_runs is not None:
+            # 外存构建：归并临时run文件，边归并边写出
+            self.index_runs.write_index(file_path, ranked=True)
+            self.index_runs.close()
+            self.index_runs = None
+        else:
+            write_index(file_path, self.inverted_index, ranked=True)
+        # 完整构建的索引已包含全部文档，旧的追加段和墓碑不再需要
+        remove_segments(file_path)
 
 
 class Searcher:
     def __init__(self, index_path, file_dir, file_key):
-        import pickle
+        from index_format import open_index
 
         self.file_key = file_key
         self.file_dir = file_dir
-        with open(index_path, "rb") as f:
-            self.inverted_index = pickle.load(f)
+        # 二进制索引以mmap方式打开，旧的pickle索引仍可读取
+        self.inverted_index = open_index(index_path)
+        self._doc_store = None
+        self._zdict = None
 
-    def search(self, token: str):  # 返回词频——文档对
+    def search(self, token: str):  # 返回词频——文档对，多段索引中不保证按doc_id或词频有序
         tf_enc_and_doc_id_enc_structs = self.inverted_index.get(token, [])
         return tf_enc_and_doc_id_enc_structs
 
-    def decrypt_document(self, doc_id):
-        import os
+    @property
+    def doc_store(self):
+        # 第一次读取文档时才打开文档存储
+        if self._doc_store is None:
+            from doc_store import open_doc_store
 
-        with open(os.path.join(self.file_dir, str(doc_id)), "rb") as f:
-            encrypted_doc = f.read()
+            self._doc_store = open_doc_store(self.file_dir)
+        return self._doc_store
 
-        return decrypt_doc(encrypted_doc, self.file_key)
+    @property
+    def zdict(self):
+        # 构建索引时训练的zlib预设字典，没有时为空
+        if self._zdict is None:
+            from doc_store import load_zdict
+
+            encrypted = load_zdict(self.file_dir)
+            self._zdict = (
+                b"" if encrypted is None else decrypt_doc_bytes(encrypted, self.file_key)
+            )
+        return self._zdict or None
+
+    def decrypt_document(self, doc_id):
+        encrypted_doc = self.doc_store.get(doc_id)
+        if encrypted_doc is None:
+            raise FileNotFoundError(f"Document {doc_id} not found in {self.file_dir}")
+
+        return decrypt_doc(encrypted_doc, self.file_key, self.zdict)
 
 
 # 使用示例
@@ -286,11 +1157,70 @@ if __name__ == "__main__":
     # 配置命令行参数解析
     parser = argparse.ArgumentParser(description="Encrypted Search Engine")
     parser.add_argument(
-        "--dataset", type=str, required=True, help="Path to dataset JSON file"
+        "--dataset",
+        type=str,
+        required=True,
+        help="Path to dataset JSON/JSONL file (optionally gzip/xz compressed)",
     )
     parser.add_argument(
         "--keyword", type=str, required=True, help="Search keyword to look up"
     )
+    parser.add_argument(
+        "--compression",
+        choices=["zlib", "lzma"],
+        default=None,
+        help="Compress documents before encryption",
+    )
+    parser.add_argument(
+        "--zdict_samples",
+        type=int,
+        default=0,
+        help="Train a zlib preset dictionary from this many documents",
+    )
+    parser.add_argument(
+        "--memory_budget_mb",
+        type=int,
+        default=None,
+        help="Build the index out of core, spilling sorted runs beyond this budget",
+    )
+    parser.add_argument(
+        "--spill_dir",
+        type=str,
+        default=None,
+        help="Directory for temporary index runs (default: system temp dir)",
+    )
+    parser.add_argument(
+        "--checkpoint_dir",
+        type=str,
+        default=None,
+        help="Checkpoint build stages here and resume an interrupted build",
+    )
+    parser.add_argument(
+        "--key_file",
+        type=str,
+        default=None,
+        help="Reuse (or create) the file/index keys stored in this file",
+    )
+    parser.add_argument(
+        "--sketch_width",
+        type=int,
+        default=None,
+        help="Select keywords with a Count-Min sketch of this width plus exact checks",
+    )
+    parser.add_argument(
+        "--max_df",
+        type=parse_max_df,
+        default=None,
+        help="Drop keywords in more than this many documents (or fraction, e.g. 0.5)",
+    )
+    parser.add_argument(
+        "--stopwords",
+        type=str,
+        default=None,
+        help="File of whitespace-separated words that are never keywords",
+    )
+    parser.add_argument("--min_token_length", type=int, default=1)
+    parser.add_argument("--max_token_length", type=int, default=None)
     args = parser.parse_args()
     # 判断文件是否存在
     if not os.path.exists(args.dataset):
@@ -300,15 +1230,36 @@ if __name__ == "__main__":
         sys.exit(1)
 
     # 创建加密引擎
-    file_key = generate_key()
-    index_key = generate_key()
+    if args.key_file is not None or args.checkpoint_dir is not None:
+        import os
+        from build_checkpoint import KEYS_NAME, load_or_create_keys
+
+        # 恢复构建或之后用rebuild_index.py重建索引时，必须沿用同一对密钥
+        key_file = args.key_file or os.path.join(args.checkpoint_dir, KEYS_NAME)
+        file_key, index_key = load_or_create_keys(key_file, generate_key)
+    else:
+        file_key = generate_key()
+        index_key = generate_key()
     index_builder = EncryptedIndexBuilder(
         file_key=file_key,
         index_key=index_key,
         dataset_path=args.dataset,
         threshold=0,
+        compression=args.compression,
+        zdict_samples=args.zdict_samples,
+        memory_budget=(
+            args.memory_budget_mb << 20 if args.memory_budget_mb is not None else None
+        ),
+        spill_dir=args.spill_dir,
+        checkpoint_dir=args.checkpoint_dir,
+        sketch_width=args.sketch_width,
+        max_df=args.max_df,
+        stopwords=read_stopwords(args.stopwords) if args.stopwords else None,
+        min_token_length=args.min_token_length,
+        max_token_length=args.max_token_length,
     )
     index_builder.process_whole_document_set("encrypted_docs")
+    print(index_builder.format_pruning_report())
 
     # 使用LSSS库拆分index_key
     dealer, index_key_shares = LSSS.setup_secret_sharing(
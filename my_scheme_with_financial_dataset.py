@@ -1,8 +1,16 @@
 import multiprocessing
-from my import EncryptedIndexBuilder, Searcher, generate_key
+from my import (
+    EncryptedIndexBuilder,
+    Searcher,
+    generate_key,
+    parse_max_df,
+    read_stopwords,
+)
 from preprocess_finance_corpus import (
     get_all_news_data,
     get_news_data_by_company_name,
+    iter_all_news_data,
+    iter_news,
     process_news,
 )
 import argparse
@@ -17,8 +25,8 @@ import encrypt_keyword
 
 
 class FinanceDataSetIndexBuilder(EncryptedIndexBuilder):
-    def __init__(self, file_key, index_key, dataset_path, threshold=10):
-        super().__init__(file_key, index_key, dataset_path, threshold)
+    def __init__(self, file_key, index_key, dataset_path, threshold=10, **kwargs):
+        super().__init__(file_key, index_key, dataset_path, threshold, **kwargs)
 
     def load_documents_by_company_name(
         self, company_name: str, count: int | None = None
@@ -39,6 +47,21 @@ class FinanceDataSetIndexBuilder(EncryptedIndexBuilder):
         else:
             return self.load_documents_by_company_name(self.dataset_path, count)
 
+    def iter_documents(self, count: int | None = None):
+        """逐条产出新闻文档
+
+        全部新闻按NEWS_BATCH_SIZE行一批从DuckDB读取，内存只与批大小有关；
+        按公司读取时数据源一次返回该公司的全部新闻。
+        """
+        from itertools import chain
+
+        if self.dataset_path is None:
+            return chain.from_iterable(map(iter_news, iter_all_news_data(count)))
+        news_df = get_news_data_by_company_name(self.dataset_path)
+        if count:
+            news_df = news_df[:count]
+        return iter_news(news_df)
+
 
 if __name__ == "__main__":
     multiprocessing.set_start_method("forkserver", force=True)
@@ -57,22 +80,99 @@ if __name__ == "__main__":
     parser.add_argument(
         "--local_search", type=bool, default=False, help="Perform local search or not"
     )
+    parser.add_argument(
+        "--compression",
+        choices=["zlib", "lzma"],
+        default=None,
+        help="Compress documents before encryption",
+    )
+    parser.add_argument(
+        "--zdict_samples",
+        type=int,
+        default=0,
+        help="Train a zlib preset dictionary from this many documents",
+    )
+    parser.add_argument(
+        "--memory_budget_mb",
+        type=int,
+        default=None,
+        help="Build the index out of core, spilling sorted runs beyond this budget",
+    )
+    parser.add_argument(
+        "--spill_dir",
+        type=str,
+        default=None,
+        help="Directory for temporary index runs (default: system temp dir)",
+    )
+    parser.add_argument(
+        "--checkpoint_dir",
+        type=str,
+        default=None,
+        help="Checkpoint build stages here and resume an interrupted build",
+    )
+    parser.add_argument(
+        "--key_file",
+        type=str,
+        default=None,
+        help="Reuse (or create) the file/index keys stored in this file",
+    )
+    parser.add_argument(
+        "--sketch_width",
+        type=int,
+        default=None,
+        help="Select keywords with a Count-Min sketch of this width plus exact checks",
+    )
+    parser.add_argument(
+        "--max_df",
+        type=parse_max_df,
+        default=None,
+        help="Drop keywords in more than this many documents (or fraction, e.g. 0.5)",
+    )
+    parser.add_argument(
+        "--stopwords",
+        type=str,
+        default=None,
+        help="File of whitespace-separated words that are never keywords",
+    )
+    parser.add_argument("--min_token_length", type=int, default=1)
+    parser.add_argument("--max_token_length", type=int, default=None)
 
     argcomplete.autocomplete(parser)
     args = parser.parse_args()
 
     # 创建加密引擎
-    file_key = generate_key()
-    index_key = generate_key()
+    if args.key_file is not None or args.checkpoint_dir is not None:
+        import os
+        from build_checkpoint import KEYS_NAME, load_or_create_keys
+
+        # 恢复构建或之后用rebuild_index.py重建索引时，必须沿用同一对密钥
+        key_file = args.key_file or os.path.join(args.checkpoint_dir, KEYS_NAME)
+        file_key, index_key = load_or_create_keys(key_file, generate_key)
+    else:
+        file_key = generate_key()
+        index_key = generate_key()
     index_builder = FinanceDataSetIndexBuilder(
         file_key=file_key,
         index_key=index_key,
         dataset_path=args.company_name,
         threshold=args.threshold,
+        compression=args.compression,
+        zdict_samples=args.zdict_samples,
+        memory_budget=(
+            args.memory_budget_mb << 20 if args.memory_budget_mb is not None else None
+        ),
+        spill_dir=args.spill_dir,
+        checkpoint_dir=args.checkpoint_dir,
+        sketch_width=args.sketch_width,
+        max_df=args.max_df,
+        stopwords=read_stopwords(args.stopwords) if args.stopwords else None,
+        min_token_length=args.min_token_length,
+        max_token_length=args.max_token_length,
     )
     index_builder.process_whole_document_set(
         load_count=args.doc_count, file_dir="encrypted_docs_finance"
     )
+    print(index_builder.format_pruning_report())
 
     second_secret_access_structure = []
     num_of_participants = args.user_count + 1
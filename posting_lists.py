@@ -0,0 +1,139 @@
+"""在服务器端对多个关键词的posting列表求交集
+
+doc_id使用确定性的ECB加密，同一文档在所有posting列表中的密文相同，
+服务器按doc_id密文求交集不会得到比逐个查询更多的信息。
+
+二进制索引为每个posting列表保存了按doc_id密文排序的下标（见index_format的文档序），
+以最短的列表为基准，在其余列表中用galloping（指数步长后二分）直接在mmap上查找，
+代价为 O(m·log(n/m))，m、n分别为最短和其余列表的长度，不读取整个posting列表。
+没有文档序的旧索引和pickle索引以posting_wire格式的定长记录
+词频密文(16) || doc_id密文(16) 传入，查询时先用NumPy按doc_id密文排序，代价为 O(N·log N)。
+"""
+
+from bisect import bisect_left
+from collections.abc import Sequence
+
+from posting_wire import FIELD_SIZE, RECORD_SIZE
+
+AND = "and"
+OR = "or"
+
+
+def doc_order(doc_id_encs):
+    """首尾相接的doc_id密文按字节序排序后的下标
+
+    Returns:
+        np.ndarray: 第i项为第i小的doc_id密文的下标
+    """
+    import numpy as np
+
+    # 每个密文看作2个大端uint64，依次比较即为字节序
+    words = np.frombuffer(bytes(doc_id_encs), dtype=">u8").reshape(-1, FIELD_SIZE // 8)
+    return np.lexsort((words[:, 1], words[:, 0]))
+
+
+def sort_by_doc(records) -> bytes:
+    """把定长记录按doc_id密文的字节序排序"""
+    import numpy as np
+
+    records = np.frombuffer(bytes(records), dtype=f"V{RECORD_SIZE}")
+    doc_id_encs = records.view(np.uint8).reshape(-1, RECORD_SIZE)[:, FIELD_SIZE:]
+    return records[doc_order(doc_id_encs.tobytes())].tobytes()
+
+
+class _DocKeys(Sequence):
+    """第i项为第i条记录的doc_id密文，供bisect在记录上直接二分"""
+
+    def __init__(self, records: bytes):
+        self._records = records
+
+    def __getitem__(self, i):
+        start = i * RECORD_SIZE + FIELD_SIZE
+        return self._records[start : start + FIELD_SIZE]
+
+    def __len__(self):
+        return len(self._records) // RECORD_SIZE
+
+    def records(self, indices) -> bytes:
+        records = self._records
+        return b"".join(
+            records[k * RECORD_SIZE : (k + 1) * RECORD_SIZE] for k in indices
+        )
+
+
+def doc_keys(records):
+    """按doc_id密文排序的视图，定长记录在此时排序，已排序的视图原样返回"""
+    if isinstance(records, (bytes, bytearray, memoryview)):
+        return _DocKeys(sort_by_doc(records))
+    return records
+
+
+def _gallop(keys, target, lo: int) -> int:
+    """从lo开始以指数步长前进，返回第一个不小于target的位置"""
+    step = 1
+    hi = lo
+    while hi < len(keys) and keys[hi] < target:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect_left(keys, target, lo, min(hi, len(keys)))
+
+
+def intersect(record_lists) -> list[bytes]:
+    """只保留doc_id出现在每个列表中的posting
+
+    Args:
+        record_lists (list): 每个关键词按doc_id密文排序的视图（见MappedIndex.doc_ordered），
+            或在查询时排序的定长记录
+
+    Returns:
+        list[bytes]: 与输入顺序对应的定长记录，按doc_id密文排序
+    """
+    keys = [doc_keys(records) for records in record_lists]
+    if not keys:
+        return []
+    order = sorted(range(len(keys)), key=lambda j: len(keys[j]))
+    base, others = keys[order[0]], order[1:]
+    positions = [0] * len(keys)
+    matched = [[] for _ in keys]
+
+    i = 0
+    while i < len(base):
+        target = base[i]
+        for j in others:
+            positions[j] = _gallop(keys[j], target, positions[j])
+            if positions[j] == len(keys[j]):
+                # 有列表已经查找完，不会再有交集
+                return _select(keys, matched)
+            if keys[j][positions[j]] != target:
+                # 基准列表直接跳到不小于该列表当前doc_id的位置
+                i = _gallop(base, keys[j][positions[j]], i + 1)
+                break
+        else:
+            matched[order[0]].append(i)
+            for j in others:
+                matched[j].append(positions[j])
+            i += 1
+    return _select(keys, matched)
+
+
+def _select(keys, matched) -> list[bytes]:
+    return [view.records(indices) for view, indices in zip(keys, matched)]
+
+
+def lookup(records, doc_id_encs) -> bytes:
+    """records中doc_id密文属于doc_id_encs的postings，按doc_id密文排序
+
+    在按doc_id密文排序的视图上逐个二分查找，代价为 O(q·log n)，q为查找的文档数。
+
+    Args:
+        records: 按doc_id密文排序的视图（见MappedIndex.doc_ordered），或定长记录
+        doc_id_encs (Iterable[bytes]): 要查找的doc_id密文
+    """
+    keys = doc_keys(records)
+    found = []
+    for doc_id_enc in sorted(set(doc_id_encs)):
+        i = bisect_left(keys, doc_id_enc)
+        if i < len(keys) and keys[i] == doc_id_enc:
+            found.append(i)
+    return keys.records(found)
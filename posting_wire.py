@@ -0,0 +1,113 @@
+"""搜索接口（/search_server_binary、/search_multi）响应的二进制格式
+
+    文件头   MAGIC(4) || 版本(1) || 密文长度(1) || 标志(1) || 保留(1) || posting数(8)
+    postings posting数条定长记录：词频密文(16) || doc_id密文(16)
+
+/search_multi 按请求中关键词的顺序，依次返回每个关键词的一段上述格式，
+并在响应头中给出每个关键词求交集前的posting数（文档频率）和文档总数；
+/search_server_stream 以分块传输逐页返回，每页一段。
+指定offset/limit时，索引按词频排序的服务器直接返回排序后的第[offset, offset+limit)条；
+否则返回包含结果的候选记录并设置CANDIDATES标志，由可信端解密排序后再截取。
+整数均为小端序。相比pickle后再base64编码放进JSON，服务器直接从索引复制定长记录，
+客户端不需要反序列化，整段记录可以原样交给批量解密。
+"""
+
+import struct
+
+MAGIC = b"SSEp"
+VERSION = 1
+FIELD_SIZE = 16
+RECORD_SIZE = 2 * FIELD_SIZE
+MEDIA_TYPE = "application/octet-stream"
+# 标志：记录是包含所请求区间的候选集合，需要按词频排序后再跳过offset条
+CANDIDATES = 1
+# /search_multi的响应头：以逗号分隔的各关键词posting数，以及文档总数
+POSTING_COUNTS_HEADER = "X-Posting-Counts"
+DOCUMENT_COUNT_HEADER = "X-Document-Count"
+
+_HEADER = struct.Struct("<4sBBBxQ")
+HEADER_LEN = _HEADER.size
+
+
+def encode(records, flags: int = 0) -> bytes:
+    """为拼接好的定长记录加上文件头
+
+    Raises:
+        ValueError: 记录总长度不是RECORD_SIZE的整数倍
+    """
+    if len(records) % RECORD_SIZE:
+        raise ValueError("Posting records must be fixed width")
+    count = len(records) // RECORD_SIZE
+    header = _HEADER.pack(MAGIC, VERSION, FIELD_SIZE, flags, count)
+    return header + bytes(records)
+
+
+def encode_postings(postings) -> bytes:
+    """编码 [(tf_enc, doc_id_enc), ...] 形式的postings"""
+    return encode(b"".join(tf_enc + doc_id_enc for tf_enc, doc_id_enc in postings))
+
+
+def decode(data) -> memoryview:
+    """校验文件头，返回引用data的定长记录，不复制数据
+
+    Raises:
+        ValueError: 格式、版本或长度不正确
+    """
+    data = memoryview(data)
+    if len(data) < HEADER_LEN:
+        raise ValueError("Truncated posting response")
+    magic, version, field_size, _, count = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or field_size != FIELD_SIZE:
+        raise ValueError("Unsupported posting response format")
+    if len(data) != HEADER_LEN + count * RECORD_SIZE:
+        raise ValueError("Posting response length does not match its header")
+    return data[HEADER_LEN:]
+
+
+def read_flags(data) -> int:
+    """响应文件头中的标志"""
+    if len(data) < HEADER_LEN:
+        raise ValueError("Truncated posting response")
+    return _HEADER.unpack_from(data)[3]
+
+
+def decode_many(data) -> list[memoryview]:
+    """依次解码首尾相接的多段响应，返回每段的定长记录"""
+    data = memoryview(data)
+    parts = []
+    while data:
+        if len(data) < HEADER_LEN:
+            raise ValueError("Truncated posting response")
+        count = _HEADER.unpack_from(data)[4]
+        end = HEADER_LEN + count * RECORD_SIZE
+        parts.append(decode(data[:end]))
+        data = data[end:]
+    return parts
+
+
+def iter_decode(chunks):
+    """从分块到达的字节流中依次解码，每收齐一段就产出其定长记录
+
+    Raises:
+        ValueError: 格式不正确，或流在一段的中间结束
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= HEADER_LEN:
+            end = HEADER_LEN + _HEADER.unpack_from(buffer)[4] * RECORD_SIZE
+            if len(buffer) < end:
+                break
+            yield decode(bytes(buffer[:end]))
+            del buffer[:end]
+    if buffer:
+        raise ValueError("Truncated posting response")
+
+
+def split_records(records) -> list[tuple[bytes, bytes]]:
+    """把定长记录切分为 [(tf_enc, doc_id_enc), ...]"""
+    records = bytes(records)
+    return [
+        (records[i : i + FIELD_SIZE], records[i + FIELD_SIZE : i + RECORD_SIZE])
+        for i in range(0, len(records), RECORD_SIZE)
+    ]
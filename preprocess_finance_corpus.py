@@ -9,14 +9,22 @@ def get_news_data_by_company_name(ticker_symbol: str):
     return news.get_news_list()
 
 
-def get_all_news_data(count: int | None):
+# 分批读取全部新闻时每批的行数
+NEWS_BATCH_SIZE = 4096
+
+
+def _news_source():
+    """返回(DuckDB客户端, 全部新闻的parquet地址)"""
     from defeatbeta_api.client.duckdb_client import DuckDBClient
     from defeatbeta_api.client.hugging_face_client import HuggingFaceClient
     from defeatbeta_api.utils.const import stock_news
 
-    duckdb_client = DuckDBClient()
     huggingface_client = HuggingFaceClient()
-    url = huggingface_client.get_url_path(stock_news)
+    return DuckDBClient(), huggingface_client.get_url_path(stock_news)
+
+
+def get_all_news_data(count: int | None):
+    duckdb_client, url = _news_source()
     if count is None:
         sql = f"SELECT * FROM '{url}'"
     else:
@@ -25,6 +33,32 @@ def get_all_news_data(count: int | None):
     return result
 
 
+def iter_all_news_data(count: int | None, batch_size: int = NEWS_BATCH_SIZE):
+    """分批读取全部新闻，每批一个不超过batch_size行的DataFrame"""
+    duckdb_client, url = _news_source()
+    return iter_query_batches(duckdb_client.query, url, count, batch_size)
+
+
+def iter_query_batches(query, source: str, count: int | None, batch_size: int):
+    """用LIMIT … OFFSET分批查询source的前count行（count为空时为全部行）
+
+    内存占用只与batch_size有关。DuckDB扫描单个文件时保持文件中的行顺序，
+    各批首尾相接；OFFSET仍需从头扫描被跳过的行，batch_size不宜过小。
+
+    Args:
+        query (Callable[[str], DataFrame]): 执行SQL并返回结果，如DuckDBClient.query
+    """
+    offset = 0
+    while count is None or offset < count:
+        limit = batch_size if count is None else min(batch_size, count - offset)
+        batch = query(f"SELECT * FROM '{source}' LIMIT {limit} OFFSET {offset}")
+        if len(batch):
+            yield batch
+        if len(batch) < limit:
+            break
+        offset += limit
+
+
 # 将process_item移出为独立函数以避免多进程序列化问题
 def process_item(title, content):
     """处理单个新闻项的独立函数（支持多进程序列化）"""
@@ -32,6 +66,12 @@ def process_item(title, content):
     return {"title": title, "text": concatted}
 
 
+def iter_news(news_df: DataFrame):
+    """逐条产出新闻文档，不生成完整的文档列表"""
+    for title, content in zip(news_df["title"], news_df["news"]):
+        yield process_item(title, content)
+
+
 def process_news(news_df: DataFrame):
     from concurrent.futures import ProcessPoolExecutor
 
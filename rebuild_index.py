@@ -0,0 +1,105 @@
+"""按新的threshold重建index.bin和keywords.txt
+
+使用构建时保存在文档目录中的加密词频统计，不重新下载语料、分词或加密文档。
+构建时需要用 --key_file（或 --checkpoint_dir）保存密钥，重建时读取同一个密钥文件：
+
+    python rebuild_index.py --threshold 20 --key_file keys.bin
+"""
+
+import argparse
+
+from my import EncryptedIndexBuilder, parse_max_df, read_stopwords
+
+
+def rebuild_index(
+    file_key,
+    index_key,
+    threshold,
+    file_dir,
+    index_path="index.bin",
+    keywords_path="keywords.txt",
+    memory_budget=None,
+    **pruning,
+):
+    """重新选择关键词并写出倒排索引和关键词文件
+
+    Args:
+        pruning: 词表剪枝参数（max_df、stopwords、min_token_length、max_token_length），
+            含义与EncryptedIndexBuilder相同
+
+    Returns:
+        EncryptedIndexBuilder: 完成重建的构建器
+    """
+    index_builder = EncryptedIndexBuilder(
+        file_key=file_key,
+        index_key=index_key,
+        dataset_path=None,
+        threshold=threshold,
+        memory_budget=memory_budget,
+        **pruning,
+    )
+    index_builder.rebuild_index(file_dir)
+    index_builder.dump_keywords(keywords_path)
+    index_builder.dump_index(index_path)
+    return index_builder
+
+
+if __name__ == "__main__":
+    from build_checkpoint import load_keys
+
+    parser = argparse.ArgumentParser(
+        description="Rebuild the encrypted index with a new keyword threshold"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=int,
+        required=True,
+        help="appearance threshold for a word to be a keyword",
+    )
+    parser.add_argument(
+        "--key_file",
+        type=str,
+        required=True,
+        help="Key file written by the original build (--key_file/--checkpoint_dir)",
+    )
+    parser.add_argument("--file_dir", type=str, default="encrypted_docs_finance")
+    parser.add_argument("--index_path", type=str, default="index.bin")
+    parser.add_argument("--keywords_path", type=str, default="keywords.txt")
+    parser.add_argument(
+        "--memory_budget_mb",
+        type=int,
+        default=None,
+        help="Build the index out of core, spilling sorted runs beyond this budget",
+    )
+    parser.add_argument(
+        "--max_df",
+        type=parse_max_df,
+        default=None,
+        help="Drop keywords in more than this many documents (or fraction, e.g. 0.5)",
+    )
+    parser.add_argument(
+        "--stopwords",
+        type=str,
+        default=None,
+        help="File of whitespace-separated words that are never keywords",
+    )
+    parser.add_argument("--min_token_length", type=int, default=1)
+    parser.add_argument("--max_token_length", type=int, default=None)
+    args = parser.parse_args()
+
+    file_key, index_key = load_keys(args.key_file)
+    index_builder = rebuild_index(
+        file_key,
+        index_key,
+        args.threshold,
+        args.file_dir,
+        args.index_path,
+        args.keywords_path,
+        args.memory_budget_mb << 20 if args.memory_budget_mb is not None else None,
+        max_df=args.max_df,
+        stopwords=read_stopwords(args.stopwords) if args.stopwords else None,
+        min_token_length=args.min_token_length,
+        max_token_length=args.max_token_length,
+    )
+    print(index_builder.format_pruning_report())
+    print(f"Rebuilt index with {len(index_builder.keywords_list)} keyword(s)")
@@ -1,14 +1,23 @@
 import base64
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+import json
+from typing import Literal
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 import requests
 import LSSS
 import pickle
 
 from encrypt_keyword import symmetric_encryption_for_keyword
-from sort_enc_result import sort_enc_result
-import enc_rust
+from sort_enc_result import (
+    sort_multi_result,
+    sort_packed_result,
+    sort_ranked_prefixes,
+)
+import posting_wire
+import doc_codec
+from my import decrypt_doc, decrypt_doc_bytes, iter_decrypt_doc
 
 
 class QueryRequest(BaseModel):
@@ -19,6 +28,24 @@ class QueryRequest(BaseModel):
     secret_num: int = Field(strict=True, ge=0)
     group_num: int = Field(strict=True, ge=0)
     query_keyword: str
+    # 多关键词查询时的全部关键词，非空时忽略query_keyword
+    query_keywords: list[str] = []
+    mode: Literal["and", "or"] = "and"
+    # 多关键词查询的得分方式
+    scoring: Literal["tf", "tfidf"] = "tf"
+    # 跳过排名前offset个文档后最多返回top_k个，top_k为空时返回全部
+    top_k: int | None = Field(default=None, ge=1)
+    offset: int = Field(default=0, ge=0)
+
+
+class PageRequest(BaseModel):
+    pseudo_shares_base64: str = Field(min_length=1)
+    secret_num: int = Field(strict=True, ge=0)
+    group_num: int = Field(strict=True, ge=0)
+    query_keyword: str
+    # 上一页返回的next_cursor，为空时从第一页开始
+    cursor: str | None = None
+    page_size: int = Field(default=1024, ge=1)
 
 
 class GetFileRequest(BaseModel):
@@ -66,6 +93,108 @@ def search_encrypted_index_request(token: bytes) -> str:
         raise Exception(f"Error: Failed to send HTTP request to Cloud.")
 
 
+def search_encrypted_index_binary(
+    token: bytes, offset: int = 0, limit: int | None = None
+) -> tuple[memoryview, bool]:
+    """服务器端搜索，以posting_wire格式接收结果
+
+    索引按词频排序时服务器只返回第[offset, offset+limit)个posting。
+
+    Returns:
+        tuple[memoryview, bool]: 首尾相接的定长记录 词频密文(16) || doc_id密文(16)，
+            以及记录是否只是候选集合（需要排序后再跳过offset条、截取limit条）
+    """
+    payload = {
+        "token_base64": base64.b64encode(token).decode("utf-8"),
+        "offset": offset,
+        "limit": limit,
+    }
+    try:
+        response = requests.post(
+            url="http://localhost:8004/search_server_binary",
+            json=payload,
+        )
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        raise Exception(f"Error: Failed to send HTTP request to Cloud.")
+    flags = posting_wire.read_flags(response.content)
+    return posting_wire.decode(response.content), bool(flags & posting_wire.CANDIDATES)
+
+
+def search_multi_request(tokens: list[bytes], mode: str):
+    """服务器端多关键词查询
+
+    Returns:
+        tuple[list[memoryview], list[int], int]: 每个关键词的定长记录（and时只含共同的文档）、
+            每个关键词求交集前的posting数，以及文档总数
+    """
+    payload = {
+        "tokens_base64": [base64.b64encode(token).decode("utf-8") for token in tokens],
+        "mode": mode,
+    }
+    try:
+        response = requests.post(
+            url="http://localhost:8004/search_multi",
+            json=payload,
+        )
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        raise Exception(f"Error: Failed to send HTTP request to Cloud.")
+    doc_freqs = response.headers[posting_wire.POSTING_COUNTS_HEADER].split(",")
+    return (
+        posting_wire.decode_many(response.content),
+        [int(doc_freq) for doc_freq in doc_freqs],
+        int(response.headers[posting_wire.DOCUMENT_COUNT_HEADER]),
+    )
+
+
+# 每次查找的文档数上限，与服务器的MAX_PAGE_SIZE一致
+LOOKUP_BATCH_SIZE = 1 << 16
+
+
+def lookup_postings_request(tokens: list[bytes], doc_id_encs: list[bytes]) -> list:
+    """从云服务器读取每个关键词中指定文档的定长记录，文档较多时分批请求"""
+    parts = [[] for _ in tokens]
+    for start in range(0, len(doc_id_encs), LOOKUP_BATCH_SIZE):
+        payload = {
+            "tokens_base64": [
+                base64.b64encode(token).decode("utf-8") for token in tokens
+            ],
+            "doc_ids_base64": [
+                base64.b64encode(doc_id_enc).decode("utf-8")
+                for doc_id_enc in doc_id_encs[start : start + LOOKUP_BATCH_SIZE]
+            ],
+        }
+        try:
+            response = requests.post(
+                url="http://localhost:8004/lookup_postings",
+                json=payload,
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            raise Exception(f"Error: Failed to send HTTP request to Cloud.")
+        for part, records in zip(parts, posting_wire.decode_many(response.content)):
+            part.append(records)
+    return [b"".join(part) for part in parts]
+
+
+def posting_counts_request(tokens: list[bytes]) -> tuple[list[int], int]:
+    """从云服务器读取每个关键词的posting数和文档总数，不传输postings"""
+    payload = {
+        "tokens_base64": [base64.b64encode(token).decode("utf-8") for token in tokens]
+    }
+    try:
+        response = requests.post(
+            url="http://localhost:8004/posting_counts",
+            json=payload,
+        )
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        raise Exception(f"Error: Failed to send HTTP request to Cloud.")
+    counts = response.json()
+    return counts["posting_counts"], counts["document_count"]
+
+
 DEFAULT_SGX_SHARE_PATH = "index_key_shares_sgx.bin"
 
 pseudo_shares_sgx: dict[tuple[int, int], bytes] = {}
@@ -106,23 +235,151 @@ async def handle_search_request(request: QueryRequest):
             pseudo_shares, request.secret_num, request.group_num
         ).to_bytes(16)
 
+        # 多关键词查询在服务器端求交集/并集，按文档合并得分后取前top_k个
+        if request.query_keywords:
+            tokens = [
+                generate_token(index_key, keyword) for keyword in request.query_keywords
+            ]
+            end = None if request.top_k is None else request.offset + request.top_k
+            sorted_results = None
+            if request.mode == "or" and end is not None:
+                # 索引按词频排序时只读取各关键词的前缀，读到能确定前end个文档为止
+                doc_freqs = doc_count = None
+                if request.scoring == "tfidf":
+                    doc_freqs, doc_count = posting_counts_request(tokens)
+                sorted_results = sort_ranked_prefixes(
+                    lambda i, offset, limit: search_encrypted_index_binary(
+                        tokens[i], offset, limit
+                    ),
+                    lambda doc_id_encs: lookup_postings_request(tokens, doc_id_encs),
+                    len(tokens),
+                    index_key,
+                    end,
+                    request.scoring,
+                    doc_freqs,
+                    doc_count,
+                )
+            if sorted_results is None:
+                record_lists, doc_freqs, doc_count = search_multi_request(
+                    tokens, request.mode
+                )
+                sorted_results = sort_multi_result(
+                    record_lists, index_key, end, request.scoring, doc_freqs, doc_count
+                )
+            return {"sorted_results": sorted_results[request.offset :]}
+
         # 2. 生成令牌
         token = generate_token(index_key, request.query_keyword)
 
-        # 3. 服务器端搜索（示例调用）
-        search_results_base64 = search_encrypted_index_request(token)
-        search_results = pickle.loads(base64.b64decode(search_results_base64))
+        # 3. 服务器端搜索，结果为定长记录，不需要反序列化；
+        # 索引按词频排序时只传输和解密前top_k个posting
+        search_results, candidates = search_encrypted_index_binary(
+            token, request.offset, request.top_k
+        )
 
-        # 5. 排序后返回
-        return {
-            "sorted_results": sort_enc_result(search_results, index_key),
-        }
+        # 4. 整段批量解密，排序后返回
+        sorted_results = sort_packed_result(search_results, index_key)
+        if candidates:
+            end = None if request.top_k is None else request.offset + request.top_k
+            sorted_results = sorted_results[request.offset : end]
+        return {"sorted_results": sorted_results}
 
     except Exception as e:
         # 添加具体的异常处理逻辑
         raise RuntimeError(f"Search failed: {str(e)}")
 
 
+def combine_index_key(request: PageRequest) -> bytes:
+    """用用户和SGX保存的伪份额恢复索引密钥"""
+    pseudo_shares = [
+        base64.b64decode(request.pseudo_shares_base64),
+        pseudo_shares_sgx.get((request.secret_num, request.group_num)),
+    ]
+    return combine_secret(
+        pseudo_shares, request.secret_num, request.group_num
+    ).to_bytes(16)
+
+
+def raise_for_cloud_status(response):
+    """云服务器返回的400（游标无效）和409（索引已变化）原样转给客户端，其余错误抛出异常"""
+    if response.status_code in (400, 409):
+        raise HTTPException(response.status_code, response.json()["detail"])
+    response.raise_for_status()
+
+
+def search_page_request(token: bytes, cursor: str | None, page_size: int):
+    """从云服务器读取一页postings，返回(定长记录, 下一页游标)"""
+    payload = {
+        "token_base64": base64.b64encode(token).decode("utf-8"),
+        "cursor": cursor,
+        "page_size": page_size,
+    }
+    try:
+        response = requests.post(
+            url="http://localhost:8004/search_server_page",
+            json=payload,
+        )
+    except requests.exceptions.RequestException:
+        raise Exception(f"Error: Failed to send HTTP request to Cloud.")
+    raise_for_cloud_status(response)
+    next_cursor = response.headers.get("X-Next-Cursor")
+    return posting_wire.decode(response.content), next_cursor
+
+
+@app.post("/search_page")
+def handle_search_page(request: PageRequest):
+    """分页查询：每页按存储顺序取page_size个posting，解密后按词频排序返回
+
+    索引按词频排序时各页依次就是全局的词频降序。next_cursor为空表示已是最后一页；
+    索引在翻页期间变化时返回409，需要从第一页重新查询。
+    """
+    index_key = combine_index_key(request)
+    token = generate_token(index_key, request.query_keyword)
+    records, next_cursor = search_page_request(
+        token, request.cursor, request.page_size
+    )
+    return {
+        "sorted_results": sort_packed_result(records, index_key),
+        "next_cursor": next_cursor,
+    }
+
+
+@app.post("/search_stream")
+def handle_search_stream(request: PageRequest):
+    """流式查询：边从云服务器接收postings边逐页解密，每页输出一行JSON [[tf, doc_id], ...]
+
+    客户端收到第一行即可开始显示结果，峰值内存只与page_size有关。
+    """
+    index_key = combine_index_key(request)
+    token = generate_token(index_key, request.query_keyword)
+    try:
+        response = requests.post(
+            url="http://localhost:8004/search_server_stream",
+            json={
+                "token_base64": base64.b64encode(token).decode("utf-8"),
+                "cursor": request.cursor,
+                "page_size": request.page_size,
+            },
+            stream=True,
+        )
+    except requests.exceptions.RequestException:
+        raise Exception(f"Error: Failed to send HTTP request to Cloud.")
+    # 开始流式返回之前检查状态，之后就无法再修改响应状态码
+    try:
+        raise_for_cloud_status(response)
+    except Exception:
+        response.close()
+        raise
+
+    def iter_pages():
+        with response:
+            chunks = response.iter_content(FILE_STREAM_BLOCK_SIZE)
+            for records in posting_wire.iter_decode(chunks):
+                yield json.dumps(sort_packed_result(records, index_key)) + "\n"
+
+    return StreamingResponse(iter_pages(), media_type="application/x-ndjson")
+
+
 @app.post("/get_file")
 async def get_file(request: GetFileRequest):
     # 服务器端获取文件
@@ -151,7 +408,10 @@ async def get_file(request: GetFileRequest):
         ).to_bytes(16)
 
         # 2. 解密文件
-        file_data = enc_rust.aes_gcm_decrypt(file_key, enc_file_data)
+        zdict = None
+        if doc_codec.read_codec(enc_file_data) == doc_codec.ZLIB_DICT:
+            zdict = fetch_zdict(file_key)
+        file_data = decrypt_doc(enc_file_data, file_key, zdict)
 
         return {"file_data": file_data}
     except requests.exceptions.RequestException:
@@ -161,6 +421,69 @@ async def get_file(request: GetFileRequest):
         raise RuntimeError(f"Get file failed: {str(e)}")
 
 
+def fetch_zdict(file_key: bytes) -> bytes | None:
+    """从云服务器获取加密的zlib预设字典并解密，没有字典时返回None"""
+    try:
+        response = requests.post(url="http://localhost:8004/get_zdict")
+    except requests.exceptions.RequestException:
+        raise Exception(f"Error: Failed to send HTTP request to Cloud.")
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return decrypt_doc_bytes(response.content, file_key)
+
+
+# 从云服务器读取密文时每次读取的字节数
+FILE_STREAM_BLOCK_SIZE = 1 << 16
+
+
+@app.post("/get_file_stream")
+def get_file_stream(request: GetFileRequest):
+    """边从云服务器读取密文边解密，逐段把明文以UTF-8文本流返回
+
+    分段加密的文档每段认证通过后才会输出；最后一段认证失败时连接会被中断，
+    客户端据此可以发现文档不完整。
+    """
+    # 1. 组合密钥
+    pseudo_shares_user = base64.b64decode(request.file_key_share)
+    pseudo_shares = [
+        pseudo_shares_user,
+        pseudo_shares_sgx.get((request.secret_num, request.group_num)),
+    ]
+    file_key: bytes = combine_secret(
+        pseudo_shares, request.secret_num, request.group_num
+    ).to_bytes(16)
+
+    # 2. 从云服务器流式读取密文
+    try:
+        response = requests.post(
+            url="http://localhost:8004/get_file_stream",
+            json={"file_id": request.file_id},
+            stream=True,
+        )
+    except requests.exceptions.RequestException:
+        raise Exception(f"Error: Failed to send HTTP request to Cloud.")
+    if response.status_code == 404:
+        response.close()
+        raise HTTPException(status_code=404, detail="File not found")
+    response.raise_for_status()
+
+    # 3. 逐段解密并返回；用预设字典压缩的文档先获取字典
+    blocks = response.iter_content(FILE_STREAM_BLOCK_SIZE)
+    first_block = next(blocks, b"")
+    zdict = None
+    if doc_codec.read_codec(first_block) == doc_codec.ZLIB_DICT:
+        zdict = fetch_zdict(file_key)
+
+    def iter_plaintext():
+        from itertools import chain
+
+        with response:
+            yield from iter_decrypt_doc(chain([first_block], blocks), file_key, zdict)
+
+    return StreamingResponse(iter_plaintext(), media_type="text/plain; charset=utf-8")
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,35 +1,125 @@
 import base64
 from contextlib import asynccontextmanager
+import os
 import pickle
-from fastapi import FastAPI
+import struct
+from typing import Literal
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
 import uvicorn
 
+from doc_store import TABLE_NAME, DocDirectory, DocStore, load_zdict, open_doc_store
+from index_format import MappedIndex, SegmentedIndex, manifest_path, open_index
+import posting_lists
+import posting_wire
+
 DEFAULT_INDEX_PATH = "./index.bin"
+DEFAULT_FILE_DIR = "encrypted_docs_finance"
+# 流式返回密文文档时每次读取的字节数
+FILE_STREAM_BLOCK_SIZE = 1 << 16
+# 分页返回postings时每页的最大posting数
+MAX_PAGE_SIZE = 1 << 16
+# 分页查询时携带下一页游标的响应头
+CURSOR_HEADER = "X-Next-Cursor"
 
 
 class Token(BaseModel):
     token_base64: str = Field(min_length=1)
 
 
+class RankedQuery(Token):
+    # 只返回按词频排序的第[offset, offset+limit)个posting，limit为空时返回到末尾
+    offset: int = Field(default=0, ge=0)
+    limit: int | None = Field(default=None, ge=1)
+
+
+class PageQuery(Token):
+    # 上一页响应中的游标，为空时从第一页开始
+    cursor: str | None = None
+    page_size: int = Field(default=1024, ge=1, le=MAX_PAGE_SIZE)
+
+
+class TokenList(BaseModel):
+    tokens_base64: list[str] = Field(min_length=1)
+
+
+class MultiTokenQuery(TokenList):
+    mode: Literal["and", "or"] = posting_lists.AND
+
+
 class GetFileRequest(BaseModel):
     file_id: int = Field(strict=True, ge=0)
 
-inverted_index: dict[bytes, list] = {}
+
+inverted_index: "dict[bytes, list] | MappedIndex | SegmentedIndex" = {}
+doc_store: "DocStore | DocDirectory" = DocDirectory(DEFAULT_FILE_DIR)
+# 已加载的文档存储中的文档数，打开时统计一次，不在每次查询时扫描文档表
+document_count = 0
+# 已加载的索引和文档表对应的文件版本
+loaded_version = None
+
+
+def _file_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def data_version():
+    """索引文件、索引清单和文档表的版本，增量添加或删除文档后发生变化"""
+    return tuple(
+        _file_version(path)
+        for path in (
+            DEFAULT_INDEX_PATH,
+            manifest_path(DEFAULT_INDEX_PATH),
+            os.path.join(DEFAULT_FILE_DIR, TABLE_NAME),
+        )
+    )
+
+
+def reload_if_changed():
+    """文件有变化时重新打开索引和文档存储
+
+    旧对象不主动关闭，正在进行的流式读取结束后由垃圾回收释放。
+    索引或文档表正在被替换（例如合并段时旧段已删除）而打开失败时，继续使用已加载的
+    对象且不记录新版本，下一次请求时重试；还没有构建索引时返回空结果。
+    """
+    global inverted_index, doc_store, document_count, loaded_version
+    version = data_version()
+    if version == loaded_version:
+        return
+    index_version, manifest_version, _ = version
+    try:
+        if index_version is None and manifest_version is None:
+            index = {}
+        else:
+            # 二进制索引以mmap方式打开，不反序列化，多个进程共享页缓存；
+            # 有追加段时查询会合并各段的postings
+            index = open_index(DEFAULT_INDEX_PATH)
+        # 分段存储通过docs.idx定位密文，旧目录仍按文件读取
+        store = open_doc_store(DEFAULT_FILE_DIR)
+        count = len(store)
+    except (OSError, ValueError, KeyError, EOFError, struct.error, pickle.PickleError):
+        return
+    inverted_index, doc_store, document_count = index, store, count
+    loaded_version = version
 
 
 @asynccontextmanager
 async def load_index(app: FastAPI):
-    try:
-        index: dict[bytes, list] = pickle.load(open(DEFAULT_INDEX_PATH, "rb"))
-        global inverted_index
-        inverted_index = index
-    except:
-        pass
+    global inverted_index, loaded_version
+    reload_if_changed()
 
     yield
 
+    if isinstance(inverted_index, (MappedIndex, SegmentedIndex)):
+        inverted_index.close()
     inverted_index = {}
+    doc_store.close()
+    loaded_version = None
 
 
 app = FastAPI(lifespan=load_index)
@@ -39,6 +129,7 @@ app = FastAPI(lifespan=load_index)
 async def search_server(token_base64: Token):
     # 将token从base64解码
     token = base64.b64decode(token_base64.token_base64)
+    reload_if_changed()
     # 读取index
     try:
         # 得到结果，序列化后返回
@@ -51,15 +142,213 @@ async def search_server(token_base64: Token):
         return {"results": []}
 
 
+@app.post("/search_server_binary")
+async def search_server_binary(query: RankedQuery):
+    """以posting_wire格式返回postings，定长记录直接从索引复制，不经过pickle和base64
+
+    索引按词频排序时只读取并返回[offset, offset+limit)区间的postings；
+    否则返回候选记录并设置CANDIDATES标志。
+    """
+    token = base64.b64decode(query.token_base64)
+    reload_if_changed()
+    records = get_records(token, query.offset, query.limit)
+    exact = (query.offset == 0 and query.limit is None) or getattr(
+        inverted_index, "ranked", False
+    )
+    flags = 0 if exact else posting_wire.CANDIDATES
+    return Response(
+        posting_wire.encode(records, flags), media_type=posting_wire.MEDIA_TYPE
+    )
+
+
+def get_records(token: bytes, offset: int = 0, limit: int | None = None) -> bytes:
+    """token的postings拼接成的定长记录，不存在时为空，offset/limit见MappedIndex"""
+    if isinstance(inverted_index, (MappedIndex, SegmentedIndex)):
+        return inverted_index.get_records(token, offset, limit) or b""
+    postings = inverted_index.get(token, [])
+    return b"".join(tf_enc + doc_id_enc for tf_enc, doc_id_enc in postings)
+
+
+def posting_count(token: bytes) -> int:
+    """token的posting数，即其文档频率"""
+    if isinstance(inverted_index, (MappedIndex, SegmentedIndex)):
+        return inverted_index.posting_count(token)
+    return len(inverted_index.get(token, []))
+
+
+def lookup_records(token: bytes, doc_id_encs) -> bytes:
+    """token的postings中属于doc_id_encs的定长记录，按doc_id密文排序"""
+    if isinstance(inverted_index, (MappedIndex, SegmentedIndex)):
+        return inverted_index.lookup(token, doc_id_encs)
+    return posting_lists.lookup(get_records(token), doc_id_encs)
+
+
+def read_page(index, token: bytes, cursor, page_size: int):
+    """按存储顺序读取一页定长记录，返回(记录, 下一页游标)，见MappedIndex.read_page"""
+    if isinstance(index, (MappedIndex, SegmentedIndex)):
+        return index.read_page(token, cursor, page_size)
+    postings = index.get(token, [])
+    stop = min(cursor[1] + page_size, len(postings))
+    records = b"".join(tf + doc_id for tf, doc_id in postings[cursor[1] : stop])
+    return records, (0, stop) if stop < len(postings) else None
+
+
+def format_cursor(cursor) -> str:
+    """把(段号, 段内序号)编码为带索引版本的游标字符串"""
+    return "{}.{}.{}".format(_version_tag(), *cursor)
+
+
+def parse_cursor(cursor: str | None):
+    """解析游标，索引在两次请求之间发生变化时返回409，客户端需要重新查询"""
+    if cursor is None:
+        return 0, 0
+    try:
+        tag, number, position = cursor.split(".")
+        number, position = int(number), int(position)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if tag != _version_tag():
+        raise HTTPException(status_code=409, detail="Index changed, restart the query")
+    return number, position
+
+
+def _version_tag() -> str:
+    from hashlib import blake2b
+
+    return blake2b(repr(loaded_version).encode(), digest_size=8).hexdigest()
+
+
+@app.post("/search_server_page")
+async def search_server_page(query: PageQuery):
+    """按存储顺序分页返回postings（posting_wire格式）
+
+    索引按词频排序时存储顺序就是词频降序。下一页的游标放在X-Next-Cursor响应头中，
+    最后一页没有该响应头。
+    """
+    token = base64.b64decode(query.token_base64)
+    reload_if_changed()
+    cursor = parse_cursor(query.cursor)
+    records, next_cursor = read_page(inverted_index, token, cursor, query.page_size)
+    headers = {}
+    if next_cursor is not None:
+        headers[CURSOR_HEADER] = format_cursor(next_cursor)
+    return Response(
+        posting_wire.encode(records),
+        media_type=posting_wire.MEDIA_TYPE,
+        headers=headers,
+    )
+
+
+@app.post("/search_server_stream")
+async def search_server_stream(query: PageQuery):
+    """以分块传输逐页返回全部postings，每页为一段posting_wire格式
+
+    每次只在内存中保留一页，客户端收到第一页即可开始解密；至少返回一页（可能为空）。
+    """
+    token = base64.b64decode(query.token_base64)
+    reload_if_changed()
+    cursor = parse_cursor(query.cursor)
+    # 固定本次查询使用的索引，期间重新加载不影响已开始的流
+    index = inverted_index
+
+    def pages():
+        next_cursor = cursor
+        while next_cursor is not None:
+            records, next_cursor = read_page(index, token, next_cursor, query.page_size)
+            yield posting_wire.encode(records)
+
+    return StreamingResponse(pages(), media_type=posting_wire.MEDIA_TYPE)
+
+
+@app.post("/search_multi")
+async def search_multi(query: MultiTokenQuery):
+    """多关键词查询，按请求顺序返回每个关键词的一段posting_wire格式结果
+
+    mode为and时只返回doc_id出现在所有关键词结果中的postings，二进制索引直接在
+    保存的文档序上求交集；为or时并集就是全部postings，原样返回，
+    由可信端合并各文档的得分。
+    """
+    tokens = [base64.b64decode(token) for token in query.tokens_base64]
+    reload_if_changed()
+    # tf-idf需要求交集前的文档频率和文档总数，服务器本来就知道这些数量
+    headers = {
+        posting_wire.POSTING_COUNTS_HEADER: ",".join(
+            str(posting_count(token)) for token in tokens
+        ),
+        posting_wire.DOCUMENT_COUNT_HEADER: str(document_count),
+    }
+    if query.mode == posting_lists.OR:
+        record_lists = [get_records(token) for token in tokens]
+    elif isinstance(inverted_index, (MappedIndex, SegmentedIndex)):
+        record_lists = inverted_index.intersect(tokens)
+    else:
+        record_lists = posting_lists.intersect([get_records(t) for t in tokens])
+    content = b"".join(posting_wire.encode(records) for records in record_lists)
+    return Response(content, media_type=posting_wire.MEDIA_TYPE, headers=headers)
+
+
+class LookupQuery(TokenList):
+    # 要查找的doc_id密文
+    doc_ids_base64: list[str] = Field(max_length=MAX_PAGE_SIZE)
+
+
+@app.post("/lookup_postings")
+async def lookup_postings(query: LookupQuery):
+    """按请求顺序返回每个关键词中指定文档的postings，每个关键词一段posting_wire格式
+
+    可信端按前缀读取按词频排序的posting列表确定前k个文档后，用它补全这些文档在
+    其余关键词中的词频。doc_id密文在同一索引中是确定的，服务器在文档序上二分查找。
+    """
+    tokens = [base64.b64decode(token) for token in query.tokens_base64]
+    doc_id_encs = [base64.b64decode(doc_id) for doc_id in query.doc_ids_base64]
+    reload_if_changed()
+    content = b"".join(
+        posting_wire.encode(lookup_records(token, doc_id_encs)) for token in tokens
+    )
+    return Response(content, media_type=posting_wire.MEDIA_TYPE)
+
+
+@app.post("/posting_counts")
+async def posting_counts(query: TokenList):
+    """每个关键词的posting数（文档频率）和文档总数，不返回postings
+
+    可信端按前缀读取按词频排序的posting列表时，用它计算tf-idf权重。
+    """
+    tokens = [base64.b64decode(token) for token in query.tokens_base64]
+    reload_if_changed()
+    return {
+        "posting_counts": [posting_count(token) for token in tokens],
+        "document_count": document_count,
+    }
+
+
 @app.post("/get_file")
 async def get_file(file_id: GetFileRequest):
-    try:
-        with open(f"encrypted_docs_finance/{file_id.file_id}", "rb") as f:
-            file_data = f.read()
-        file_data_base64 = base64.b64encode(file_data).decode("utf-8")
-        return {"file_data_base64": file_data_base64}
-    except FileNotFoundError:
+    reload_if_changed()
+    file_data = doc_store.get(file_id.file_id)
+    if file_data is None:
         return {"file_data_base64": None}
+    file_data_base64 = base64.b64encode(file_data).decode("utf-8")
+    return {"file_data_base64": file_data_base64}
+
+
+@app.post("/get_file_stream")
+async def get_file_stream(file_id: GetFileRequest):
+    """以原始字节流返回密文文档，不做base64编码，也不把整个文件读入内存"""
+    reload_if_changed()
+    blocks = doc_store.iter_document(file_id.file_id, FILE_STREAM_BLOCK_SIZE)
+    if blocks is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return StreamingResponse(blocks, media_type="application/octet-stream")
+
+
+@app.post("/get_zdict")
+async def get_zdict():
+    """返回加密的zlib预设字典，文档未使用字典压缩时返回404"""
+    encrypted_zdict = load_zdict(DEFAULT_FILE_DIR)
+    if encrypted_zdict is None:
+        raise HTTPException(status_code=404, detail="No preset dictionary")
+    return Response(encrypted_zdict, media_type="application/octet-stream")
 
 
 if __name__ == "__main__":
@@ -1,28 +1,180 @@
 import base64
 import encrypt_keyword
+import posting_wire
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 
 
 def sort_enc_result(enc_result_list, index_key):
-    # 先解密enc_result_list
-    plain_result_list = []
-    for enc_result in enc_result_list:
-        plain_tf_str = encrypt_keyword.symmetric_decryption_for_keyword(
-            index_key, enc_result[0]
-        )
-        plain_doc_id_str = encrypt_keyword.symmetric_decryption_for_keyword(
-            index_key, enc_result[1]
-        )
-        plain_tf = int(plain_tf_str)
-        plain_doc_id = int(plain_doc_id_str)
-        plain_result = (plain_tf, plain_doc_id)
-        plain_result_list.append(plain_result)
-        # 对plain_result_list按照tf进行排序
+    # 先批量解密enc_result_list中的词频和文档ID
+    plain_tf_strs = encrypt_keyword.symmetric_decryption_for_keywords(
+        index_key, [enc_result[0] for enc_result in enc_result_list]
+    )
+    plain_doc_id_strs = encrypt_keyword.symmetric_decryption_for_keywords(
+        index_key, [enc_result[1] for enc_result in enc_result_list]
+    )
+    plain_result_list = [
+        (int(plain_tf_str), int(plain_doc_id_str))
+        for plain_tf_str, plain_doc_id_str in zip(plain_tf_strs, plain_doc_id_strs)
+    ]
+    # 对plain_result_list按照tf进行排序
+    plain_result_list.sort(key=lambda x: x[0], reverse=True)
+    return plain_result_list
+
+
+def sort_packed_result(records, index_key):
+    # records为posting_wire格式的定长记录：词频密文(16) || doc_id密文(16)，
+    # 整段一次解密，偶数位置为词频，奇数位置为文档ID
+    plain_strs = encrypt_keyword.symmetric_decryption_for_blocks(index_key, records)
+    plain_result_list = [
+        (int(plain_tf_str), int(plain_doc_id_str))
+        for plain_tf_str, plain_doc_id_str in zip(plain_strs[0::2], plain_strs[1::2])
+    ]
     plain_result_list.sort(key=lambda x: x[0], reverse=True)
     return plain_result_list
 
 
+def decrypt_packed_arrays(records, index_key):
+    # 整段定长记录一次解密，返回(词频数组, 文档ID数组)
+    import numpy as np
+
+    plain_strs = encrypt_keyword.symmetric_decryption_for_blocks(index_key, records)
+    tfs = np.array(plain_strs[0::2], dtype=str).astype(np.int64)
+    doc_ids = np.array(plain_strs[1::2], dtype=str).astype(np.int64)
+    return tfs, doc_ids
+
+
+def keyword_weights(list_count, scoring="tf", doc_freqs=None, doc_count=None):
+    # 每个关键词的词频权重：scoring为"tf"时均为1；为"tfidf"时为
+    # log((1 + n) / (1 + df)) + 1，df为该关键词在整个索引中的posting数（doc_freqs，
+    # and查询求交集前的数量），n为文档总数（doc_count），均由服务器提供
+    import numpy as np
+
+    if scoring == "tf":
+        return [1] * list_count
+    if scoring != "tfidf":
+        raise ValueError(f"Unknown scoring: {scoring}")
+    if doc_freqs is None or doc_count is None:
+        raise ValueError("tfidf scoring needs doc_freqs and doc_count")
+    return (np.log((1 + doc_count) / (1 + np.array(doc_freqs))) + 1).tolist()
+
+
+def sort_multi_result(
+    record_lists, index_key, k=None, scoring="tf", doc_freqs=None, doc_count=None
+):
+    # 多关键词查询：各关键词的定长记录拼接后一次解密，在NumPy中按文档累加得分，
+    # 再用堆选出得分最高的k个文档（k为空时返回全部），返回[(得分, 文档ID), ...]。
+    # 得分为各关键词的词频乘以权重（见keyword_weights）之和。
+    # 这里解密并累加全部postings，只有结果堆与k有关；or查询在按词频排序的索引上
+    # 用sort_ranked_prefixes只读取各关键词的前缀
+    import heapq
+    import numpy as np
+
+    weights = keyword_weights(len(record_lists), scoring, doc_freqs, doc_count)
+    lengths = [len(records) // posting_wire.RECORD_SIZE for records in record_lists]
+    tfs, doc_ids = decrypt_packed_arrays(b"".join(record_lists), index_key)
+    docs, inverse = np.unique(doc_ids, return_inverse=True)
+    if scoring == "tf":
+        scores = np.bincount(inverse, weights=tfs).astype(np.int64)
+    else:
+        scores = np.bincount(inverse, weights=tfs * np.repeat(weights, lengths))
+    # 堆中只保留k个文档；得分相同时按文档ID升序
+    return heapq.nlargest(
+        len(docs) if k is None else k,
+        zip(scores.tolist(), docs.tolist()),
+        key=lambda x: x[0],
+    )
+
+
+def sort_ranked_prefixes(
+    fetch,
+    lookup,
+    list_count,
+    index_key,
+    k,
+    scoring="tf",
+    doc_freqs=None,
+    doc_count=None,
+):
+    # or查询得分最高的k个文档，结果与sort_multi_result相同，但只读取各关键词
+    # 按词频降序排列（FLAG_RANKED）的posting列表的前缀：第一轮每个列表读k条，
+    # 之后每轮翻倍。已读到的文档得分下界为已见的加权词频之和，上界再加上在还没读到
+    # 它的列表中可能的最大值，即该列表最后读到的加权词频；没有读到的文档得分不超过
+    # 各列表最后读到的加权词频之和。第k个下界大于这个和时停止读取前缀，只需按doc_id
+    # 查找上界不小于第k个下界的已读文档在其余列表中的posting，得到准确得分后取前k个。
+    # 传输、解密和内存只与读到的前缀长度和候选文档数有关，与posting总数无关。
+    #
+    # fetch(i, offset, limit)返回第i个关键词第[offset, offset+limit)个posting的
+    # (定长记录, 是否为候选集合)；lookup(doc_id_encs)返回每个关键词中这些文档的
+    # 定长记录。索引没有按词频排序、服务器只能返回候选集合时返回None，
+    # 由调用方读取全部postings后用sort_multi_result排序
+    import heapq
+
+    weights = keyword_weights(list_count, scoring, doc_freqs, doc_count)
+    # 文档ID -> [已见的加权词频之和, 已读到该文档的列表的位掩码]
+    seen = {}
+    offsets = [0] * list_count
+    # 各列表剩余posting的最大加权词频，列表读完后为0
+    bounds = [0] * list_count
+    exhausted = [False] * list_count
+
+    def add(i, records):
+        tfs, doc_ids = decrypt_packed_arrays(records, index_key)
+        for tf, doc_id in zip(tfs.tolist(), doc_ids.tolist()):
+            entry = seen.setdefault(doc_id, [0, 0])
+            if not entry[1] >> i & 1:
+                entry[0] += tf * weights[i]
+                entry[1] |= 1 << i
+        return tfs
+
+    def upper(entry):
+        score, mask = entry
+        return score + sum(b for i, b in enumerate(bounds) if not mask >> i & 1)
+
+    limit = k
+    while True:
+        for i in range(list_count):
+            if exhausted[i]:
+                continue
+            records, candidates = fetch(i, offsets[i], limit)
+            if candidates:
+                return None
+            tfs = add(i, records)
+            offsets[i] += len(tfs)
+            exhausted[i] = len(tfs) < limit
+            bounds[i] = 0 if exhausted[i] else int(tfs[-1]) * weights[i]
+        if all(exhausted):
+            break
+        if len(seen) >= k:
+            kth = heapq.nlargest(k, (entry[0] for entry in seen.values()))[-1]
+            if kth > sum(bounds):
+                break
+        limit *= 2
+
+    # 上界小于第k个下界的文档不可能进入前k个；上界相等时得分可能相同而文档ID更小，
+    # 也需要准确得分。读完的列表中没有出现的文档词频为0，其余列表按doc_id查找
+    kth = heapq.nlargest(k, (entry[0] for entry in seen.values()))[-1] if seen else 0
+    candidates = [doc_id for doc_id, entry in seen.items() if upper(entry) >= kth]
+    missing = [
+        doc_id
+        for doc_id in candidates
+        if any(
+            not seen[doc_id][1] >> i & 1 and not exhausted[i]
+            for i in range(list_count)
+        )
+    ]
+    if missing:
+        doc_id_encs = encrypt_keyword.symmetric_encryption_for_keywords(
+            index_key, [str(doc_id) for doc_id in missing]
+        )
+        for i, records in enumerate(lookup(doc_id_encs)):
+            add(i, records)
+    # 得分相同时按文档ID升序，与sort_multi_result一致
+    return sorted(
+        ((seen[doc_id][0], doc_id) for doc_id in candidates),
+        key=lambda x: (-x[0], x[1]),
+    )[:k]
+
 app = FastAPI()
 
 
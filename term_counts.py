@@ -0,0 +1,287 @@
+"""紧凑的词频统计结构
+
+单词被映射为整数id（words[id] -> 单词，vocab[单词] -> id），每个文档的词频按CSR格式
+保存在NumPy数组中：第i个文档的(单词id, 词频)位于term_ids/counts的
+[doc_offsets[i], doc_offsets[i+1])区间内。相比嵌套的dict，每条记录只占8字节。
+"""
+
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+
+class TermCounts(Mapping):
+    """按文档存储的词频统计，结构为 {doc_id: {word: count}} 的只读映射视图
+
+    文档通过add_document逐个追加，新增数据先缓存在array中，
+    访问数组属性时再合并为连续的NumPy数组。
+    """
+
+    # 缓存的文档数达到该值后转为NumPy数组块
+    FLUSH_DOCS = 1 << 16
+
+    def __init__(self):
+        self.vocab: dict[str, int] = {}
+        self.words: list[str] = []
+        # 已转换的数组块，每块为(doc_ids, doc_lengths, term_ids, counts)
+        self._chunks: list[tuple[np.ndarray, ...]] = []
+        self._offsets: np.ndarray | None = None
+        self._rows: dict | None = None
+        self._reset_pending()
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """从 {doc_id: {word: count}} 结构构建"""
+        term_counts = cls()
+        for doc_id, word_counts in mapping.items():
+            term_counts.add_document(doc_id, word_counts)
+        return term_counts
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """导出为可以用np.savez保存的数组，单词以换行分隔后编码为字节"""
+        doc_ids, doc_lengths, term_ids, counts = self._consolidate()
+        return {
+            "doc_ids": doc_ids,
+            "doc_lengths": doc_lengths,
+            "term_ids": term_ids,
+            "counts": counts,
+            "words": np.frombuffer("\n".join(self.words).encode(), dtype=np.uint8),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """从to_arrays导出的数组（或np.load的结果）恢复"""
+        term_counts = cls()
+        words = bytes(arrays["words"]).decode()
+        term_counts.words = words.split("\n") if words else []
+        term_counts.vocab = {word: i for i, word in enumerate(term_counts.words)}
+        term_counts._chunks.append(
+            (
+                np.asarray(arrays["doc_ids"]),
+                np.asarray(arrays["doc_lengths"], dtype=np.int64),
+                np.asarray(arrays["term_ids"], dtype=np.int32),
+                np.asarray(arrays["counts"], dtype=np.int32),
+            )
+        )
+        return term_counts
+
+    def subset(self, doc_mask) -> "TermCounts":
+        """只保留doc_mask（按行索引的布尔数组）为True的文档，词表不变"""
+        doc_ids, doc_lengths, term_ids, counts = self._consolidate()
+        posting_mask = np.repeat(doc_mask, doc_lengths)
+        term_counts = TermCounts()
+        term_counts.vocab = dict(self.vocab)
+        term_counts.words = list(self.words)
+        term_counts._chunks.append(
+            (
+                doc_ids[doc_mask],
+                doc_lengths[doc_mask],
+                term_ids[posting_mask],
+                counts[posting_mask],
+            )
+        )
+        return term_counts
+
+    def extend(self, other: "TermCounts"):
+        """追加另一个TermCounts中的全部文档，单词id映射到本词表"""
+        doc_ids, doc_lengths, term_ids, counts = other._consolidate()
+        id_map = np.array([self.intern(word) for word in other.words], dtype=np.int32)
+        self._flush_pending()
+        self._chunks.append((doc_ids, doc_lengths, id_map[term_ids], counts))
+        self._offsets = None
+        self._rows = None
+
+    def _reset_pending(self):
+        self._pending_doc_ids = []
+        self._pending_lengths = array("q")
+        self._pending_term_ids = array("i")
+        self._pending_counts = array("i")
+
+    def intern(self, word: str) -> int:
+        """返回单词的id，新单词追加到词表末尾"""
+        term_id = self.vocab.get(word)
+        if term_id is None:
+            term_id = self.vocab[word] = len(self.words)
+            self.words.append(word)
+        return term_id
+
+    def add_document(self, doc_id, word_counts):
+        """追加一个文档的词频统计
+
+        Args:
+            doc_id: 文档唯一标识符，每个文档只能追加一次
+            word_counts (Mapping[str, int]): 文档中每个单词的出现次数
+        """
+        intern = self.intern
+        for word, count in word_counts.items():
+            self._pending_term_ids.append(intern(word))
+            self._pending_counts.append(count)
+        self._pending_doc_ids.append(doc_id)
+        self._pending_lengths.append(len(word_counts))
+        self._offsets = None
+        self._rows = None
+        if len(self._pending_doc_ids) >= self.FLUSH_DOCS:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        if not self._pending_doc_ids:
+            return
+        self._chunks.append(
+            (
+                np.asarray(self._pending_doc_ids),
+                np.array(self._pending_lengths, dtype=np.int64),
+                np.array(self._pending_term_ids, dtype=np.int32),
+                np.array(self._pending_counts, dtype=np.int32),
+            )
+        )
+        self._reset_pending()
+
+    def _consolidate(self):
+        """把所有数组块合并为一组连续数组"""
+        self._flush_pending()
+        if len(self._chunks) == 1:
+            return self._chunks[0]
+        if not self._chunks:
+            chunk = (
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int32),
+                np.zeros(0, dtype=np.int32),
+            )
+        else:
+            chunk = tuple(np.concatenate(field) for field in zip(*self._chunks))
+        self._chunks = [chunk]
+        return chunk
+
+    @property
+    def doc_ids(self) -> np.ndarray:
+        return self._consolidate()[0]
+
+    @property
+    def doc_offsets(self) -> np.ndarray:
+        if self._offsets is None:
+            lengths = self._consolidate()[1]
+            self._offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=self._offsets[1:])
+        return self._offsets
+
+    @property
+    def term_ids(self) -> np.ndarray:
+        return self._consolidate()[2]
+
+    @property
+    def counts(self) -> np.ndarray:
+        return self._consolidate()[3]
+
+    def doc_rows(self) -> np.ndarray:
+        """每条(单词, 词频)记录所属文档的行号"""
+        return np.repeat(
+            np.arange(len(self.doc_ids), dtype=np.int64), np.diff(self.doc_offsets)
+        )
+
+    def term_totals(self) -> np.ndarray:
+        """每个单词在全部文档中的总出现次数，按单词id索引"""
+        return np.bincount(
+            self.term_ids, weights=self.counts, minlength=len(self.words)
+        ).astype(np.int64)
+
+    def doc_frequencies(self) -> np.ndarray:
+        """每个单词出现在多少个文档中，按单词id索引，即该词posting列表的长度"""
+        return np.bincount(self.term_ids, minlength=len(self.words)).astype(np.int64)
+
+    def term_mask(self, words) -> np.ndarray:
+        """返回按单词id索引的布尔数组，words中出现的单词为True"""
+        mask = np.zeros(len(self.words), dtype=bool)
+        ids = [self.vocab[word] for word in words if word in self.vocab]
+        mask[ids] = True
+        return mask
+
+    def __getitem__(self, doc_id):
+        if self._rows is None:
+            self._rows = {d: row for row, d in enumerate(self.doc_ids.tolist())}
+        row = self._rows[doc_id]
+        start, end = self.doc_offsets[row], self.doc_offsets[row + 1]
+        return dict(
+            zip(
+                (self.words[t] for t in self.term_ids[start:end].tolist()),
+                self.counts[start:end].tolist(),
+            )
+        )
+
+    def __iter__(self):
+        return iter(self.doc_ids.tolist())
+
+    def __len__(self):
+        return len(self._pending_doc_ids) + sum(len(c[0]) for c in self._chunks)
+
+
+def posting_list_stats(lengths) -> dict:
+    """posting列表长度的分布：总数、分位数和按2的幂分桶的直方图
+
+    Args:
+        lengths (array-like): 每个关键词的posting列表长度（文档频率）
+
+    Returns:
+        dict: keywords/postings/p50/p90/p99/max以及histogram {"[2^k, 2^(k+1))": 关键词数}
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if len(lengths) == 0:
+        return {"keywords": 0, "postings": 0, "histogram": {}}
+    p50, p90, p99 = np.percentile(lengths, [50, 90, 99]).tolist()
+    buckets = np.bincount(np.log2(np.maximum(lengths, 1)).astype(np.int64))
+    return {
+        "keywords": len(lengths),
+        "postings": int(lengths.sum()),
+        "p50": p50,
+        "p90": p90,
+        "p99": p99,
+        "max": int(lengths.max()),
+        "histogram": {
+            f"[{1 << k}, {1 << (k + 1)})": int(n)
+            for k, n in enumerate(buckets.tolist())
+            if n
+        },
+    }
+
+
+def format_posting_list_stats(stats: dict) -> str:
+    """把posting_list_stats的结果格式化为多行文本"""
+    if not stats["keywords"]:
+        return "  no keywords"
+    lines = [
+        f"  keywords: {stats['keywords']}, postings: {stats['postings']}",
+        f"  p50: {stats['p50']:g}, p90: {stats['p90']:g}, "
+        f"p99: {stats['p99']:g}, max: {stats['max']}",
+    ]
+    lines += [f"  {bucket:>20}: {n}" for bucket, n in stats["histogram"].items()]
+    return "\n".join(lines)
+
+
+class TermTotals(Mapping):
+    """每个单词的总出现次数，结构为 {word: total_count} 的只读映射视图"""
+
+    def __init__(self, words=(), totals=None, vocab: dict[str, int] | None = None):
+        self.words = words
+        self.totals = np.zeros(0, dtype=np.int64) if totals is None else totals
+        self._vocab = vocab
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """从 {word: total_count} 结构构建"""
+        return cls(list(mapping.keys()), np.fromiter(mapping.values(), dtype=np.int64))
+
+    def above(self, threshold) -> set[str]:
+        """返回总出现次数大于threshold的单词集合"""
+        return {self.words[i] for i in np.flatnonzero(self.totals > threshold).tolist()}
+
+    def __getitem__(self, word):
+        if self._vocab is None:
+            self._vocab = {w: i for i, w in enumerate(self.words)}
+        return int(self.totals[self._vocab[word]])
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __len__(self):
+        return len(self.words)
@@ -0,0 +1,48 @@
+import os
+import pytest
+
+from build_checkpoint import BuildCheckpoint, load_or_create_keys
+
+
+def test_chunks_saved_in_order(tmp_path):
+    """每集齐一块文档保存一次，重新打开后可以读回"""
+    checkpoint = BuildCheckpoint(str(tmp_path), {"dataset_path": "a.json"}, 2)
+    for doc_id in range(3):
+        checkpoint.add_document(doc_id, {f"w{doc_id}": doc_id + 1}, (7, doc_id, 10))
+    # 第二块尚未集齐
+    assert checkpoint.completed_docs == 2
+    assert not checkpoint.documents_done
+    checkpoint.finish_documents()
+
+    reopened = BuildCheckpoint(str(tmp_path), {"dataset_path": "a.json"}, 2)
+    assert reopened.documents_done and reopened.completed_docs == 3
+    chunks = list(reopened.iter_chunks())
+    assert [doc_ids.tolist() for _, doc_ids, _ in chunks] == [[0, 1], [2]]
+    term_counts, _, locations = chunks[1]
+    assert term_counts[2] == {"w2": 3}
+    assert locations.tolist() == [[7, 2, 10]]
+
+
+def test_rejects_different_parameters(tmp_path):
+    BuildCheckpoint(str(tmp_path), {"dataset_path": "a.json"}, 2)
+    with pytest.raises(ValueError):
+        BuildCheckpoint(str(tmp_path), {"dataset_path": "b.json"}, 2)
+    with pytest.raises(ValueError):
+        BuildCheckpoint(str(tmp_path), {"dataset_path": "a.json"}, 4)
+
+
+def test_keys_reused(tmp_path):
+    path = str(tmp_path / "keys.bin")
+    keys = load_or_create_keys(path, lambda: os.urandom(16))
+    assert load_or_create_keys(path, lambda: os.urandom(16)) == keys
+    assert os.stat(tmp_path / "keys.bin").st_mode & 0o777 == 0o600
+
+
+def test_keywords_and_pruning_report(tmp_path):
+    checkpoint = BuildCheckpoint(str(tmp_path), {"dataset_path": "a.json"}, 2)
+    assert checkpoint.load_pruning_report() is None
+    report = {"before": {"keywords": 0, "postings": 0, "histogram": {}}}
+    checkpoint.save_keywords({"b", "a"}, report, threshold=1)
+    assert checkpoint.stage_info("keywords") == {"threshold": 1}
+    assert checkpoint.load_keywords() == {"a", "b"}
+    assert checkpoint.load_pruning_report() == report
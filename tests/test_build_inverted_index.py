@@ -16,6 +16,14 @@ def search_engine(mocker):
     encrypt_keyword.symmetric_encryption_for_keyword.side_effect = (  # type: ignore
         lambda _, x: f"enc_{x}"
     )
+    # 批量接口逐个转发给被mock的单个加密函数，便于检查调用参数
+    mocker.patch(
+        "encrypt_keyword.symmetric_encryption_for_keywords",
+        side_effect=lambda key, words, parallel=False: [
+            encrypt_keyword.symmetric_encryption_for_keyword(key, word)
+            for word in words
+        ],
+    )
     return engine
 
 
@@ -122,3 +130,35 @@ class TestBuildInvertedIndex:
 
         # Then
         assert not search_engine.inverted_index
+
+    def test_each_plaintext_encrypted_once(self, search_engine):
+        """场景6: 关键词、词频和文档ID各只加密一次"""
+        # Given
+        search_engine.word_appearance_time_per_doc = {
+            1: {"apple": 2, "pear": 2},
+            2: {"apple": 2, "pear": 1},
+            3: {"apple": 1},
+        }
+        search_engine._EncryptedIndexBuilder__count_keyword_appearance()
+        search_engine.keywords_list = (
+            search_engine._EncryptedIndexBuilder__choose_out_keyword()
+        )
+
+        # When
+        search_engine._EncryptedIndexBuilder__build_inverted_index()
+
+        # Then
+        encrypted = [
+            args[0][1]
+            for args in encrypt_keyword.symmetric_encryption_for_keyword.call_args_list  # type: ignore
+        ]
+        assert sorted(encrypted) == sorted(["apple", "pear", "1", "2", "1", "2", "3"])
+        assert search_engine.inverted_index["enc_apple"] == [
+            ("enc_2", "enc_1"),
+            ("enc_2", "enc_2"),
+            ("enc_1", "enc_3"),
+        ]
+        assert search_engine.inverted_index["enc_pear"] == [
+            ("enc_2", "enc_1"),
+            ("enc_1", "enc_2"),
+        ]
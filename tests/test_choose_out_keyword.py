@@ -77,3 +77,42 @@ def test_zero_count_edge_case(engine):
     assert "cybersecurity" in result
     # 验证排除count=0的项
     assert "nft" not in result
+
+
+def test_stopwords_and_token_length(engine):
+    """测试停用词和单词长度范围"""
+    engine.stopwords = frozenset({"quantum"})
+    engine.min_token_length = 3
+    engine.max_token_length = 12
+    result = engine._EncryptedIndexBuilder__choose_out_keyword()
+    # ai太短，cybersecurity太长
+    assert result == set()
+    assert engine.pruning_report["removed"] == {"stopwords": 1, "token_length": 2}
+
+
+def test_max_df_and_report(engine):
+    """测试文档频率上限，以及剪枝前后posting列表长度的报告"""
+    from term_counts import TermCounts
+
+    word_counts = {doc_id: {"ai": 1, "quantum": 2} for doc_id in range(4)}
+    word_counts[0]["cybersecurity"] = word_counts[1]["cybersecurity"] = 3
+    engine.term_counts = TermCounts.from_mapping(word_counts)
+    engine.max_df = 0.5
+    assert engine._EncryptedIndexBuilder__choose_out_keyword() == {"cybersecurity"}
+    report = engine.pruning_report
+    assert report["before"]["postings"] == 10
+    assert report["before"]["max"] == 4
+    assert report["after"] == {
+        "keywords": 1,
+        "postings": 2,
+        "p50": 2.0,
+        "p90": 2.0,
+        "p99": 2.0,
+        "max": 2,
+        "histogram": {"[2, 4)": 1},
+    }
+    assert "max_df: 2" in engine.format_pruning_report()
+
+    # 整数为文档数
+    engine.max_df = 4
+    assert len(engine._EncryptedIndexBuilder__choose_out_keyword()) == 3
@@ -0,0 +1,48 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from count_min_sketch import CountMinSketch, sketch_updates
+
+
+@pytest.fixture
+def word_counts():
+    """长尾分布的单词计数：少数高频词和大量只出现一次的词"""
+    counts = Counter({f"common{i}": 100 + i for i in range(10)})
+    counts.update(f"typo{i}" for i in range(5000))
+    return counts
+
+
+def test_never_underestimates(word_counts):
+    """场景1: 估计值不小于真实值，宽度足够时高频词的估计准确"""
+    sketch = CountMinSketch(width=1 << 12, depth=4)
+    sketch.add(word_counts)
+    words = list(word_counts)
+    estimates = sketch.estimate(words)
+    assert (estimates >= np.array([word_counts[w] for w in words])).all()
+    assert sketch.candidates(words, 50) == [f"common{i}" for i in range(10)]
+
+
+def test_merge_worker_updates(word_counts):
+    """场景2: 分批计算的增量合并后与一次统计相同"""
+    whole = CountMinSketch(width=1 << 10, depth=3)
+    whole.add(word_counts)
+    merged = CountMinSketch(width=1 << 10, depth=3)
+    items = list(word_counts.items())
+    for start in range(0, len(items), 1000):
+        merged.apply(*sketch_updates(dict(items[start : start + 1000]), 1 << 10, 3))
+    assert (merged.table == whole.table).all()
+
+    other = CountMinSketch(width=1 << 10, depth=3)
+    other.merge(whole)
+    assert (other.table == whole.table).all()
+    with pytest.raises(ValueError):
+        other.merge(CountMinSketch(width=1 << 9, depth=3))
+
+
+def test_empty():
+    sketch = CountMinSketch(width=16, depth=2)
+    sketch.add({})
+    assert sketch.estimate([]).tolist() == []
+    assert sketch.estimate(["missing"]).tolist() == [0]
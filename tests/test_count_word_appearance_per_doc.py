@@ -43,3 +43,31 @@ class TestCountWordAppearance:
 
         # 断言验证
         assert actual == expected, f"测试用例TC{test_id:02d}验证失败"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "hello world hello",
+        "Hello World",
+        "test!test?test...",
+        "",
+        "a-b-c-D 123",
+        "--a-b-- -- - under_score _x_ x--y",
+        "Q3 revenue: $1,234.56 (up 7%) -- see page-12; e-mail CEO@corp.com",
+        "tab\tnew\nline\r\nend",
+        "重复 重复 重复",
+        "café naïve résumé Straße",
+    ],
+)
+def test_count_words_matches_regex(text):
+    """Rust分词计数（ASCII文本）与正则表达式的结果完全相同"""
+    from collections import Counter
+    from my import count_words, count_words_many, word_pattern
+
+    expected = Counter(word_pattern.findall(text.lower()))
+    assert count_words(text) == expected
+    assert count_words_many([text, text.upper()]) == [
+        expected,
+        Counter(word_pattern.findall(text.upper().lower())),
+    ]
@@ -0,0 +1,75 @@
+import pytest
+
+import doc_codec
+from doc_codec import (
+    LZMA,
+    ZLIB,
+    ZLIB_DICT,
+    codec_id,
+    compress,
+    decompress,
+    read_codec,
+    train_zdict,
+)
+
+
+@pytest.fixture
+def articles():
+    """结构相似的短新闻"""
+    return [
+        f"Shares of Company {i} rose {i % 7} percent on Tuesday after the company "
+        f"reported quarterly earnings above analyst expectations."
+        for i in range(50)
+    ]
+
+
+class TestCodec:
+    def test_codec_id(self):
+        assert codec_id("zlib") == ZLIB
+        assert codec_id("lzma") == LZMA
+        assert codec_id("zlib", b"dict") == ZLIB_DICT
+        with pytest.raises(ValueError):
+            codec_id("brotli")
+        with pytest.raises(ValueError):
+            codec_id("lzma", b"dict")
+
+    @pytest.mark.parametrize("codec", [ZLIB, LZMA])
+    def test_round_trip(self, articles, codec):
+        data = " ".join(articles).encode()
+        compressed = compress(data, codec)
+        assert len(compressed) < len(data)
+        assert decompress(compressed, codec) == data
+
+    def test_truncated(self, articles):
+        compressed = compress(" ".join(articles).encode(), ZLIB)
+        with pytest.raises(ValueError):
+            decompress(compressed[:-4], ZLIB)
+
+    def test_read_codec(self):
+        assert read_codec(doc_codec.header(LZMA) + b"payload") == LZMA
+        assert read_codec(doc_codec.MAGIC + b"\x09payload") is None
+        assert read_codec(b"SSE") is None
+        assert read_codec(memoryview(doc_codec.header(ZLIB))) == ZLIB
+
+
+class TestZdict:
+    def test_dictionary_helps_short_documents(self, articles):
+        """用样本训练的字典明显改善单篇短文档的压缩率"""
+        zdict = train_zdict(articles[:40])
+        assert 0 < len(zdict) <= doc_codec.ZDICT_MAX_SIZE
+        doc = articles[45].encode()
+        with_dict = compress(doc, ZLIB_DICT, zdict)
+        assert len(with_dict) < len(compress(doc, ZLIB)) * 0.7
+        assert decompress(with_dict, ZLIB_DICT, zdict) == doc
+
+    def test_dictionary_required(self, articles):
+        zdict = train_zdict(articles)
+        compressed = compress(articles[0].encode(), ZLIB_DICT, zdict)
+        with pytest.raises(ValueError):
+            decompress(compressed, ZLIB_DICT)
+
+    def test_size_limit(self, articles):
+        assert len(train_zdict(articles, size=64)) <= 64
+
+    def test_no_repeated_fragments(self):
+        assert train_zdict(["unique words only"]) == b""
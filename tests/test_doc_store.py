@@ -0,0 +1,156 @@
+import os
+import pytest
+
+from doc_store import (
+    DocDirectory,
+    DocStore,
+    DocTableWriter,
+    SegmentWriter,
+    append_documents,
+    delete_documents,
+    migrate,
+    next_doc_id,
+    open_doc_store,
+    read_table,
+)
+
+
+@pytest.fixture
+def docs():
+    """模拟的密文文档，长度各不相同"""
+    return [bytes([i]) * (i * 7 + 1) for i in range(10)]
+
+
+def write_store(file_dir, docs, doc_ids=None):
+    table = DocTableWriter()
+    doc_ids = range(len(docs)) if doc_ids is None else doc_ids
+    for doc_id, location in zip(doc_ids, append_documents(str(file_dir), docs)):
+        table.add(doc_id, location)
+    table.write(str(file_dir))
+
+
+class TestDocStore:
+    def test_round_trip(self, tmp_path, docs):
+        """场景1: 分两批追加到同一段文件后按doc_id读取"""
+        table = DocTableWriter()
+        for start in (0, 5):
+            batch = docs[start : start + 5]
+            for i, location in enumerate(append_documents(str(tmp_path), batch)):
+                table.add(start + i, location)
+        table.write(str(tmp_path))
+
+        store = open_doc_store(str(tmp_path))
+        assert isinstance(store, DocStore)
+        assert len(store) == len(docs)
+        assert [store.get(i) for i in range(len(docs))] == docs
+        assert len([n for n in os.listdir(tmp_path) if n.startswith("segment-")]) == 1
+        store.close()
+
+    def test_multiple_segments(self, tmp_path, docs):
+        """场景2: 不同写入者的段文件"""
+        table = DocTableWriter()
+        for segment, (start, end) in enumerate([(0, 4), (4, 10)]):
+            writer = SegmentWriter(str(tmp_path), segment)
+            for i, location in enumerate(writer.append_many(docs[start:end])):
+                table.add(start + i, location)
+            writer.close()
+        table.write(str(tmp_path))
+        store = DocStore(str(tmp_path))
+        assert [store.get(i) for i in range(len(docs))] == docs
+
+    def test_missing_documents(self, tmp_path, docs):
+        """场景3: 不连续的doc_id和越界的doc_id"""
+        write_store(tmp_path, docs[:2], doc_ids=[0, 3])
+        store = DocStore(str(tmp_path))
+        assert store.get(0) == docs[0]
+        assert store.get(3) == docs[1]
+        assert store.get(1) is None
+        assert store.get(4) is None
+        assert store.iter_document(1) is None
+        assert len(store) == 2
+
+    def test_iter_document(self, tmp_path, docs):
+        """场景4: 分块读取"""
+        write_store(tmp_path, docs)
+        store = DocStore(str(tmp_path))
+        blocks = list(store.iter_document(9, block_size=16))
+        assert all(len(block) <= 16 for block in blocks)
+        assert b"".join(blocks) == docs[9]
+
+    def test_empty_store(self, tmp_path):
+        write_store(tmp_path, [])
+        store = DocStore(str(tmp_path))
+        assert len(store) == 0
+        assert store.get(0) is None
+
+    def test_rewrite_after_rmtree(self, tmp_path, docs):
+        """场景5: 目录被清空重建后，当前进程重新创建段文件"""
+        import shutil
+
+        file_dir = tmp_path / "docs"
+        file_dir.mkdir()
+        write_store(file_dir, docs[:3])
+        shutil.rmtree(file_dir)
+        file_dir.mkdir()
+        write_store(file_dir, docs[3:5])
+        store = DocStore(str(file_dir))
+        assert [store.get(0), store.get(1)] == docs[3:5]
+
+    def test_append_and_delete(self, tmp_path, docs):
+        """场景6: 增量添加的文档继续编号，删除的doc_id不被复用"""
+        write_store(tmp_path, docs[:4])
+        delete_documents(str(tmp_path), [1, 3])
+        assert next_doc_id(str(tmp_path)) == 4
+
+        table = DocTableWriter(read_table(str(tmp_path)))
+        for doc_id, location in zip(
+            range(4, 6), append_documents(str(tmp_path), docs[4:6])
+        ):
+            table.add(doc_id, location)
+        table.write(str(tmp_path))
+
+        store = DocStore(str(tmp_path))
+        assert [store.get(i) for i in range(6)] == [
+            docs[0],
+            None,
+            docs[2],
+            None,
+            docs[4],
+            docs[5],
+        ]
+        assert next_doc_id(str(tmp_path)) == 6
+
+    def test_next_doc_id_requires_segments(self, tmp_path):
+        with pytest.raises(ValueError):
+            next_doc_id(str(tmp_path))
+
+
+class TestMigrate:
+    def make_legacy_dir(self, path, docs):
+        path.mkdir()
+        for doc_id, doc in enumerate(docs):
+            (path / str(doc_id)).write_bytes(doc)
+
+    def test_legacy_directory(self, tmp_path, docs):
+        """旧目录不迁移时仍可按文件读取"""
+        self.make_legacy_dir(tmp_path / "old", docs)
+        store = open_doc_store(str(tmp_path / "old"))
+        assert isinstance(store, DocDirectory)
+        assert store.get(3) == docs[3]
+        assert store.get(100) is None
+        assert b"".join(store.iter_document(4, block_size=4)) == docs[4]
+
+    def test_migrate_to_new_dir(self, tmp_path, docs):
+        self.make_legacy_dir(tmp_path / "old", docs)
+        assert migrate(str(tmp_path / "old"), str(tmp_path / "new"), batch_size=3) == 10
+        store = open_doc_store(str(tmp_path / "new"))
+        assert isinstance(store, DocStore)
+        assert [store.get(i) for i in range(len(docs))] == docs
+        assert len(os.listdir(tmp_path / "old")) == len(docs)
+
+    def test_migrate_in_place(self, tmp_path, docs):
+        self.make_legacy_dir(tmp_path / "old", docs)
+        migrate(str(tmp_path / "old"), str(tmp_path / "old"))
+        assert sorted(os.listdir(tmp_path / "old")) == ["docs.idx", "segment-0.dat"]
+        store = open_doc_store(str(tmp_path / "old"))
+        assert [store.get(i) for i in range(len(docs))] == docs
@@ -0,0 +1,128 @@
+import gzip
+import json
+import lzma
+import pytest
+
+import document_loader
+from document_loader import iter_documents
+from my import EncryptedIndexBuilder, batched
+
+
+@pytest.fixture
+def docs():
+    """测试文档集合"""
+    return [
+        {"title": f"Title {i}", "text": f"text number {i} with [brackets], and commas"}
+        for i in range(20)
+    ]
+
+
+def write_json_array(path, docs):
+    with open(path, "w") as f:
+        json.dump(docs, f, indent=2)
+
+
+def write_jsonl(path, docs, opener=open):
+    with opener(path, "wt") as f:
+        for doc in docs:
+            f.write(json.dumps(doc) + "\n")
+
+
+class TestIterDocuments:
+    def test_json_array(self, tmp_path, docs):
+        """场景1: JSON数组格式"""
+        path = tmp_path / "docs.json"
+        write_json_array(path, docs)
+        assert list(iter_documents(path)) == docs
+
+    def test_jsonl(self, tmp_path, docs):
+        """场景2: JSONL格式"""
+        path = tmp_path / "docs.jsonl"
+        write_jsonl(path, docs)
+        assert list(iter_documents(path)) == docs
+
+    @pytest.mark.parametrize("opener", [gzip.open, lzma.open], ids=["gzip", "xz"])
+    def test_compressed_jsonl(self, tmp_path, docs, opener):
+        """场景3: 压缩格式按文件头识别，与扩展名无关"""
+        path = tmp_path / "docs.data"
+        write_jsonl(path, docs, opener)
+        assert list(iter_documents(path)) == docs
+
+    def test_compressed_json_array(self, tmp_path, docs):
+        """场景4: gzip压缩的JSON数组"""
+        path = tmp_path / "docs.json.gz"
+        with gzip.open(path, "wt") as f:
+            json.dump(docs, f)
+        assert list(iter_documents(path)) == docs
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64])
+    def test_small_read_chunks(self, tmp_path, docs, monkeypatch, chunk_size):
+        """场景5: 元素跨越多次读取时仍能正确解析"""
+        monkeypatch.setattr(document_loader, "READ_CHUNK_SIZE", chunk_size)
+        array_path = tmp_path / "docs.json"
+        lines_path = tmp_path / "docs.jsonl"
+        write_json_array(array_path, docs)
+        write_jsonl(lines_path, docs)
+        assert list(iter_documents(array_path)) == docs
+        assert list(iter_documents(lines_path)) == docs
+
+    def test_scalar_elements(self, tmp_path, monkeypatch):
+        """场景6: 缓冲区末尾的数字不会被截断"""
+        monkeypatch.setattr(document_loader, "READ_CHUNK_SIZE", 3)
+        path = tmp_path / "numbers.json"
+        path.write_text("[12345, 67890, []]")
+        assert list(iter_documents(path)) == [12345, 67890, []]
+
+    @pytest.mark.parametrize("name", ["docs.json", "docs.jsonl"])
+    def test_count_stops_early(self, tmp_path, docs, name):
+        """场景7: count限制产出数量，且不解析文件剩余部分"""
+        path = tmp_path / name
+        if name.endswith("l"):
+            write_jsonl(path, docs[:3])
+            with open(path, "a") as f:
+                f.write("{broken json\n")
+        else:
+            path.write_text(
+                "[" + ",".join(json.dumps(doc) for doc in docs[:3]) + ", {broken"
+            )
+        assert list(iter_documents(path, 3)) == docs[:3]
+
+    def test_jsonl_skips_bad_lines(self, tmp_path, docs, capsys):
+        """场景8: JSONL中的空行和错误行被跳过"""
+        path = tmp_path / "docs.jsonl"
+        path.write_text(json.dumps(docs[0]) + "\n\nnot json\n" + json.dumps(docs[1]))
+        assert list(iter_documents(path)) == docs[:2]
+        assert "Error parsing line 3" in capsys.readouterr().out
+
+    def test_empty_inputs(self, tmp_path):
+        """场景9: 空文件和空数组"""
+        path = tmp_path / "empty.json"
+        path.write_text("  [ ]  ")
+        assert list(iter_documents(path)) == []
+        assert list(iter_documents("/dev/null")) == []
+
+    def test_truncated_array(self, tmp_path, docs):
+        """场景10: 不完整的JSON数组抛出解析错误"""
+        path = tmp_path / "docs.json"
+        path.write_text("[" + json.dumps(docs[0]) + ",")
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_documents(path))
+
+
+def test_builder_load_documents(tmp_path, docs):
+    """EncryptedIndexBuilder.load_documents兼容原有的列表返回值"""
+    path = tmp_path / "docs.jsonl"
+    write_jsonl(path, docs)
+    builder = EncryptedIndexBuilder(
+        file_key=b"k" * 16, index_key=b"k" * 16, dataset_path=str(path)
+    )
+    assert builder.load_documents() == docs
+    assert builder.load_documents(5) == docs[:5]
+
+
+@pytest.mark.parametrize(
+    "size, n, expected",
+    [(5, 2, [[0, 1], [2, 3], [4]]), (4, 2, [[0, 1], [2, 3]]), (0, 3, [])],
+)
+def test_batched(size, n, expected):
+    assert list(batched(range(size), n)) == expected
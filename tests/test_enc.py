@@ -1,5 +1,23 @@
+import mmap
 import pytest
-from my import encrypt_doc, decrypt_doc, generate_key
+import enc_rust
+from my import (
+    encrypt_doc,
+    encrypt_docs,
+    encrypt_doc_stream,
+    iter_encrypt_doc,
+    iter_decrypt_doc,
+    decrypt_doc,
+    decrypt_doc_bytes,
+    generate_key,
+    gcm_cipher,
+)
+from encrypt_keyword import (
+    symmetric_encryption_for_keyword,
+    symmetric_encryption_for_keywords,
+    symmetric_decryption_for_blocks,
+    symmetric_decryption_for_keywords,
+)
 
 
 class TestEncryptDoc:
@@ -34,3 +52,227 @@ class TestEncryptDoc:
         tampered = encrypted[:32] + b"x" + encrypted[33:]  # 修改密文部分
         with pytest.raises(ValueError):
             decrypt_doc(tampered, self.test_key)
+
+
+class TestDocBuffers:
+    def setup_method(self):
+        self.test_key = generate_key()
+        self.test_data = "缓冲区协议 buffer protocol".encode()
+
+    @pytest.mark.parametrize("wrap", [bytes, bytearray, memoryview])
+    def test_decrypt_any_buffer(self, wrap):
+        # 任意缓冲区对象都可以直接解密为原始字节
+        encrypted = gcm_cipher(self.test_key).encrypt_buffer(wrap(self.test_data))
+        assert decrypt_doc_bytes(wrap(encrypted), self.test_key) == self.test_data
+        assert decrypt_doc(encrypted, self.test_key) == self.test_data.decode()
+
+    def test_decrypt_from_mmap(self, tmp_path):
+        path = tmp_path / "doc"
+        path.write_bytes(gcm_cipher(self.test_key).encrypt_buffer(self.test_data))
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            assert decrypt_doc_bytes(mm, self.test_key) == self.test_data
+
+    def test_encrypt_decrypt_into(self):
+        # 加解密结果写入调用方提供的缓冲区
+        cipher = gcm_cipher(self.test_key)
+        encrypted = bytearray(len(self.test_data) + enc_rust.GCM_OVERHEAD)
+        assert cipher.encrypt_into(self.test_data, encrypted) == len(encrypted)
+        plaintext = bytearray(len(self.test_data))
+        assert cipher.decrypt_into(encrypted, plaintext) == len(self.test_data)
+        assert plaintext == self.test_data
+
+    def test_into_rejects_bad_output(self):
+        cipher = gcm_cipher(self.test_key)
+        encrypted = cipher.encrypt_buffer(self.test_data)
+        with pytest.raises(ValueError):
+            cipher.decrypt_into(encrypted, bytearray(1))
+        with pytest.raises(TypeError):
+            cipher.decrypt_into(encrypted, bytes(len(self.test_data)))
+        buffer = bytearray(encrypted)
+        with pytest.raises(ValueError):
+            cipher.decrypt_into(buffer, buffer)
+
+
+class TestDocBatch:
+    def setup_method(self):
+        self.test_key = generate_key()
+        self.docs = ["第一篇文档", "", "third document " * 100]
+
+    @pytest.mark.parametrize("parallel", [False, True])
+    def test_round_trip(self, parallel):
+        encrypted = encrypt_docs(self.docs, self.test_key, parallel)
+        assert [decrypt_doc(c, self.test_key) for c in encrypted] == self.docs
+
+    def test_nonce_prefix_and_counter(self):
+        """同一批的nonce共享8字节随机前缀，后4字节为大端序号"""
+        encrypted = encrypt_docs(self.docs, self.test_key)
+        nonces = [c[:12] for c in encrypted]
+        assert len({n[:8] for n in nonces}) == 1
+        assert [int.from_bytes(n[8:], "big") for n in nonces] == [0, 1, 2]
+        # 不同批次使用不同前缀
+        assert encrypt_docs(self.docs, self.test_key)[0][:8] != nonces[0][:8]
+
+    def test_empty_batch(self):
+        assert encrypt_docs([], self.test_key) == []
+
+
+def split_every(data, n):
+    """把data按n字节切块，模拟逐块到达的网络数据"""
+    return [data[i : i + n] for i in range(0, len(data), n)]
+
+
+class TestDocStream:
+    def setup_method(self):
+        self.test_key = generate_key()
+        self.text = "分段加密 streaming AEAD " * 50
+
+    @pytest.mark.parametrize("block", [1, 7, 100, 10_000])
+    def test_round_trip(self, block):
+        """场景1: 任意大小的密文块都能逐段解密"""
+        encrypted = encrypt_doc_stream(self.text, self.test_key, chunk_size=64)
+        chunks = list(iter_decrypt_doc(split_every(encrypted, block), self.test_key))
+        assert b"".join(chunks).decode() == self.text
+        assert decrypt_doc(encrypted, self.test_key) == self.text
+        assert decrypt_doc_bytes(encrypted, self.test_key) == self.text.encode()
+
+    def test_output_is_incremental(self):
+        """场景2: 每段认证通过后立即输出，不等读完全部密文"""
+        encrypted = encrypt_doc_stream(self.text, self.test_key, chunk_size=64)
+        produced = iter_decrypt_doc(split_every(encrypted, 100), self.test_key)
+        assert len(next(produced)) == 64
+
+    def test_encrypt_iterator(self):
+        """场景3: 明文分块输入，块边界与分段无关"""
+        data = self.text.encode()
+        encrypted = b"".join(
+            iter_encrypt_doc(split_every(data, 13), self.test_key, chunk_size=64)
+        )
+        assert encrypted.startswith(enc_rust.STREAM_MAGIC)
+        assert decrypt_doc_bytes(encrypted, self.test_key) == data
+
+    @pytest.mark.parametrize("text", ["", "x" * 64])
+    def test_edge_lengths(self, text):
+        """场景4: 空文档、恰好一段的文档"""
+        encrypted = encrypt_doc_stream(text, self.test_key, chunk_size=64)
+        assert decrypt_doc(encrypted, self.test_key) == text
+
+    def test_truncated(self):
+        """场景5: 在分段边界处截断的密文无法通过认证"""
+        encrypted = encrypt_doc_stream(self.text, self.test_key, chunk_size=64)
+        truncated = encrypted[: enc_rust.STREAM_HEADER_LEN + 2 * (64 + 16)]
+        with pytest.raises(ValueError, match="Stream"):
+            b"".join(iter_decrypt_doc([truncated], self.test_key))
+        with pytest.raises(ValueError, match="Stream"):
+            decrypt_doc(truncated, self.test_key)
+        # 不足一个文件头的密文同样报告为截断的分段密文
+        with pytest.raises(ValueError, match="Truncated stream"):
+            decrypt_doc(encrypted[:8], self.test_key)
+
+    @pytest.mark.parametrize("compression", [None, "zlib"])
+    def test_tampered(self, compression):
+        """场景7: 篡改的分段密文报告分段认证失败，不回退为单次加密格式"""
+        encrypted = bytearray(
+            encrypt_doc_stream(self.text, self.test_key, 64, compression=compression)
+        )
+        encrypted[-1] ^= 1
+        with pytest.raises(ValueError, match="Stream chunk authentication"):
+            decrypt_doc(bytes(encrypted), self.test_key)
+        with pytest.raises(ValueError, match="Stream chunk authentication"):
+            b"".join(iter_decrypt_doc(split_every(bytes(encrypted), 50), self.test_key))
+
+    def test_legacy_format(self):
+        """场景6: 单次加密格式的密文仍可通过流式接口解密"""
+        encrypted = encrypt_doc(self.text, self.test_key)
+        chunks = split_every(encrypted, 5)
+        assert b"".join(iter_decrypt_doc(chunks, self.test_key)).decode() == self.text
+
+    def test_finalize_twice(self):
+        encryptor = enc_rust.StreamEncryptor(self.test_key)
+        encryptor.finalize()
+        with pytest.raises(ValueError):
+            encryptor.finalize()
+        with pytest.raises(ValueError):
+            encryptor.update(b"more")
+
+    def test_invalid_chunk_size(self):
+        with pytest.raises(ValueError):
+            enc_rust.StreamEncryptor(self.test_key, 0)
+
+
+class TestDocCompression:
+    def setup_method(self):
+        self.test_key = generate_key()
+        self.text = "压缩后加密 compress then encrypt. " * 200
+
+    @pytest.mark.parametrize("compression", ["zlib", "lzma"])
+    def test_single_shot(self, compression):
+        encrypted = encrypt_doc(self.text, self.test_key, compression=compression)
+        assert len(encrypted) < len(encrypt_doc(self.text, self.test_key)) / 4
+        assert decrypt_doc(encrypted, self.test_key) == self.text
+        chunks = split_every(encrypted, 7)
+        assert b"".join(iter_decrypt_doc(chunks, self.test_key)).decode() == self.text
+
+    @pytest.mark.parametrize("compression", ["zlib", "lzma"])
+    def test_stream(self, compression):
+        encrypted = encrypt_doc_stream(
+            self.text, self.test_key, chunk_size=64, compression=compression
+        )
+        assert decrypt_doc(encrypted, self.test_key) == self.text
+        chunks = split_every(encrypted, 50)
+        assert b"".join(iter_decrypt_doc(chunks, self.test_key)).decode() == self.text
+
+    def test_batch_with_zdict(self):
+        zdict = ("compress then encrypt. " * 10).encode()
+        docs = ["compress then encrypt.", "", self.text]
+        encrypted = encrypt_docs(docs, self.test_key, compression="zlib", zdict=zdict)
+        assert [decrypt_doc(c, self.test_key, zdict) for c in encrypted] == docs
+        with pytest.raises(ValueError):
+            decrypt_doc(encrypted[0], self.test_key)
+
+    def test_tampered_header(self):
+        encrypted = bytearray(encrypt_doc(self.text, self.test_key, compression="zlib"))
+        encrypted[4] = 2  # zlib -> lzma
+        with pytest.raises(Exception):
+            decrypt_doc(bytes(encrypted), self.test_key)
+
+
+class TestKeywordBatch:
+    def setup_method(self):
+        self.test_key = generate_key()
+        self.words = ["", "apple", "exactly16bytes!!", "a-much-longer-keyword-value"]
+
+    @pytest.mark.parametrize("parallel", [False, True])
+    def test_batch_matches_single(self, parallel):
+        # 批量加密结果与逐个加密一致
+        encrypted = symmetric_encryption_for_keywords(
+            self.test_key, self.words, parallel
+        )
+        assert encrypted == [
+            symmetric_encryption_for_keyword(self.test_key, word) for word in self.words
+        ]
+        decrypted = symmetric_decryption_for_keywords(
+            self.test_key, encrypted, parallel
+        )
+        assert decrypted == self.words
+
+    def test_batch_empty(self):
+        assert symmetric_encryption_for_keywords(self.test_key, []) == []
+        assert symmetric_decryption_for_keywords(self.test_key, []) == []
+
+    def test_batch_invalid_ciphertext(self):
+        encrypted = symmetric_encryption_for_keywords(self.test_key, self.words)
+        with pytest.raises(ValueError):
+            symmetric_decryption_for_keywords(self.test_key, encrypted + [b"x" * 15])
+
+    def test_blocks_from_buffers(self, tmp_path):
+        # 定长密文首尾相接，bytes、memoryview和mmap都直接传给Rust解密
+        words = ["apple", "banana", "exactly15bytes!"]
+        data = b"".join(symmetric_encryption_for_keywords(self.test_key, words))
+        assert symmetric_decryption_for_blocks(self.test_key, data) == words
+        view = memoryview(b"\0" * 16 + data)[16:]
+        assert symmetric_decryption_for_blocks(self.test_key, view) == words
+        path = tmp_path / "blocks.bin"
+        path.write_bytes(data)
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            assert symmetric_decryption_for_blocks(self.test_key, mm) == words
+        assert symmetric_decryption_for_blocks(self.test_key, b"") == []
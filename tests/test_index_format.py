@@ -0,0 +1,442 @@
+import pickle
+import pytest
+
+import index_format
+from index_format import MappedIndex, SegmentedIndex, open_index, write_index
+
+
+def block(tag: str) -> bytes:
+    """构造16字节的模拟密文"""
+    return tag.encode().ljust(16, b"\0")
+
+
+@pytest.fixture
+def inverted_index():
+    """包含变长token、空posting列表的倒排索引"""
+    return {
+        b"t" * 16: [(block("tf1"), block("doc0")), (block("tf2"), block("doc3"))],
+        b"long token" * 4: [(block("tf5"), block("doc1"))],
+        b"empty" * 4: [],
+    }
+
+
+class TestMappedIndex:
+    def test_round_trip(self, tmp_path, inverted_index):
+        """场景1: 写入后查询结果与原字典一致"""
+        path = tmp_path / "index.bin"
+        write_index(path, inverted_index)
+        with MappedIndex(path) as index:
+            assert len(index) == 3
+            for token, postings in inverted_index.items():
+                assert token in index
+                assert index.get(token) == postings
+                assert index[token] == postings
+
+    def test_missing_token(self, tmp_path, inverted_index):
+        """场景2: 不存在的token"""
+        path = tmp_path / "index.bin"
+        write_index(path, inverted_index)
+        with MappedIndex(path) as index:
+            assert index.get(b"missing", []) == []
+            assert b"missing" not in index
+            assert index.get_refs(b"missing") is None
+            with pytest.raises(KeyError):
+                index[b"missing"]
+
+    def test_side_tables(self, tmp_path, inverted_index):
+        """场景3: 每个不同的密文只保存一次，posting按序号引用"""
+        inverted_index[b"more" * 4] = [(block("tf1"), block("doc3"))]
+        path = tmp_path / "index.bin"
+        write_index(path, inverted_index)
+        index = MappedIndex(path)
+        tf_refs, doc_refs = index.get_refs(b"t" * 16)
+        assert [index.tf_ciphertext(r) for r in tf_refs.tolist()] == [
+            block("tf1"),
+            block("tf2"),
+        ]
+        assert [index.doc_ciphertext(r) for r in doc_refs.tolist()] == [
+            block("doc0"),
+            block("doc3"),
+        ]
+        # tf1和doc3被两个关键词共享
+        assert index._tf_count == 3
+        assert index._doc_count == 3
+        del tf_refs, doc_refs
+        index.close()
+
+    def test_get_records(self, tmp_path, inverted_index):
+        """场景4: 定长记录与get的结果一致"""
+        path = tmp_path / "index.bin"
+        write_index(path, inverted_index)
+        with MappedIndex(path) as index:
+            for token, postings in inverted_index.items():
+                assert index.get_records(token) == b"".join(
+                    tf + doc for tf, doc in postings
+                )
+            assert index.get_records(b"missing") is None
+
+    def test_ranked_offset_limit(self, tmp_path, inverted_index):
+        """场景5: 按词频排序的索引只读取[offset, offset+limit)区间，未排序时返回全部"""
+        postings = inverted_index[b"t" * 16]
+        records = [tf + doc for tf, doc in postings]
+        for ranked in (True, False):
+            path = tmp_path / f"index-{ranked}.bin"
+            write_index(path, inverted_index, ranked=ranked)
+            with MappedIndex(path) as index:
+                assert index.ranked == ranked
+                expected = records[1:2] if ranked else records
+                assert index.get_records(b"t" * 16, 1, 5) == b"".join(expected)
+                expected = records[:1] if ranked else records
+                assert index.get_records(b"t" * 16, 0, 1) == b"".join(expected)
+                if ranked:
+                    assert index.get_records(b"t" * 16, 5, 1) == b""
+
+    def test_read_page(self, tmp_path):
+        """场景6: 按存储顺序分页读取，拼接后与完整记录相同"""
+        postings = [(block(f"tf{d % 3}"), block(f"doc{d}")) for d in range(7)]
+        path = tmp_path / "index.bin"
+        write_index(path, {b"t" * 16: postings})
+        with MappedIndex(path) as index:
+            pages, cursor = [], (0, 0)
+            while cursor is not None:
+                records, cursor = index.read_page(b"t" * 16, cursor, 3)
+                pages.append(records)
+            assert [len(page) // 32 for page in pages] == [3, 3, 1]
+            assert b"".join(pages) == index.get_records(b"t" * 16)
+            assert index.read_page(b"missing", (0, 0), 3) == (b"", None)
+
+    def test_smaller_than_inline_postings(self, tmp_path):
+        """场景4: 重复的密文越多，索引相比内联保存越小"""
+        docs = [block(f"doc{i}") for i in range(100)]
+        tfs = [block(f"tf{i}") for i in range(5)]
+        inverted_index = {
+            f"kw{k}".encode() * 4: [(tfs[d % 5], docs[d]) for d in range(100)]
+            for k in range(50)
+        }
+        path = tmp_path / "index.bin"
+        write_index(path, inverted_index)
+        inline_size = 50 * 100 * index_format.POSTING_SIZE_V1
+        assert path.stat().st_size < inline_size / 2
+
+    def test_empty_index(self, tmp_path):
+        path = tmp_path / "index.bin"
+        write_index(path, {})
+        with MappedIndex(path) as index:
+            assert len(index) == 0
+            assert index.get(b"t" * 16) is None
+
+    def test_reads_version_1(self, tmp_path, inverted_index):
+        """场景5: 旧版本（posting内联保存密文）的索引仍可读取"""
+        entries = sorted(
+            (index_format.token_key(t), p) for t, p in inverted_index.items()
+        )
+        data = index_format._HEADER_V1.pack(
+            index_format.MAGIC, 1, 16, index_format.POSTING_SIZE_V1, len(entries)
+        )
+        start = 0
+        for key, postings in entries:
+            data += index_format._ENTRY.pack(key, start, len(postings))
+            start += len(postings)
+        for _, postings in entries:
+            data += b"".join(tf + doc for tf, doc in postings)
+        path = tmp_path / "index_v1.bin"
+        path.write_bytes(data)
+        with MappedIndex(path) as index:
+            for token, postings in inverted_index.items():
+                assert index.get(token) == postings
+            with pytest.raises(ValueError):
+                index.get_refs(b"t" * 16)
+            assert index.get_records(b"t" * 16) == b"".join(
+                tf + doc for tf, doc in inverted_index[b"t" * 16]
+            )
+
+    def test_doc_ordered(self, tmp_path, monkeypatch):
+        """场景8: 求交集直接使用保存的文档序，不读取整个posting列表"""
+        import os
+        import posting_lists
+
+        docs = [os.urandom(16) for _ in range(64)]
+        index = {
+            b"a" * 16: [(block(f"tf{d % 5}"), doc) for d, doc in enumerate(docs)],
+            b"b" * 16: [(block("tf9"), doc) for doc in docs[::-3]],
+        }
+        path = tmp_path / "index.bin"
+        write_index(path, index, ranked=True)
+        records = [b"".join(t + d for t, d in p) for p in index.values()]
+        expected = posting_lists.intersect(records)
+        with MappedIndex(path) as mapped:
+            assert list(mapped.doc_ordered(b"a" * 16)) == sorted(docs)
+            assert mapped.doc_ordered(b"missing") == b""
+            monkeypatch.setattr(MappedIndex, "get_records", None)
+            assert mapped.intersect([b"a" * 16, b"b" * 16]) == expected
+            assert mapped.intersect([b"a" * 16, b"missing"]) == [b"", b""]
+            assert mapped.lookup(b"b" * 16, [docs[0], docs[63], docs[1]]) == (
+                block("tf9")
+                + min(docs[0], docs[63])
+                + block("tf9")
+                + max(docs[0], docs[63])
+            )
+            assert mapped.lookup(b"missing", docs) == b""
+            monkeypatch.undo()
+
+        # 没有文档序的索引在查询时排序，结果相同
+        data = bytearray(path.read_bytes())
+        data[20:24] = index_format.FLAG_RANKED.to_bytes(4, "little")
+        path.write_bytes(data)
+        with MappedIndex(path) as mapped:
+            assert isinstance(mapped.doc_ordered(b"a" * 16), bytes)
+            assert mapped.intersect([b"a" * 16, b"b" * 16]) == expected
+
+    def test_rejects_variable_width_postings(self, tmp_path):
+        """场景6: posting字段不是16字节时拒绝写入"""
+        with pytest.raises(ValueError):
+            write_index(tmp_path / "index.bin", {b"t" * 16: [(b"short", block("d"))]})
+
+    def test_open_index_reads_pickle(self, tmp_path, inverted_index):
+        """场景7: 旧的pickle格式索引仍可打开"""
+        path = tmp_path / "index.pkl"
+        with open(path, "wb") as f:
+            pickle.dump(inverted_index, f)
+        assert open_index(path) == inverted_index
+        write_index(path, inverted_index)
+        assert isinstance(open_index(path), MappedIndex)
+
+
+class TestSegmentedIndex:
+    def test_append_segment(self, tmp_path, inverted_index):
+        """场景1: 追加段的postings接在已有postings之后"""
+        path = str(tmp_path / "index.bin")
+        write_index(path, inverted_index)
+        index_format.append_segment(
+            path,
+            {
+                b"t" * 16: [(block("tf1"), block("doc7"))],
+                b"new" * 6: [(block("tf2"), block("doc8"))],
+            },
+        )
+        with open_index(path) as index:
+            assert isinstance(index, SegmentedIndex)
+            assert index.segment_count == 2
+            assert index.get(b"t" * 16) == inverted_index[b"t" * 16] + [
+                (block("tf1"), block("doc7"))
+            ]
+            assert index[b"new" * 6] == [(block("tf2"), block("doc8"))]
+            assert index.get(b"long token" * 4) == inverted_index[b"long token" * 4]
+            assert index.get(b"missing") is None
+
+    def test_tombstones(self, tmp_path, inverted_index):
+        """场景2: 被删除文档的postings不出现在查询结果中"""
+        path = str(tmp_path / "index.bin")
+        write_index(path, inverted_index)
+        index_format.add_tombstones(path, [block("doc0")])
+        index_format.add_tombstones(path, [block("doc0"), block("doc1")])
+        assert len(index_format.read_manifest(path)["tombstones"]) == 2
+        with open_index(path) as index:
+            assert index.get(b"t" * 16) == [(block("tf2"), block("doc3"))]
+            assert index.get(b"long token" * 4) == []
+            assert index.get_records(b"t" * 16) == block("tf2") + block("doc3")
+            assert index.get_records(b"long token" * 4) == b""
+            assert index.get_records(b"missing") is None
+
+    def test_compact(self, tmp_path, inverted_index):
+        """场景3: 合并后只剩一个段，墓碑对应的postings被移除"""
+        path = str(tmp_path / "index.bin")
+        write_index(path, inverted_index)
+        assert not index_format.compact(path)
+        index_format.append_segment(path, {b"t" * 16: [(block("tf1"), block("doc7"))]})
+        index_format.add_tombstones(path, [block("doc3")])
+        assert index_format.compact(path, min_segments=3)
+        with open_index(path) as index:
+            # 与完整重建后相同，只剩path一个文件，没有清单
+            assert isinstance(index, MappedIndex)
+            assert index.get(b"t" * 16) == [
+                (block("tf1"), block("doc0")),
+                (block("tf1"), block("doc7")),
+            ]
+            assert index.get(b"empty" * 4) == []
+            assert index.get(b"long token" * 4) == [(block("tf5"), block("doc1"))]
+        assert sorted(p.name for p in tmp_path.iterdir() if "lock" not in p.name) == [
+            "index.bin"
+        ]
+
+        # 合并后可以继续追加段，新段编号不与已删除的段冲突
+        index_format.append_segment(path, {b"u" * 16: [(block("tf3"), block("doc8"))]})
+        with open_index(path) as index:
+            assert index.get(b"u" * 16) == [(block("tf3"), block("doc8"))]
+            assert index.get(b"t" * 16)[-1] == (block("tf1"), block("doc7"))
+
+    def test_ranked_segments(self, tmp_path):
+        """场景5: 单个排序段过滤墓碑后精确截取，多个段时返回每段前offset+limit条候选"""
+        postings = [(block(f"tf{9 - d}"), block(f"doc{d}")) for d in range(6)]
+        path = str(tmp_path / "index.bin")
+        write_index(path, {b"t" * 16: postings}, ranked=True)
+        index_format.add_tombstones(path, [block("doc0"), block("doc2")])
+        with open_index(path) as index:
+            assert index.ranked
+            assert index.get_records(b"t" * 16, 1, 2) == b"".join(
+                tf + doc for tf, doc in [postings[3], postings[4]]
+            )
+
+        extra = [(block("tf9"), block("doc6")), (block("tf1"), block("doc7"))]
+        index_format.append_segment(path, {b"t" * 16: extra}, ranked=True)
+        with open_index(path) as index:
+            assert not index.ranked
+            candidates = [postings[1], postings[3], postings[4]] + extra
+            assert index.get_records(b"t" * 16, 1, 2) == b"".join(
+                tf + doc for tf, doc in candidates
+            )
+
+        # 服务器无法按词频合并多个段，合并后不再标记为已排序，带偏移量的查询返回候选记录
+        index_format.compact(path)
+        with open_index(path) as index:
+            assert not index.ranked
+
+    def test_compact_ranked_with_tf_value(self, tmp_path):
+        """场景5: 知道明文词频时按词频归并各段，合并后仍按词频排序"""
+        postings = [(block(f"tf{9 - d}"), block(f"doc{d}")) for d in range(4)]
+        extra = [(block("tf8"), block("doc6")), (block("tf6"), block("doc7"))]
+        path = str(tmp_path / "index.bin")
+        write_index(path, {b"t" * 16: postings}, ranked=True)
+        index_format.append_segment(path, {b"t" * 16: extra}, ranked=True)
+        index_format.add_tombstones(path, [block("doc0")])
+        assert index_format.compact(
+            path, tf_value=lambda tf_enc: int(tf_enc.rstrip(b"\0")[2:])
+        )
+        with open_index(path) as index:
+            assert isinstance(index, MappedIndex) and index.ranked
+            # 词频相同时先前段的posting在前
+            expected = [postings[1], extra[0], postings[2], postings[3], extra[1]]
+            assert index.get(b"t" * 16) == expected
+            assert index.get_records(b"t" * 16, 1, 2) == b"".join(
+                tf + doc for tf, doc in expected[1:3]
+            )
+
+    def test_compact_cli_keeps_ranked(self, tmp_path, monkeypatch, capsys):
+        """场景8: 服务器端的compact命令拒绝丢弃词频顺序，--allow_unranked时才合并"""
+        import runpy
+        import sys
+
+        postings = [(block(f"tf{9 - d}"), block(f"doc{d}")) for d in range(4)]
+        path = str(tmp_path / "index.bin")
+        write_index(path, {b"t" * 16: postings[:2]}, ranked=True)
+        index_format.append_segment(path, {b"t" * 16: postings[2:]}, ranked=True)
+        command = ["index_format.py", "compact", path, "--min_segments", "2"]
+        monkeypatch.setattr(sys, "argv", command)
+        with pytest.raises(SystemExit) as exc_info:
+            runpy.run_module("index_format", run_name="__main__")
+        assert exc_info.value.code == 1
+        assert "FLAG_RANKED" in capsys.readouterr().err
+        # 没有做任何修改
+        assert len(index_format.read_manifest(path)["segments"]) == 2
+        with pytest.raises(ValueError):
+            index_format.compact(path, keep_ranked=True)
+
+        monkeypatch.setattr(sys, "argv", command + ["--allow_unranked"])
+        runpy.run_module("index_format", run_name="__main__")
+        with open_index(path) as index:
+            assert isinstance(index, MappedIndex) and not index.ranked
+            assert index.get(b"t" * 16) == postings
+        # 只有一个段时合并不影响词频顺序
+        write_index(path, {b"t" * 16: postings}, ranked=True)
+        index_format.add_tombstones(path, [block("doc0")])
+        assert index_format.compact(path, keep_ranked=True)
+        with open_index(path) as index:
+            assert index.ranked
+
+    def test_read_page_across_segments(self, tmp_path, inverted_index):
+        """场景6: 分页跨越多个段并过滤墓碑，墓碑占满的一页被跳过"""
+        path = str(tmp_path / "index.bin")
+        write_index(path, inverted_index)
+        extra = [(block("tf1"), block(f"doc{d}")) for d in range(4, 9)]
+        index_format.append_segment(path, {b"t" * 16: extra})
+        index_format.add_tombstones(path, [block("doc3"), block("doc4")])
+        with open_index(path) as index:
+            pages, cursor = [], (0, 0)
+            while cursor is not None:
+                records, cursor = index.read_page(b"t" * 16, cursor, 1)
+                pages.append(records)
+            assert all(len(page) == 32 for page in pages)
+            assert b"".join(pages) == index.get_records(b"t" * 16)
+            assert len(pages) == 5
+
+    def test_intersect_across_segments(self, tmp_path, inverted_index):
+        """场景7: 每个文档只在一个段中，各段分别求交集后拼接，并过滤墓碑"""
+        path = str(tmp_path / "index.bin")
+        inverted_index[b"u" * 16] = [(block("tf4"), block("doc3"))]
+        write_index(path, inverted_index)
+        appended = {
+            b"t" * 16: [(block("tf1"), block("doc8")), (block("tf2"), block("doc9"))],
+            b"u" * 16: [(block("tf6"), block("doc9"))],
+        }
+        index_format.append_segment(path, appended)
+        index_format.append_segment(path, {b"u" * 16: [(block("tf7"), block("doc5"))]})
+        with open_index(path) as index:
+            assert index.intersect([b"t" * 16, b"u" * 16]) == [
+                block("tf2") + block("doc3") + block("tf2") + block("doc9"),
+                block("tf4") + block("doc3") + block("tf6") + block("doc9"),
+            ]
+            assert index.posting_count(b"t" * 16) == 4
+            assert index.posting_count(b"u" * 16) == 3
+        index_format.add_tombstones(path, [block("doc3")])
+        with open_index(path) as index:
+            assert index.intersect([b"t" * 16, b"u" * 16]) == [
+                block("tf2") + block("doc9"),
+                block("tf6") + block("doc9"),
+            ]
+            assert index.lookup(b"t" * 16, [block("doc3"), block("doc9")]) == (
+                block("tf2") + block("doc9")
+            )
+            # 求交集前过滤墓碑后的posting数
+            assert index.posting_count(b"t" * 16) == 3
+            assert index.posting_count(b"u" * 16) == 2
+            assert index.posting_count(b"missing") == 0
+
+    def test_full_rebuild_removes_segments(self, tmp_path, inverted_index):
+        """场景4: 重新写入完整索引后删除旧的追加段"""
+        path = str(tmp_path / "index.bin")
+        write_index(path, inverted_index)
+        index_format.append_segment(path, {b"t" * 16: [(block("tf1"), block("doc7"))]})
+        write_index(path, inverted_index)
+        index_format.remove_segments(path)
+        assert isinstance(open_index(path), MappedIndex)
+        assert not (tmp_path / "index.bin.1").exists()
+
+
+class TestRunSpiller:
+    def test_matches_in_memory_index(self, tmp_path):
+        """场景1: 溢写为多个run后归并，结果与内存中构建的索引完全相同"""
+        inverted_index = {
+            f"keyword {k}".encode(): [
+                (block(f"tf{d % 3}"), block(f"doc{d}")) for d in range(k, 40, k + 1)
+            ]
+            for k in range(30)
+        }
+        spill_dir = tmp_path / "runs"
+        spill_dir.mkdir()
+        with index_format.RunSpiller(1024, str(spill_dir)) as runs:
+            # 同一关键词分两次添加
+            for token, postings in inverted_index.items():
+                runs.add(token, postings[:2])
+            for token, postings in inverted_index.items():
+                runs.add(token, postings[2:])
+            runs.write_index(tmp_path / "spilled.bin")
+            assert runs.run_count > 1
+        assert list(spill_dir.iterdir()) == []
+
+        write_index(tmp_path / "in_memory.bin", inverted_index)
+        spilled = (tmp_path / "spilled.bin").read_bytes()
+        assert spilled == (tmp_path / "in_memory.bin").read_bytes()
+
+    def test_without_spilling(self, tmp_path, inverted_index):
+        """场景2: 预算足够时只写出一个run"""
+        with index_format.RunSpiller(1 << 20, str(tmp_path)) as runs:
+            for token, postings in inverted_index.items():
+                runs.add(token, postings)
+            runs.write_index(tmp_path / "index.bin")
+            assert runs.run_count == 1
+        with MappedIndex(tmp_path / "index.bin") as index:
+            # 外存构建不保留没有posting的关键词
+            assert len(index) == 2
+            for token, postings in inverted_index.items():
+                if postings:
+                    assert index[token] == postings
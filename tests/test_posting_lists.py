@@ -0,0 +1,65 @@
+import os
+import random
+import pytest
+
+import posting_lists
+
+
+def records_of(postings) -> bytes:
+    return b"".join(tf + doc for tf, doc in postings)
+
+
+def postings_of(records: bytes) -> list[tuple[bytes, bytes]]:
+    return [
+        (records[i : i + 16], records[i + 16 : i + 32])
+        for i in range(0, len(records), 32)
+    ]
+
+
+def test_sort_by_doc():
+    """场景1: 按doc_id密文的字节序排序，末尾的0字节也参与比较"""
+    docs = [b"b".ljust(16, b"\0"), b"a".ljust(16, b"\1"), b"a".ljust(16, b"\0")]
+    records = records_of((b"t" * 16, doc) for doc in docs)
+    sorted_records = posting_lists.sort_by_doc(records)
+    assert [doc for _, doc in postings_of(sorted_records)] == sorted(docs)
+    assert posting_lists.sort_by_doc(b"") == b""
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_intersect_matches_sets(seed):
+    """场景2: 与集合求交的结果一致，并保留各列表自己的词频密文"""
+    rng = random.Random(seed)
+    docs = [os.urandom(16) for _ in range(200)]
+    lists = [
+        [(bytes([k]) * 16, doc) for doc in rng.sample(docs, rng.randint(1, 150))]
+        for k in range(3)
+    ]
+    common = set.intersection(*({doc for _, doc in postings} for postings in lists))
+
+    result = posting_lists.intersect([records_of(postings) for postings in lists])
+    for k, records in enumerate(result):
+        postings = postings_of(records)
+        assert [doc for _, doc in postings] == sorted(common)
+        assert all(tf == bytes([k]) * 16 for tf, _ in postings)
+
+
+def test_intersect_empty():
+    """场景3: 任一列表为空或没有共同文档时结果为空"""
+    a = records_of([(b"t" * 16, b"a" * 16), (b"t" * 16, b"b" * 16)])
+    c = records_of([(b"t" * 16, b"c" * 16)])
+    assert posting_lists.intersect([a, b""]) == [b"", b""]
+    assert posting_lists.intersect([a, c]) == [b"", b""]
+    assert posting_lists.intersect([a]) == [posting_lists.sort_by_doc(a)]
+    assert posting_lists.intersect([]) == []
+
+
+def test_lookup():
+    """场景4: 只返回指定文档的postings，按doc_id密文排序，不存在的文档被忽略"""
+    docs = [os.urandom(16) for _ in range(50)]
+    postings = [(bytes([d]) * 16, doc) for d, doc in enumerate(docs)]
+    records = records_of(postings)
+    wanted = [docs[7], docs[3], docs[7], os.urandom(16)]
+    expected = sorted((p for p in postings if p[1] in wanted), key=lambda p: p[1])
+    assert posting_lists.lookup(records, wanted) == records_of(expected)
+    assert posting_lists.lookup(records, []) == b""
+    assert posting_lists.lookup(b"", wanted) == b""
@@ -0,0 +1,280 @@
+import base64
+import pytest
+
+import posting_wire
+from index_format import open_index, write_index
+
+
+def block(tag: str) -> bytes:
+    """构造16字节的模拟密文"""
+    return tag.encode().ljust(16, b"\0")
+
+
+POSTINGS = [(block("tf1"), block("doc0")), (block("tf2"), block("doc3"))]
+
+
+def test_round_trip():
+    """场景1: 编码后解码得到首尾相接的定长记录"""
+    data = posting_wire.encode_postings(POSTINGS)
+    assert len(data) == posting_wire.HEADER_LEN + 2 * posting_wire.RECORD_SIZE
+    records = posting_wire.decode(data)
+    assert bytes(records) == b"".join(tf + doc for tf, doc in POSTINGS)
+    assert posting_wire.split_records(records) == POSTINGS
+    empty = posting_wire.decode(posting_wire.encode(b""))
+    assert posting_wire.split_records(empty) == []
+    assert posting_wire.read_flags(data) == 0
+    flagged = posting_wire.encode(b"", posting_wire.CANDIDATES)
+    assert posting_wire.read_flags(flagged) == posting_wire.CANDIDATES
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"XXXX" + posting_wire.encode_postings(POSTINGS)[4:],
+        posting_wire.encode_postings(POSTINGS)[:-1],
+        posting_wire.encode_postings(POSTINGS) + b"\0",
+    ],
+)
+def test_rejects_malformed(data):
+    """场景2: 魔数错误、截断或多余数据"""
+    with pytest.raises(ValueError):
+        posting_wire.decode(data)
+
+
+def test_decode_many():
+    """多段响应依次解码"""
+    data = posting_wire.encode_postings(POSTINGS) + posting_wire.encode(b"")
+    data += posting_wire.encode_postings(POSTINGS[:1])
+    parts = posting_wire.decode_many(data)
+    assert [posting_wire.split_records(part) for part in parts] == [
+        POSTINGS,
+        [],
+        POSTINGS[:1],
+    ]
+    with pytest.raises(ValueError):
+        posting_wire.decode_many(data[:-1])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 48, 1 << 16])
+def test_iter_decode(chunk_size):
+    """分块到达的流中每收齐一段就产出一段"""
+    data = posting_wire.encode_postings(POSTINGS) + posting_wire.encode(b"")
+    data += posting_wire.encode_postings(POSTINGS[::-1])
+    chunks = (data[i : i + chunk_size] for i in range(0, len(data), chunk_size))
+    parts = [posting_wire.split_records(p) for p in posting_wire.iter_decode(chunks)]
+    assert parts == [POSTINGS, [], POSTINGS[::-1]]
+    with pytest.raises(ValueError):
+        list(posting_wire.iter_decode([data[:-1]]))
+
+
+def test_rejects_variable_width():
+    with pytest.raises(ValueError):
+        posting_wire.encode(b"\0" * 33)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("binary_index", [True, False])
+async def test_search_server_binary(tmp_path, monkeypatch, binary_index):
+    """场景3: 二进制接口返回与索引中相同的postings"""
+    search_server = pytest.importorskip("search_server")
+    inverted_index = {b"t" * 16: POSTINGS}
+    path = tmp_path / "index.bin"
+    if binary_index:
+        write_index(path, inverted_index)
+        inverted_index = open_index(path)
+    monkeypatch.setattr(search_server, "inverted_index", inverted_index)
+    monkeypatch.setattr(search_server, "reload_if_changed", lambda: None)
+
+    token = search_server.RankedQuery(
+        token_base64=base64.b64encode(b"t" * 16).decode()
+    )
+    response = await search_server.search_server_binary(token)
+    assert response.media_type == posting_wire.MEDIA_TYPE
+    assert posting_wire.split_records(posting_wire.decode(response.body)) == POSTINGS
+
+    missing = search_server.RankedQuery(
+        token_base64=base64.b64encode(b"none").decode()
+    )
+    response = await search_server.search_server_binary(missing)
+    assert bytes(posting_wire.decode(response.body)) == b""
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ranked", [True, False])
+async def test_search_server_limit(tmp_path, monkeypatch, ranked):
+    """场景4: 按词频排序的索引只返回所请求的区间，否则返回带标志的候选记录"""
+    search_server = pytest.importorskip("search_server")
+    path = tmp_path / "index.bin"
+    write_index(path, {b"t" * 16: POSTINGS}, ranked=ranked)
+    monkeypatch.setattr(search_server, "inverted_index", open_index(path))
+    monkeypatch.setattr(search_server, "reload_if_changed", lambda: None)
+
+    token = base64.b64encode(b"t" * 16).decode()
+    query = search_server.RankedQuery(token_base64=token, offset=1, limit=1)
+    response = await search_server.search_server_binary(query)
+    records = posting_wire.split_records(posting_wire.decode(response.body))
+    flags = posting_wire.read_flags(response.body)
+    if ranked:
+        assert (records, flags) == (POSTINGS[1:], 0)
+    else:
+        assert (records, flags) == (POSTINGS, posting_wire.CANDIDATES)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["and", "or"])
+@pytest.mark.parametrize("binary_index", [False, True])
+async def test_search_multi(tmp_path, monkeypatch, mode, binary_index):
+    """场景4: and只返回共同文档的postings，or返回全部postings"""
+    search_server = pytest.importorskip("search_server")
+    other = [(block("tf4"), block("doc3")), (block("tf5"), block("doc9"))]
+    inverted_index = {b"a" * 16: POSTINGS, b"b" * 16: other}
+    tokens = [base64.b64encode(token).decode() for token in inverted_index]
+    if binary_index:
+        write_index(tmp_path / "index.bin", inverted_index)
+        inverted_index = open_index(tmp_path / "index.bin")
+    monkeypatch.setattr(search_server, "inverted_index", inverted_index)
+    monkeypatch.setattr(search_server, "document_count", 7)
+    monkeypatch.setattr(search_server, "reload_if_changed", lambda: None)
+
+    query = search_server.MultiTokenQuery(tokens_base64=tokens, mode=mode)
+    response = await search_server.search_multi(query)
+    parts = posting_wire.decode_many(response.body)
+    if mode == "and":
+        expected = [[POSTINGS[1]], [other[0]]]
+    else:
+        expected = [POSTINGS, other]
+    assert [posting_wire.split_records(part) for part in parts] == expected
+    # 文档频率为求交集前的posting数
+    assert response.headers[posting_wire.POSTING_COUNTS_HEADER] == "2,2"
+    assert response.headers[posting_wire.DOCUMENT_COUNT_HEADER] == "7"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("binary_index", [False, True])
+async def test_lookup_postings(tmp_path, monkeypatch, binary_index):
+    """场景6: 只返回指定文档在每个关键词中的postings，并返回文档频率和文档总数"""
+    search_server = pytest.importorskip("search_server")
+    other = [(block("tf4"), block("doc3")), (block("tf5"), block("doc9"))]
+    inverted_index = {b"a" * 16: POSTINGS, b"b" * 16: other}
+    tokens = [base64.b64encode(token).decode() for token in inverted_index]
+    tokens.append(base64.b64encode(b"missing").decode())
+    if binary_index:
+        write_index(tmp_path / "index.bin", inverted_index, ranked=True)
+        inverted_index = open_index(tmp_path / "index.bin")
+    monkeypatch.setattr(search_server, "inverted_index", inverted_index)
+    monkeypatch.setattr(search_server, "document_count", 7)
+    monkeypatch.setattr(search_server, "reload_if_changed", lambda: None)
+
+    doc_ids = [base64.b64encode(block(doc)).decode() for doc in ("doc9", "doc3")]
+    query = search_server.LookupQuery(tokens_base64=tokens, doc_ids_base64=doc_ids)
+    response = await search_server.lookup_postings(query)
+    parts = posting_wire.decode_many(response.body)
+    assert [posting_wire.split_records(part) for part in parts] == [
+        [POSTINGS[1]],
+        other,
+        [],
+    ]
+
+    query = search_server.TokenList(tokens_base64=tokens)
+    assert await search_server.posting_counts(query) == {
+        "posting_counts": [2, 2, 0],
+        "document_count": 7,
+    }
+
+
+@pytest.mark.asyncio
+async def test_search_server_pages(tmp_path, monkeypatch):
+    """场景5: 游标分页和流式返回的结果与完整查询相同，索引变化后旧游标失效"""
+    search_server = pytest.importorskip("search_server")
+    from fastapi import HTTPException
+
+    postings = [(block(f"tf{d}"), block(f"doc{d}")) for d in range(5)]
+    monkeypatch.setattr(search_server, "inverted_index", {b"t" * 16: postings})
+    monkeypatch.setattr(search_server, "reload_if_changed", lambda: None)
+    token = base64.b64encode(b"t" * 16).decode()
+
+    pages, cursor = [], None
+    while True:
+        query = search_server.PageQuery(token_base64=token, cursor=cursor, page_size=2)
+        response = await search_server.search_server_page(query)
+        pages.append(posting_wire.split_records(posting_wire.decode(response.body)))
+        cursor = response.headers.get(search_server.CURSOR_HEADER)
+        if cursor is None:
+            break
+    assert pages == [postings[:2], postings[2:4], postings[4:]]
+
+    query = search_server.PageQuery(token_base64=token, page_size=2)
+    response = await search_server.search_server_stream(query)
+    chunks = [chunk async for chunk in response.body_iterator]
+    assert len(chunks) == 3
+    assert [
+        posting_wire.split_records(page) for page in posting_wire.iter_decode(chunks)
+    ] == pages
+
+    query = search_server.PageQuery(token_base64=token, page_size=2)
+    cursor = (await search_server.search_server_page(query)).headers[
+        search_server.CURSOR_HEADER
+    ]
+    monkeypatch.setattr(search_server, "loaded_version", ("rebuilt",))
+    with pytest.raises(HTTPException) as error:
+        await search_server.search_server_page(
+            search_server.PageQuery(token_base64=token, cursor=cursor)
+        )
+    assert error.value.status_code == 409
+
+
+def test_reload_keeps_index_on_error(tmp_path, monkeypatch):
+    """索引清单损坏时继续使用已加载的索引，修复后下一次请求重新加载"""
+    search_server = pytest.importorskip("search_server")
+    path = tmp_path / "index.bin"
+    write_index(path, {b"t" * 16: POSTINGS})
+    monkeypatch.setattr(search_server, "DEFAULT_INDEX_PATH", str(path))
+    monkeypatch.setattr(search_server, "DEFAULT_FILE_DIR", str(tmp_path / "docs"))
+    # reload_if_changed替换的全局对象在测试结束后恢复
+    for name in ("inverted_index", "doc_store", "document_count", "loaded_version"):
+        monkeypatch.setattr(search_server, name, getattr(search_server, name))
+    search_server.reload_if_changed()
+    loaded = search_server.inverted_index
+    assert loaded.get(b"t" * 16) == POSTINGS
+
+    manifest = tmp_path / "index.bin.manifest"
+    manifest.write_text('{"segments": ["index.bin"')
+    search_server.reload_if_changed()
+    assert search_server.inverted_index is loaded
+    assert search_server.loaded_version != search_server.data_version()
+
+    manifest.write_text(
+        '{"segments": ["index.bin"], "tombstones": [], "next_segment": 1}'
+    )
+    search_server.reload_if_changed()
+    assert search_server.inverted_index is not loaded
+    assert search_server.loaded_version == search_server.data_version()
+    search_server.inverted_index.close()
+    loaded.close()
+
+
+def test_reload_counts_documents_once(tmp_path, monkeypatch):
+    """文档数在重新加载时统计，文档表变化后更新"""
+    search_server = pytest.importorskip("search_server")
+    from doc_store import DocTableWriter, append_documents, delete_documents
+
+    file_dir = str(tmp_path)
+    table = DocTableWriter()
+    locations = append_documents(file_dir, [b"a", b"bb", b"c"])
+    for doc_id, location in enumerate(locations):
+        table.add(doc_id, location)
+    table.write(file_dir)
+    monkeypatch.setattr(
+        search_server, "DEFAULT_INDEX_PATH", str(tmp_path / "index.bin")
+    )
+    monkeypatch.setattr(search_server, "DEFAULT_FILE_DIR", file_dir)
+    for name in ("inverted_index", "doc_store", "document_count", "loaded_version"):
+        monkeypatch.setattr(search_server, name, getattr(search_server, name))
+    search_server.reload_if_changed()
+    assert search_server.document_count == 3
+
+    delete_documents(file_dir, [1])
+    search_server.reload_if_changed()
+    assert search_server.document_count == 2
+    search_server.doc_store.close()
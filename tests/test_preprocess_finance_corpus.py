@@ -1,6 +1,6 @@
 # 新增测试文件
 import pandas as pd
-from preprocess_finance_corpus import process_news  # 需要将your_module替换为实际模块名
+from preprocess_finance_corpus import iter_news, iter_query_batches, process_news  # 需要将your_module替换为实际模块名
 
 def test_news_processing():
     # 测试数据
@@ -48,4 +48,42 @@ def test_empty_news():
     empty_data_df = pd.DataFrame(empty_data)
     assert len(empty_data_df) == 0
     result = process_news(empty_data_df)
-    assert result == []
\ No newline at end of file
+    assert result == []
+
+def test_iter_news():
+    # 逐条产出的结果与process_news相同
+    news_df = pd.DataFrame(
+        [
+            {'title': 'First', 'news': [{'paragraph': 'a'}, {'paragraph': 'b'}]},
+            {'title': 'Second', 'news': [{'paragraph': 'c'}]},
+        ]
+    )
+    documents = iter_news(news_df)
+    assert next(documents) == {'title': 'First', 'text': 'a\nb'}
+    assert list(documents) == process_news(news_df)[1:]
+
+def test_iter_query_batches():
+    # 用LIMIT … OFFSET分批查询，每批不超过batch_size行，拼接后与一次查询相同
+    import re
+
+    news_df = pd.DataFrame({'title': [f't{i}' for i in range(10)], 'news': [[]] * 10})
+    queries = []
+
+    def query(sql):
+        queries.append(sql)
+        limit, offset = map(int, re.search(r"LIMIT (\d+) OFFSET (\d+)", sql).groups())
+        return news_df[offset:offset + limit]
+
+    batches = list(iter_query_batches(query, 'news.parquet', None, 4))
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert list(pd.concat(batches)['title']) == list(news_df['title'])
+    assert queries[0] == "SELECT * FROM 'news.parquet' LIMIT 4 OFFSET 0"
+
+    # count限制读取的总行数，恰好读完时不再多查询一次
+    queries.clear()
+    batches = list(iter_query_batches(query, 'news.parquet', 6, 3))
+    assert [len(batch) for batch in batches] == [3, 3]
+    assert len(queries) == 2
+    assert list(iter_query_batches(query, 'news.parquet', 0, 3)) == []
+    batches = list(iter_query_batches(query, 'news.parquet', None, 5))
+    assert [len(batch) for batch in batches] == [5, 5]
@@ -5,7 +5,8 @@ from encrypt_keyword import (
     symmetric_encryption_for_keyword,
     symmetric_decryption_for_keyword,
 )
-from my import EncryptedIndexBuilder, Searcher
+import my
+from my import EncryptedIndexBuilder, Searcher, process_document_batch
 
 multiprocessing.set_start_method("forkserver", force=True)
 
@@ -114,3 +115,391 @@ def test_empty_keyword_search(engine):
     token = symmetric_encryption_for_keyword(TEST_INDEX_KEY, "")
     results = engine.search(token)
     assert len(results) == 0
+
+
+def test_documents_written_by_workers(engine, test_data):
+    """测试工作进程直接写入的密文文档可以被解密"""
+    searcher = Searcher(TEST_INDEX_PATH, TEST_FILE_PATH, TEST_FILE_KEY)
+    for doc_id, doc in enumerate(test_data):
+        assert searcher.decrypt_document(doc_id) == doc["title"] + " " + doc["text"]
+
+
+def test_large_documents_use_stream_format(tmp_path, test_data, monkeypatch):
+    """测试UTF-8编码后超过一段的文档以分段加密格式写入"""
+    import enc_rust
+
+    from doc_store import DocStore, DocTableWriter
+
+    monkeypatch.setattr(my, "STREAM_CHUNK_SIZE", 60)
+    results = process_document_batch(
+        list(enumerate(test_data)), TEST_FILE_KEY, str(tmp_path)
+    )
+    assert [idx for idx, *_ in results] == [0, 1, 2]
+    doc_table = DocTableWriter()
+    for idx, _, location in results:
+        doc_table.add(idx, location)
+    doc_table.write(str(tmp_path))
+    store = DocStore(str(tmp_path))
+    for doc_id, doc in enumerate(test_data):
+        content = doc["title"] + " " + doc["text"]
+        encrypted = store.get(doc_id)
+        is_large = len(content.encode()) > 60
+        assert encrypted.startswith(enc_rust.STREAM_MAGIC) == is_large
+        assert my.decrypt_doc(encrypted, TEST_FILE_KEY) == content
+
+
+def test_compressed_documents_with_zdict(tmp_path, test_data):
+    """测试压缩后加密的文档和预设字典可以被Searcher读取"""
+    import doc_codec
+    from doc_store import load_zdict, open_doc_store
+
+    test_file = tmp_path / "test_dataset.json"
+    test_file.write_text(json.dumps(test_data))
+    file_dir = tmp_path / "docs"
+    index_builder = EncryptedIndexBuilder(
+        file_key=TEST_FILE_KEY,
+        index_key=TEST_INDEX_KEY,
+        dataset_path=str(test_file),
+        threshold=1,
+        compression="zlib",
+        zdict_samples=3,
+    )
+    index_builder.process_whole_document_set(str(file_dir))
+    assert load_zdict(str(file_dir)) is not None
+    store = open_doc_store(str(file_dir))
+    assert doc_codec.read_codec(store.get(0)) == doc_codec.ZLIB_DICT
+
+    index_builder.dump_index(str(tmp_path / "index.bin"))
+    searcher = Searcher(str(tmp_path / "index.bin"), str(file_dir), TEST_FILE_KEY)
+    for doc_id, doc in enumerate(test_data):
+        assert searcher.decrypt_document(doc_id) == doc["title"] + " " + doc["text"]
+
+
+def test_incremental_append_and_delete(tmp_path, test_data, monkeypatch):
+    """测试增量添加文档、删除文档以及合并索引段"""
+    import index_format
+
+    test_file = tmp_path / "test_dataset.json"
+    test_file.write_text(json.dumps(test_data[:2]))
+    file_dir = str(tmp_path / "docs")
+    index_path = str(tmp_path / "index.bin")
+    index_builder = EncryptedIndexBuilder(
+        file_key=TEST_FILE_KEY,
+        index_key=TEST_INDEX_KEY,
+        dataset_path=str(test_file),
+        threshold=0,
+    )
+    index_builder.process_whole_document_set(file_dir)
+    index_builder.dump_index(index_path)
+
+    new_ids = index_builder.append_documents(file_dir, index_path, test_data[2:])
+    assert list(new_ids) == [2]
+
+    def search_ids(keyword):
+        # 各段按词频排序后拼接，结果不按doc_id有序
+        searcher = Searcher(index_path, file_dir, TEST_FILE_KEY)
+        token = symmetric_encryption_for_keyword(TEST_INDEX_KEY, keyword)
+        return sorted(
+            int(symmetric_decryption_for_keyword(TEST_INDEX_KEY, doc_id_enc))
+            for _, doc_id_enc in searcher.search(token)
+        )
+
+    assert search_ids("computing") == [0, 1, 2]
+    # 只出现在新文档中的词也成为关键词
+    assert search_ids("cybersecurity") == [2]
+    searcher = Searcher(index_path, file_dir, TEST_FILE_KEY)
+    assert searcher.decrypt_document(2) == "Cybersecurity " + test_data[2]["text"]
+
+    index_builder.delete_documents(file_dir, index_path, [0])
+    assert search_ids("computing") == [1, 2]
+    with pytest.raises(FileNotFoundError):
+        Searcher(index_path, file_dir, TEST_FILE_KEY).decrypt_document(0)
+
+    # 数据拥有者合并索引段后仍按词频排序
+    assert index_builder.compact_index(index_path)
+    with index_format.open_index(index_path) as index:
+        assert index.ranked
+    assert search_ids("computing") == [1, 2]
+    assert search_ids("cloud") == []
+
+    # 后台合并用compact_index.py命令，由密钥文件解密词频，墓碑触发合并后仍按词频排序
+    import runpy
+    import sys
+
+    key_file = tmp_path / "keys.bin"
+    key_file.write_bytes(TEST_FILE_KEY + TEST_INDEX_KEY)
+    index_builder.delete_documents(file_dir, index_path, [1])
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["compact_index.py", "--key_file", str(key_file), "--index_path", index_path],
+    )
+    runpy.run_module("compact_index", run_name="__main__")
+    assert not index_format.read_manifest(index_path)["tombstones"]
+    with index_format.open_index(index_path) as index:
+        assert index.ranked
+    assert search_ids("computing") == [2]
+
+
+def test_append_keeps_max_df_pruning(tmp_path, test_data):
+    """测试完整构建时按文档频率上限剪掉的词，增量添加文档后仍然不可搜索"""
+    test_file = tmp_path / "test_dataset.json"
+    test_file.write_text(json.dumps(test_data[:2]))
+    file_dir = str(tmp_path / "docs")
+    index_path = str(tmp_path / "index.bin")
+    index_builder = EncryptedIndexBuilder(
+        file_key=TEST_FILE_KEY,
+        index_key=TEST_INDEX_KEY,
+        dataset_path=str(test_file),
+        threshold=0,
+        max_df=1,
+    )
+    index_builder.process_whole_document_set(file_dir)
+    assert "computing" not in index_builder.keywords_list
+    index_builder.dump_index(index_path)
+
+    # 新文档中computing只出现在一个文档里，但全部文档中的文档频率仍超过上限
+    index_builder.append_documents(file_dir, index_path, test_data[2:])
+    assert "computing" not in index_builder.keywords_list
+    assert "cybersecurity" in index_builder.keywords_list
+    searcher = Searcher(index_path, file_dir, TEST_FILE_KEY)
+    token = symmetric_encryption_for_keyword(TEST_INDEX_KEY, "computing")
+    assert searcher.search(token) == []
+
+
+def test_out_of_core_build(tmp_path, test_data):
+    """测试按内存预算溢写postings的外存构建与内存构建结果一致"""
+    test_file = tmp_path / "test_dataset.json"
+    test_file.write_text(json.dumps(test_data))
+    index_paths = []
+    for memory_budget in (None, 128):
+        index_builder = EncryptedIndexBuilder(
+            file_key=TEST_FILE_KEY,
+            index_key=TEST_INDEX_KEY,
+            dataset_path=str(test_file),
+            threshold=0,
+            memory_budget=memory_budget,
+            spill_dir=str(tmp_path),
+        )
+        index_builder.process_whole_document_set(str(tmp_path / "docs"))
+        assert bool(index_builder.inverted_index) == (memory_budget is None)
+        index_paths.append(tmp_path / f"index-{memory_budget}.bin")
+        index_builder.dump_index(str(index_paths[-1]))
+    assert index_paths[0].read_bytes() == index_paths[1].read_bytes()
+
+
+def test_postings_ranked_by_tf(tmp_path):
+    """测试posting列表按词频降序排列（词频相同时按文档顺序），可以只读取前k个"""
+    from index_format import MappedIndex
+    from sort_enc_result import sort_packed_result
+
+    texts = ["market", "market market market", "market", "market market"]
+    test_file = tmp_path / "test_dataset.json"
+    test_file.write_text(json.dumps([{"title": "", "text": t} for t in texts]))
+    index_builder = EncryptedIndexBuilder(
+        file_key=TEST_FILE_KEY,
+        index_key=TEST_INDEX_KEY,
+        dataset_path=str(test_file),
+        threshold=0,
+    )
+    index_builder.process_whole_document_set(str(tmp_path / "docs"))
+    index_builder.dump_index(str(tmp_path / "index.bin"))
+
+    token = symmetric_encryption_for_keyword(TEST_INDEX_KEY, "market")
+    with MappedIndex(tmp_path / "index.bin") as index:
+        assert index.ranked
+        postings = [
+            (
+                int(symmetric_decryption_for_keyword(TEST_INDEX_KEY, tf_enc)),
+                int(symmetric_decryption_for_keyword(TEST_INDEX_KEY, doc_id_enc)),
+            )
+            for tf_enc, doc_id_enc in index.get(token)
+        ]
+        assert postings == [(3, 1), (2, 3), (1, 0), (1, 2)]
+        top_2 = index.get_records(token, 0, 2)
+    assert sort_packed_result(top_2, TEST_INDEX_KEY) == [(3, 1), (2, 3)]
+
+
+def test_resume_from_checkpoint(tmp_path, test_data, monkeypatch):
+    """测试中断的构建从检查点恢复，修改threshold后只重新运行后续阶段"""
+    import index_format
+
+    test_file = tmp_path / "test_dataset.json"
+    test_file.write_text(json.dumps(test_data))
+    file_dir = str(tmp_path / "docs")
+
+    def make_builder(threshold=0, **kwargs):
+        return EncryptedIndexBuilder(
+            file_key=TEST_FILE_KEY,
+            index_key=TEST_INDEX_KEY,
+            dataset_path=str(test_file),
+            threshold=threshold,
+            batch_size=1,
+            max_pending_batches=1,
+            checkpoint_dir=str(tmp_path / "build"),
+            checkpoint_interval=1,
+            **kwargs,
+        )
+
+    def crash_after_two(count=None):
+        yield from test_data[:2]
+        raise RuntimeError("build host went away")
+
+    builder = make_builder()
+    monkeypatch.setattr(builder, "iter_documents", crash_after_two)
+    with pytest.raises(RuntimeError):
+        builder.process_whole_document_set(file_dir)
+
+    resumed = make_builder(memory_budget=1 << 20)
+    resumed.process_whole_document_set(file_dir)
+    resumed.dump_index(str(tmp_path / "index.bin"))
+
+    reference = EncryptedIndexBuilder(
+        file_key=TEST_FILE_KEY,
+        index_key=TEST_INDEX_KEY,
+        dataset_path=str(test_file),
+        threshold=0,
+    )
+    reference.process_whole_document_set(str(tmp_path / "reference"))
+    reference.dump_index(str(tmp_path / "reference.bin"))
+    assert (tmp_path / "index.bin").read_bytes() == (
+        tmp_path / "reference.bin"
+    ).read_bytes()
+    searcher = Searcher(str(tmp_path / "index.bin"), file_dir, TEST_FILE_KEY)
+    for doc_id, doc in enumerate(test_data):
+        assert searcher.decrypt_document(doc_id) == doc["title"] + " " + doc["text"]
+
+    # 文档阶段已完成，不再读取数据集
+    rerun = make_builder(threshold=2, memory_budget=1 << 20)
+    monkeypatch.setattr(rerun, "iter_documents", crash_after_two)
+    rerun.process_whole_document_set(file_dir)
+    assert rerun.keywords_list == {"computing", "systems"}
+    report = rerun.format_pruning_report()
+
+    # 关键词阶段已完成，恢复的构建沿用保存的关键词和剪枝报告
+    restored = make_builder(threshold=2, memory_budget=1 << 20)
+    restored.process_whole_document_set(file_dir)
+    assert restored.keywords_list == rerun.keywords_list
+    assert restored.format_pruning_report() == report
+    rerun.dump_index(str(tmp_path / "index.bin"))
+    token = symmetric_encryption_for_keyword(TEST_INDEX_KEY, "cloud")
+    assert index_format.open_index(str(tmp_path / "index.bin")).get(token) is None
+
+
+def test_rebuild_index_with_new_threshold(tmp_path, test_data):
+    """测试用保存的词频统计按新threshold重建索引，结果与完整构建一致"""
+    from rebuild_index import rebuild_index
+
+    test_file = tmp_path / "test_dataset.json"
+    test_file.write_text(json.dumps(test_data))
+
+    def full_build(threshold, file_dir, index_path):
+        index_builder = EncryptedIndexBuilder(
+            file_key=TEST_FILE_KEY,
+            index_key=TEST_INDEX_KEY,
+            dataset_path=str(test_file),
+            threshold=threshold,
+        )
+        index_builder.process_whole_document_set(str(file_dir))
+        index_builder.dump_index(str(index_path))
+        return index_builder
+
+    full_build(0, tmp_path / "docs", tmp_path / "index.bin")
+    assert (tmp_path / "docs" / my.TERM_COUNTS_NAME).exists()
+    rebuilt = rebuild_index(
+        TEST_FILE_KEY,
+        TEST_INDEX_KEY,
+        2,
+        str(tmp_path / "docs"),
+        str(tmp_path / "index.bin"),
+        str(tmp_path / "keywords.txt"),
+    )
+    keywords = (tmp_path / "keywords.txt").read_text().split()
+    assert sorted(keywords) == ["computing", "systems"]
+    expected = full_build(2, tmp_path / "expected", tmp_path / "expected.bin")
+    assert rebuilt.keywords_list == expected.keywords_list
+    assert (tmp_path / "index.bin").read_bytes() == (
+        tmp_path / "expected.bin"
+    ).read_bytes()
+
+    # 已删除的文档不出现在重建的索引中，增量添加的文档会出现
+    file_dir, index_path = str(tmp_path / "docs"), str(tmp_path / "index.bin")
+    rebuilt.delete_documents(file_dir, index_path, [0])
+    rebuilt.append_documents(file_dir, index_path, test_data[:1])
+    rebuild_index(
+        TEST_FILE_KEY,
+        TEST_INDEX_KEY,
+        0,
+        file_dir,
+        index_path,
+        str(tmp_path / "keywords.txt"),
+    )
+    searcher = Searcher(index_path, file_dir, TEST_FILE_KEY)
+    token = symmetric_encryption_for_keyword(TEST_INDEX_KEY, "cloud")
+    doc_ids = [
+        int(symmetric_decryption_for_keyword(TEST_INDEX_KEY, doc_id_enc))
+        for _, doc_id_enc in searcher.search(token)
+    ]
+    assert doc_ids == [3]
+
+
+def test_sketch_keyword_selection(tmp_path, test_data):
+    """测试用Count-Min Sketch近似选择关键词后精确校验，结果与精确统计一致"""
+    test_file = tmp_path / "test_dataset.json"
+    test_file.write_text(json.dumps(test_data))
+    builders = []
+    for sketch_width in (None, 64):
+        index_builder = EncryptedIndexBuilder(
+            file_key=TEST_FILE_KEY,
+            index_key=TEST_INDEX_KEY,
+            dataset_path=str(test_file),
+            threshold=1,
+            sketch_width=sketch_width,
+        )
+        index_builder.process_whole_document_set(str(tmp_path / "docs"))
+        index_builder.dump_index(str(tmp_path / f"index-{sketch_width}.bin"))
+        builders.append(index_builder)
+    exact, approximate = builders
+    assert approximate.keywords_list == exact.keywords_list
+    # 只出现一次的单词大多没有进入词表
+    assert len(approximate.term_counts.words) < len(exact.term_counts.words)
+    assert (tmp_path / "index-None.bin").read_bytes() == (
+        tmp_path / "index-64.bin"
+    ).read_bytes()
+
+
+def test_rebuild_below_sketch_threshold(tmp_path, test_data):
+    """测试近似模式保存的词频统计不能按更低的threshold重建"""
+    from rebuild_index import rebuild_index
+
+    test_file = tmp_path / "test_dataset.json"
+    test_file.write_text(json.dumps(test_data))
+    index_builder = EncryptedIndexBuilder(
+        file_key=TEST_FILE_KEY,
+        index_key=TEST_INDEX_KEY,
+        dataset_path=str(test_file),
+        threshold=2,
+        sketch_width=64,
+    )
+    file_dir = str(tmp_path / "docs")
+    index_builder.process_whole_document_set(file_dir)
+    index_builder.dump_index(str(tmp_path / "index.bin"))
+
+    def rebuild(threshold):
+        return rebuild_index(
+            TEST_FILE_KEY,
+            TEST_INDEX_KEY,
+            threshold,
+            file_dir,
+            str(tmp_path / "rebuilt.bin"),
+            str(tmp_path / "keywords.txt"),
+        )
+
+    with pytest.raises(ValueError, match="threshold"):
+        rebuild(0)
+    assert not (tmp_path / "rebuilt.bin").exists()
+    # 不低于构建时threshold的重建仍然精确，增量添加文档后同样如此
+    assert rebuild(2).keywords_list == index_builder.keywords_list
+    index_builder.append_documents(file_dir, str(tmp_path / "index.bin"), test_data)
+    with pytest.raises(ValueError, match="threshold"):
+        rebuild(1)
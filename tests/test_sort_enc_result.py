@@ -4,12 +4,20 @@ from fastapi import HTTPException
 from unittest.mock import patch
 from sort_enc_result import sort_encrypted_results, SortRequest
 import sort_enc_result
+import encrypt_keyword
 from pydantic import ValidationError
 
 
 # Mock解密函数（假设密钥为"test_key"时解密逻辑）
 @pytest.fixture
 def mock_decryption(mocker):
+    # 批量解密接口逐个转发给被mock的单个解密函数
+    mocker.patch(
+        "encrypt_keyword.symmetric_decryption_for_keywords",
+        side_effect=lambda key, vals, parallel=False: [
+            encrypt_keyword.symmetric_decryption_for_keyword(key, val) for val in vals
+        ],
+    )
     return mocker.patch(
         "encrypt_keyword.symmetric_decryption_for_keyword",
         side_effect=lambda key, val: {
@@ -27,6 +35,77 @@ def mock_decryption(mocker):
     )
 
 
+def test_sort_packed_result():
+    """定长记录整段解密后按词频降序排列"""
+    key = b"1234567891234567"
+    records = b"".join(
+        encrypt_keyword.symmetric_encryption_for_keyword(key, str(tf))
+        + encrypt_keyword.symmetric_encryption_for_keyword(key, str(doc_id))
+        for tf, doc_id in [(2, 10), (7, 11), (1, 12)]
+    )
+    result = sort_enc_result.sort_packed_result(memoryview(records), key)
+    assert result == [(7, 11), (2, 10), (1, 12)]
+    assert sort_enc_result.sort_packed_result(b"", key) == []
+
+
+def test_sort_multi_result():
+    """多个关键词的词频按文档累加后降序排列"""
+    key = b"1234567891234567"
+
+    def records(pairs):
+        return b"".join(
+            encrypt_keyword.symmetric_encryption_for_keyword(key, str(tf))
+            + encrypt_keyword.symmetric_encryption_for_keyword(key, str(doc_id))
+            for tf, doc_id in pairs
+        )
+
+    record_lists = [records([(2, 10), (7, 11)]), records([(9, 10), (1, 12)])]
+    result = sort_enc_result.sort_multi_result(record_lists, key)
+    assert result == [(11, 10), (7, 11), (1, 12)]
+    # 只返回前k个，得分相同时文档ID小的在前
+    record_lists.append(records([(4, 12), (5, 13)]))
+    result = sort_enc_result.sort_multi_result(record_lists, key, k=3)
+    assert result == [(11, 10), (7, 11), (5, 12)]
+    assert sort_enc_result.sort_multi_result([b"", b""], key, k=3) == []
+
+
+def test_sort_multi_result_tfidf():
+    """文档频率低的关键词权重更高，文档频率和文档总数由服务器提供"""
+    import math
+
+    key = b"1234567891234567"
+
+    def records(pairs):
+        return b"".join(
+            encrypt_keyword.symmetric_encryption_for_keyword(key, str(tf))
+            + encrypt_keyword.symmetric_encryption_for_keyword(key, str(doc_id))
+            for tf, doc_id in pairs
+        )
+
+    common = records([(3, 1), (3, 2), (3, 3)])
+    rare = records([(3, 4)])
+    result = sort_enc_result.sort_multi_result(
+        [common, rare], key, scoring="tfidf", doc_freqs=[3, 1], doc_count=10
+    )
+    assert [doc_id for _, doc_id in result] == [4, 1, 2, 3]
+    assert result[0][0] == pytest.approx(3 * (math.log(11 / 2) + 1))
+
+    # and查询求交集后两个列表长度相同，仍按求交集前的文档频率加权
+    first = records([(5, 1), (1, 2)])
+    second = records([(1, 1), (4, 2)])
+    by_tf = sort_enc_result.sort_multi_result([first, second], key)
+    assert [doc_id for _, doc_id in by_tf] == [1, 2]
+    by_tfidf = sort_enc_result.sort_multi_result(
+        [first, second], key, scoring="tfidf", doc_freqs=[900, 2], doc_count=1000
+    )
+    assert [doc_id for _, doc_id in by_tfidf] == [2, 1]
+
+    with pytest.raises(ValueError):
+        sort_enc_result.sort_multi_result([common], key, scoring="tfidf")
+    with pytest.raises(ValueError):
+        sort_enc_result.sort_multi_result([common], key, scoring="bm25")
+
+
 # 正常功能测试
 def test_sort_encrypted_results(mock_decryption):
     encrypted_data = [
@@ -170,3 +249,56 @@ class TestSortEncryptedResults:
         response = await sort_encrypted_results(request)
         assert response == {"sorted_results": []}
         mock_sort.assert_called_once_with(enc_result_list=[], index_key=b"test_key")
+
+
+@pytest.mark.parametrize("scoring", ["tf", "tfidf"])
+def test_sort_ranked_prefixes(scoring):
+    """按词频排序的前缀确定前k个文档，结果与读取全部postings相同且只读取一部分"""
+    import random
+
+    key = b"1234567891234567"
+    rng = random.Random(7)
+    lists = []
+    for _ in range(3):
+        docs = rng.sample(range(2000), rng.randint(200, 600))
+        pairs = sorted(((int(rng.paretovariate(1.5)), d) for d in docs), reverse=True)
+        lists.append(
+            [
+                (
+                    encrypt_keyword.symmetric_encryption_for_keyword(key, str(tf)),
+                    encrypt_keyword.symmetric_encryption_for_keyword(key, str(d)),
+                )
+                for tf, d in pairs
+            ]
+        )
+    record_lists = [b"".join(tf + d for tf, d in postings) for postings in lists]
+    options = dict(scoring=scoring, doc_freqs=[len(p) for p in lists], doc_count=2000)
+    read = []
+
+    def fetch(i, offset, limit):
+        postings = lists[i][offset : offset + limit]
+        read.append(len(postings))
+        return b"".join(tf + d for tf, d in postings), False
+
+    def lookup(doc_id_encs):
+        read.append(len(doc_id_encs) * len(lists))
+        return [
+            b"".join(tf + d for tf, d in postings if d in doc_id_encs)
+            for postings in lists
+        ]
+
+    result = sort_enc_result.sort_ranked_prefixes(
+        fetch, lookup, len(lists), key, 10, **options
+    )
+    expected = sort_enc_result.sort_multi_result(record_lists, key, k=10, **options)
+    assert result == pytest.approx(expected)
+    assert sum(read) < sum(len(p) for p in lists) // 2
+
+    # 服务器只能返回候选集合时由调用方读取全部postings
+    candidates = lambda i, offset, limit: (record_lists[i], True)
+    assert (
+        sort_enc_result.sort_ranked_prefixes(
+            candidates, lookup, len(lists), key, 10, **options
+        )
+        is None
+    )
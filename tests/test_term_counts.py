@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from term_counts import TermCounts, TermTotals
+
+
+@pytest.fixture
+def term_counts():
+    """三个文档的词频统计"""
+    return TermCounts.from_mapping(
+        {
+            0: {"apple": 2, "pear": 1},
+            1: {},
+            2: {"pear": 4, "plum": 1},
+        }
+    )
+
+
+class TestTermCounts:
+    def test_csr_arrays(self, term_counts):
+        """场景1: 单词按首次出现顺序编号，词频按CSR格式存储"""
+        assert term_counts.words == ["apple", "pear", "plum"]
+        assert term_counts.vocab == {"apple": 0, "pear": 1, "plum": 2}
+        assert term_counts.doc_ids.tolist() == [0, 1, 2]
+        assert term_counts.doc_offsets.tolist() == [0, 2, 2, 4]
+        assert term_counts.term_ids.tolist() == [0, 1, 1, 2]
+        assert term_counts.counts.tolist() == [2, 1, 4, 1]
+        assert term_counts.doc_rows().tolist() == [0, 0, 2, 2]
+
+    def test_mapping_view(self, term_counts):
+        """场景2: 兼容 {doc_id: {word: count}} 的访问方式"""
+        assert len(term_counts) == 3
+        assert list(term_counts) == [0, 1, 2]
+        assert term_counts[2] == {"pear": 4, "plum": 1}
+        assert term_counts[1] == {}
+        with pytest.raises(KeyError):
+            term_counts[3]
+
+    def test_term_totals(self, term_counts):
+        """场景3: 按单词id汇总词频"""
+        assert term_counts.term_totals().tolist() == [2, 5, 1]
+
+    def test_doc_frequencies(self, term_counts):
+        assert term_counts.doc_frequencies().tolist() == [1, 2, 1]
+
+    def test_term_mask(self, term_counts):
+        """场景4: 不在词表中的单词被忽略"""
+        mask = term_counts.term_mask({"pear", "unknown"})
+        assert mask.tolist() == [False, True, False]
+        assert not term_counts.term_mask(set()).any()
+
+    def test_append_across_chunks(self, monkeypatch):
+        """场景5: 追加的文档跨越多个数组块，访问后仍可继续追加"""
+        monkeypatch.setattr(TermCounts, "FLUSH_DOCS", 2)
+        term_counts = TermCounts()
+        for doc_id in range(5):
+            term_counts.add_document(doc_id, {"w": doc_id, f"d{doc_id}": 1})
+        assert term_counts.doc_offsets.tolist() == [0, 2, 4, 6, 8, 10]
+        term_counts.add_document(5, {"w": 5})
+        assert len(term_counts) == 6
+        assert term_counts.term_totals()[term_counts.vocab["w"]] == sum(range(6))
+
+    def test_empty(self):
+        """场景6: 空统计"""
+        term_counts = TermCounts()
+        assert len(term_counts) == 0
+        assert term_counts.doc_offsets.tolist() == [0]
+        assert term_counts.term_totals().tolist() == []
+
+    def test_save_and_extend(self, tmp_path, term_counts):
+        """场景6: 保存为npz后恢复，并追加到词表不同的TermCounts中"""
+        np.savez(tmp_path / "chunk.npz", **term_counts.to_arrays())
+        with np.load(tmp_path / "chunk.npz") as arrays:
+            restored = TermCounts.from_arrays(arrays)
+        assert dict(restored.items()) == dict(term_counts.items())
+
+        merged = TermCounts.from_mapping({5: {"plum": 3, "fig": 1}})
+        merged.extend(restored)
+        assert merged.words == ["plum", "fig", "apple", "pear"]
+        assert merged.doc_ids.tolist() == [5, 0, 1, 2]
+        assert merged[2] == {"pear": 4, "plum": 1}
+        assert merged[5] == {"plum": 3, "fig": 1}
+
+    def test_subset(self, term_counts):
+        """场景7: 只保留部分文档，词表不变"""
+        subset = term_counts.subset(np.array([True, False, True]))
+        assert subset.doc_ids.tolist() == [0, 2]
+        assert subset.words == term_counts.words
+        assert subset[2] == {"pear": 4, "plum": 1}
+        assert subset.term_totals().tolist() == [2, 5, 1]
+
+
+class TestTermTotals:
+    def test_above(self):
+        totals = TermTotals(["a", "b", "c"], np.array([5, 10, 11]))
+        assert totals.above(10) == {"c"}
+        assert totals.above(0) == {"a", "b", "c"}
+
+    def test_mapping_view(self):
+        totals = TermTotals.from_mapping({"a": 1, "b": 0})
+        assert dict(totals) == {"a": 1, "b": 0}
+        assert totals == {"a": 1, "b": 0}
+        assert totals["a"] == 1
+        with pytest.raises(KeyError):
+            totals["c"]
+
+
+def test_posting_list_stats():
+    from term_counts import posting_list_stats
+
+    stats = posting_list_stats([1, 3, 3, 8, 100])
+    assert stats["keywords"] == 5
+    assert stats["postings"] == 115
+    assert stats["max"] == 100
+    assert stats["histogram"] == {"[1, 2)": 1, "[2, 4)": 2, "[8, 16)": 1, "[64, 128)": 1}
+    assert posting_list_stats([])["keywords"] == 0
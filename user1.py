@@ -1,12 +1,14 @@
 import argparse
 import base64
+import json
 import pickle
 from colored import Fore, Style
 import requests
 import re
 
 DEFAULT_SEARCH_URL = "http://127.0.0.1:8001/search"
-DEFAULT_GET_FILE_URL = "http://127.0.0.1:8001/get_file"
+DEFAULT_SEARCH_STREAM_URL = "http://127.0.0.1:8001/search_stream"
+DEFAULT_GET_FILE_URL = "http://127.0.0.1:8001/get_file_stream"
 if __name__ == "__main__":
     with open("index_key_shares_user_1.bin", "rb") as f:
         key_shares: dict[tuple[int, int], bytes] = pickle.load(f)
@@ -16,7 +18,39 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Data User CLI")
     parser.add_argument(
-        "--keyword", type=str, required=True, help="Search keyword to look up"
+        "--keyword",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Search keyword(s) to look up",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["and", "or"],
+        default="and",
+        help="Match documents containing all (and) or any (or) of several keywords",
+    )
+
+    parser.add_argument(
+        "--scoring",
+        choices=["tf", "tfidf"],
+        default="tf",
+        help="How to combine the term frequencies of several keywords",
+    )
+    parser.add_argument(
+        "--top_k", type=int, default=None, help="Only return the k best documents"
+    )
+    parser.add_argument(
+        "--offset", type=int, default=0, help="Skip this many best documents first"
+    )
+
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print results page by page while later pages are still being decrypted",
+    )
+    parser.add_argument(
+        "--page_size", type=int, default=1024, help="Postings per page with --stream"
     )
 
     parser.add_argument("--is_benching", default=False, help="is benching")
@@ -27,22 +61,57 @@ if __name__ == "__main__":
         "pseudo_shares_base64": index_key_shares_base64,
         "secret_num": 0,
         "group_num": 0,
-        "query_keyword": args.keyword,
+        "query_keyword": args.keyword[0],
+        "query_keywords": args.keyword if len(args.keyword) > 1 else [],
+        "mode": args.mode,
+        "scoring": args.scoring,
+        "top_k": args.top_k,
+        "offset": args.offset,
     }
-    #  发送HTTP请求
-    response = requests.post(DEFAULT_SEARCH_URL, json=payload)
+    if args.stream:
+        if len(args.keyword) > 1:
+            parser.error("--stream supports a single keyword")
+        # 流式结果按存储顺序逐页返回，只有每页内按词频排序，无法确定前k个
+        if args.top_k is not None or args.offset:
+            parser.error("--stream cannot be combined with --top_k or --offset")
+        # 每行是解密后的一页结果，边接收边显示
+        response = requests.post(
+            DEFAULT_SEARCH_STREAM_URL,
+            json={**payload, "page_size": args.page_size},
+            stream=True,
+        )
+        response.raise_for_status()
+        sorted_results = (
+            result
+            for line in response.iter_lines()
+            if line
+            for result in json.loads(line)
+        )
+    else:
+        #  发送HTTP请求
+        response = requests.post(DEFAULT_SEARCH_URL, json=payload)
 
-    sorted_results = response.json()["sorted_results"]
+        sorted_results = response.json()["sorted_results"]
 
     if args.is_benching is True:
         exit(0)
 
-    for tf_str, doc_id_str in sorted_results:
-        tf = int(tf_str)
+    for score_str, doc_id_str in sorted_results:
         doc_id = int(doc_id_str)
-        print(
-            f"Keyword appears {Fore.red}{tf}{Style.reset} times in document {Fore.green}{doc_id}{Style.reset}"
-        )
+        if args.scoring == "tfidf" and len(args.keyword) > 1:
+            # tf-idf得分是浮点数
+            score = float(score_str)
+            print(
+                f"Keywords score {Fore.red}{score:.4f}{Style.reset} (tf-idf) "
+                f"in document {Fore.green}{doc_id}{Style.reset}"
+            )
+        else:
+            tf = int(score_str)
+            subject = "Keyword appears" if len(args.keyword) == 1 else "Keywords appear"
+            print(
+                f"{subject} {Fore.red}{tf}{Style.reset} times "
+                f"in document {Fore.green}{doc_id}{Style.reset}"
+            )
         # 获取文件
         get_file_payload = {
             "file_id": doc_id,
@@ -51,11 +120,13 @@ if __name__ == "__main__":
             "group_num": 0,
         }
         get_file_response = requests.post(DEFAULT_GET_FILE_URL, json=get_file_payload)
-        file_content: str = get_file_response.json()["file_data"]
+        get_file_response.raise_for_status()
+        # 服务端逐段解密后以UTF-8文本流返回
+        file_content: str = get_file_response.content.decode("utf-8")
         # 高亮显示
         hightlighted_content = re.sub(
-            f"\\b{args.keyword}\\b",
-            f"{Fore.red}{args.keyword}{Style.reset}",
+            "|".join(f"\\b{re.escape(keyword)}\\b" for keyword in args.keyword),
+            lambda match: f"{Fore.red}{match.group(0)}{Style.reset}",
             file_content,
             flags=re.IGNORECASE,
         )